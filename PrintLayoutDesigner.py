@@ -1,18 +1,84 @@
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend for cleaner PNG output
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.image as mpimg
+import argparse
+import bisect
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import csv
+import functools
+import gc
 import glob
+import hashlib
+import html as html_lib
+import importlib
+import io
+import itertools
 import json
-import markdown
 import os
 from pathlib import Path
+import re
 import shutil
+import struct
 import subprocess
 import sys
-import textwrap
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
 import webbrowser
+import zipfile
+import zlib
+
+# --- LAZY BACKEND IMPORTS ---
+# The discovery/spec/template API (list_layouts, get_layout_spec, get_html_template, ...)
+# only needs the standard library. Rendering backends (matplotlib, numpy, Pillow,
+# fontTools, markdown) are imported on first attribute access, so API-only callers
+# never pay their import time or memory.
+
+class _LazyModule:
+    """Module proxy that imports `name` on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+mfigure = _LazyModule('matplotlib.figure')
+backend_agg = _LazyModule('matplotlib.backends.backend_agg')
+patches = _LazyModule('matplotlib.patches')
+mcollections = _LazyModule('matplotlib.collections')
+mpimg = _LazyModule('matplotlib.image')
+mtransforms = _LazyModule('matplotlib.transforms')
+font_manager = _LazyModule('matplotlib.font_manager')
+ttLib = _LazyModule('fontTools.ttLib')
+np = _LazyModule('numpy')
+Image = _LazyModule('PIL.Image')
+ImageOps = _LazyModule('PIL.ImageOps')
+ImageDraw = _LazyModule('PIL.ImageDraw')
+ImageFont = _LazyModule('PIL.ImageFont')
+markdown = _LazyModule('markdown')
+
+
+def backends_loaded():
+    """Return names of rendering backends that have been imported so far."""
+    return sorted(name for name in ('matplotlib', 'numpy', 'PIL', 'fontTools', 'markdown')
+                  if name in sys.modules)
+
 
 # --- CONFIGURATION ---
 VERSION = "4.1.0"
@@ -28,29 +94,574 @@ PAPER_W = 8.5
 PAPER_H = 11
 
 DPI = 150  # High resolution for crisp text
+PREVIEW_DPI = 50  # Quick-review resolution (~9x fewer pixels than DPI)
+THUMBNAIL_WIDTH = 1600  # Pixel width of blueprint thumbnails used by all.html
+PRINT_DPI = 300  # Press resolution of mode "print" rasters
+ALL_HTML_PAGE_SIZE = 50  # Entries per all.html chunk; larger batches get an index page
+WEB_IMAGE_DPI = 192  # HTML image copies: 2x CSS pixels (96/in), sharp on high-DPI screens
 BLUE = '#4A90D9'
 CANVAS_COLOR = '#F2F2F2'
 BORDER_MARGIN = 0.25  # Canvas border margin
 TITLE_BLOCK_H = 2.5  # Title block height
 
-# --- THEME AND LAYOUT LOADING ---
+# --- METRICS ---
 
-def load_theme(theme_path):
-    """Load a theme from the given path."""
+# Upper bounds (seconds) of latency histogram buckets, Prometheus style; +Inf is implied
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_DESCRIPTIONS = {
+    'layout_load': 'Layout file read, validation and parse',
+    'theme_load': 'Theme file read, validation and parse',
+    'template': 'HTML template generation (get_html_template)',
+    'markdown': 'Markdown to HTML rendering',
+    'image_decode': 'Source image decode (and downscale) for blueprints, press pages, web images and contact sheets',
+    'blueprint_draw': 'Blueprint drawing and rasterisation, excluding PNG encode',
+    'blueprint_encode': 'Blueprint PNG encode and write',
+    'html_write': 'Entry or order HTML generation and write',
+    'blueprint_bytes': 'Bytes of blueprint PNG written',
+    'entries_ok': 'Batch entries rendered',
+    'entries_skipped': 'Batch entries skipped by resume',
+    'entries_failed': 'Batch entries that failed',
+}
+
+
+class _Timing:
+    """Context manager that observes the time spent in its block."""
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms.
+
+    Each thread updates its own shard, so recording never takes a lock (the lock is
+    only taken the first time a thread records and when reading). snapshot() sums the
+    shards; shards of finished threads are folded into one so thread churn doesn't
+    grow the registry. Process pool workers keep their own registries.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, shard) pairs
+        self._retired = self._new_shard()
+
+    @staticmethod
+    def _new_shard():
+        return {'counters': collections.Counter(), 'histograms': {}}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def inc(self, name, value=1):
+        """Add value to counter `name`."""
+        self._shard()['counters'][name] += value
+
+    def observe(self, name, seconds):
+        """Record one duration in histogram `name`."""
+        histograms = self._shard()['histograms']
+        counts = histograms.get(name)
+        if counts is None:
+            counts = histograms[name] = [0] * (len(self.buckets) + 2)  # Bucket counts, +Inf, sum
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    def timer(self, name):
+        """Context manager timing its block into histogram `name`."""
+        return _Timing(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function into histogram `name`."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def _merge(target, shard):
+        """Add a shard's counters and histograms into target (copies first: the owner may be writing)."""
+        target['counters'].update(dict(shard['counters']))
+        for name, counts in list(shard['histograms'].items()):
+            total = target['histograms'].setdefault(name, [0] * len(counts))
+            for i, value in enumerate(list(counts)):
+                total[i] += value
+
+    def snapshot(self):
+        """Return {'counters': {name: n}, 'histograms': {name: {'count', 'sum', 'buckets'}}}.
+
+        'buckets' maps each upper bound (as a string, '+Inf' last) to the cumulative count.
+        """
+        total = self._new_shard()
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)  # Finished threads can't record any more
+            self._shards = live
+            self._merge(total, self._retired)
+        for _, shard in live:
+            self._merge(total, shard)
+
+        labels = [f"{bound:g}" for bound in self.buckets] + ['+Inf']
+        return {
+            'counters': dict(sorted(total['counters'].items())),
+            'histograms': {name: {
+                'count': sum(counts[:-1]),
+                'sum': counts[-1],
+                'buckets': dict(zip(labels, itertools.accumulate(counts[:-1]))),
+            } for name, counts in sorted(total['histograms'].items())},
+        }
+
+    def reset(self):
+        """Zero every counter and histogram."""
+        with self._lock:
+            for _, shard in self._shards:
+                shard['counters'].clear()
+                shard['histograms'].clear()
+            self._retired = self._new_shard()
+
+
+METRICS = MetricsRegistry()
+
+
+def _metric_caches():
+    """Name -> lru_cache-wrapped function (or ValidationCache) whose hit/miss statistics get_metrics() reports."""
+    return {
+        'validation': VALIDATION_CACHE,
+        'text_files': _read_text_file,
+        'font_paths': resolve_font_path,
+        'font_metrics': get_font_metrics,
+        'word_widths': _word_width_em,
+        'column_balance': _balance_columns,
+        'compiled_templates': _compiled_template,
+        'markdown': render_markdown_cached,
+    }
+
+
+def get_metrics():
+    """Return this process's render metrics.
+
+    Returns:
+        Dict with:
+        - 'counters': {name: total} (see METRIC_DESCRIPTIONS)
+        - 'histograms': {name: {'count', 'sum' (seconds), 'buckets'}}, where buckets
+          maps each upper bound in seconds to the cumulative count, ending with '+Inf'
+        - 'caches': {name: {'hits', 'misses', 'hit_ratio', 'size', 'maxsize'}} for the
+          in-memory caches (since their last clear) and the on-disk web image cache
+    """
+    metrics = METRICS.snapshot()
+    caches = {}
+    for name, func in _metric_caches().items():
+        info = func.cache_info()
+        caches[name] = {'hits': info.hits, 'misses': info.misses,
+                        'size': info.currsize, 'maxsize': info.maxsize}
+    counters = metrics['counters']
+    for name in ('web_images', 'source_hashes'):
+        caches[name] = {'hits': counters.pop(f'{name}_cache_hits', 0),
+                        'misses': counters.pop(f'{name}_cache_misses', 0),
+                        'size': None, 'maxsize': None}
+    for cache in caches.values():
+        lookups = cache['hits'] + cache['misses']
+        cache['hit_ratio'] = round(cache['hits'] / lookups, 4) if lookups else None
+    metrics['caches'] = caches
+    return metrics
+
+
+def reset_metrics():
+    """Zero all counters and histograms (cache statistics reset when a cache is cleared)."""
+    METRICS.reset()
+
+
+def format_prometheus(metrics=None, prefix='pld'):
+    """Render metrics (default: get_metrics()) in the Prometheus text exposition format."""
+    metrics = metrics or get_metrics()
+    lines = []
+
+    def header(name, kind, key=None):
+        if key in METRIC_DESCRIPTIONS:
+            lines.append(f"# HELP {name} {METRIC_DESCRIPTIONS[key]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for key, value in metrics['counters'].items():
+        name = f"{prefix}_{key}_total"
+        header(name, 'counter', key)
+        lines.append(f"{name} {value}")
+    for key, hist in metrics['histograms'].items():
+        name = f"{prefix}_{key}_seconds"
+        header(name, 'histogram', key)
+        lines += [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in hist['buckets'].items()]
+        lines.append(f"{name}_sum {hist['sum']:.6f}")
+        lines.append(f"{name}_count {hist['count']}")
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('size', 'gauge')):
+        name = f"{prefix}_cache_{field}" + ('_total' if kind == 'counter' else '')
+        header(name, kind)
+        lines += [f'{name}{{cache="{cache}"}} {stats[field]}'
+                  for cache, stats in metrics['caches'].items() if stats[field] is not None]
+    return '\n'.join(lines) + '\n'
+
+
+# --- SCHEMA VALIDATION ---
+# Schemas for layout, theme and batch files (as documented in docs/jsondocs.md). Each is
+# compiled once into a tree of closures; validate_file() caches results by file content
+# hash, so checking on every load costs a hash lookup after the first time. Unknown keys
+# are allowed; missing, mistyped and out-of-range values are reported, all at once.
+
+COLOR_ROLES = ('background', 'base', 'secondary', 'accent', 'text')
+
+_NUMBER = {'type': 'number'}
+_POSITIVE = {'type': 'number', 'exclusive_min': 0}
+_WIDTH = {'type': 'number', 'min': 0, 'nullable': True}  # Border widths; null = no border
+_STRING = {'type': 'string'}
+_PATH = {'type': 'string', 'nullable': True}
+_BOOL = {'type': 'boolean'}
+_DPI = {'type': 'integer', 'exclusive_min': 0, 'nullable': True}  # null = the mode's default
+_POSITIVE_INT_OR_NULL = {'type': 'integer', 'exclusive_min': 0, 'nullable': True}
+_DIMS = {'type': 'object', 'fields': {'width': (_POSITIVE, True), 'height': (_POSITIVE, True)}}
+_POS = {'type': 'object', 'fields': {'left': (_NUMBER, True), 'top': (_NUMBER, True)}}
+_TEXT_STYLE = {'type': 'object', 'fields': {
+    'align_h': ({'type': 'string', 'enum': ('left', 'center', 'right', 'justify')}, False),
+    'align_v': ({'type': 'string', 'enum': ('top', 'middle', 'bottom')}, False),
+    'font': (_STRING, False),
+    'size': (_POSITIVE, False),
+}}
+
+LAYOUT_SCHEMA = {'type': 'object', 'fields': {
+    'name': (_STRING, True),
+    'title': (_STRING, True),
+    'paper_size': (_DIMS, True),
+    'front': ({'type': 'object', 'fields': {
+        'img_dims': (_DIMS, True),
+        'img_pos': (_POS, True),
+        'caption_dims': (_DIMS, True),
+        'caption_pos': (_POS, True),
+        'special': ({'type': 'string', 'enum': ('double_col',), 'nullable': True}, False),
+        'gutter': (_WIDTH, False),
+        'border_widths': ({'type': 'object', 'fields': {
+            'paper': (_WIDTH, False), 'img': (_WIDTH, False), 'caption': (_WIDTH, False)}}, True),
+        'text_style': (_TEXT_STYLE, False),
+    }}, True),
+    'back': ({'type': 'object', 'fields': {
+        'note_dims': (_DIMS, True),
+        'note_pos': ({'type': 'string', 'enum': ('centered',)}, True),
+        'border_widths': ({'type': 'object', 'fields': {'paper': (_WIDTH, False), 'note': (_WIDTH, False)}}, True),
+        'text_style': (_TEXT_STYLE, False),
+    }}, True),
+    'notes': (_STRING, True),
+}}
+
+_HEX_COLOR = {'type': 'string', 'pattern': r'#(?:[0-9A-Fa-f]{3}|[0-9A-Fa-f]{6}|[0-9A-Fa-f]{8})'}
+_COLOR_ROLE = {'type': 'string', 'enum': COLOR_ROLES}
+THEME_SCHEMA = {'type': 'object', 'fields': {
+    'name': (_STRING, True),
+    'source': (_STRING, False),
+    'mode': ({'type': 'string', 'enum': ('light', 'dark')}, True),
+    'colors': ({'type': 'object', 'fields': {role: (_HEX_COLOR, True) for role in COLOR_ROLES}}, True),
+    'styles': ({'type': 'object', 'fields': {key: (_COLOR_ROLE, True) for key in (
+        'paper_background', 'paper_border', 'img_background', 'img_border', 'caption_background',
+        'caption_border', 'note_background', 'note_border', 'font_color')}}, True),
+}}
+
+_BATCH_SETTINGS = {
+    'mode': ({'type': 'string', 'enum': ('design', 'print')}, False),
+    'show_blueprints': (_BOOL, False),
+    'image_path_landscape': (_PATH, False),
+    'image_path_portrait': (_PATH, False),
+    'text_path': (_PATH, False),
+    'personal_note_path': (_PATH, False),
+    'pdf_output': (_BOOL, False),
+    'pdf_blueprints': (_BOOL, False),
+    'pdf_dpi': (_DPI, False),
+    'preview': (_BOOL, False),
+    'blueprint_dpi': (_DPI, False),
+    'thumbnails': (_BOOL, False),
+    'thumbnail_width': ({'type': 'integer', 'exclusive_min': 0}, False),
+    'png_mode': ({'type': 'string', 'enum': ('palette', 'rgb', 'rgba')}, False),
+    'png_compress_level': ({'type': 'integer', 'min': 0, 'max': 9}, False),
+    'render_memory_mb': (_POSITIVE_INT_OR_NULL, False),
+    'all_html_page_size': ({'type': 'integer', 'exclusive_min': 0}, False),
+    'shard': ({'type': 'string', 'pattern': r'\s*\d+\s*/\s*\d+\s*', 'nullable': True}, False),
+    'resume': (_BOOL, False),
+    'memory_report': (_BOOL, False),
+    'memory_limit_mb': (_POSITIVE_INT_OR_NULL, False),
+    'web_images': (_BOOL, False),
+    'web_image_format': ({'type': 'string', 'enum': ('jpeg', 'webp')}, False),
+    'web_image_dpi': ({'type': 'integer', 'exclusive_min': 0}, False),
+    'print_dpi': ({'type': 'integer', 'exclusive_min': 0}, False),
+    'print_format': ({'type': 'string', 'enum': ('tiff', 'png')}, False),
+    'workers': (_POSITIVE_INT_OR_NULL, False),
+    'archive': ({'type': 'string', 'enum': ('zip', 'tar'), 'nullable': True}, False),
+}
+BATCH_ENTRY_SCHEMA = {'type': 'object', 'fields': {
+    'layout': (_STRING, True),
+    'front_theme': (_STRING, True),
+    'back_theme': (_STRING, True),
+    'description': (_STRING, False),
+    'name': (_STRING, False),
+    # Per-entry assets override the batch-wide paths
+    'image_path_landscape': (_PATH, False),
+    'image_path_portrait': (_PATH, False),
+    'text_path': (_PATH, False),
+    'personal_note_path': (_PATH, False),
+}}
+BATCH_SETTINGS_SCHEMA = {'type': 'object', 'fields': _BATCH_SETTINGS}  # First line of a .jsonl batch
+BATCH_SCHEMA = {'type': 'object', 'fields': {
+    **_BATCH_SETTINGS,
+    'batch': ({'type': 'array', 'items': BATCH_ENTRY_SCHEMA}, True),
+}}
+
+SCHEMAS = {'layout': LAYOUT_SCHEMA, 'theme': THEME_SCHEMA, 'batch': BATCH_SCHEMA,
+           'batch_settings': BATCH_SETTINGS_SCHEMA, 'batch_entry': BATCH_ENTRY_SCHEMA}
+
+_JSON_TYPES = {'number': (int, float), 'integer': (int,), 'string': (str,), 'boolean': (bool,)}
+
+
+class ValidationError(ValueError):
+    """One or more JSON files don't match their schema. `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__(f"{len(self.errors)} validation error(s):\n  " + '\n  '.join(self.errors))
+
+
+def _json_type_name(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    return {dict: 'object', list: 'array', str: 'string', int: 'integer', float: 'number'}.get(type(value), type(value).__name__)
+
+
+def compile_schema(schema):
+    """Compile a schema dict into check(value, path, errors), which appends 'path: problem' strings."""
+    kind = schema['type']
+    nullable = schema.get('nullable', False)
+
+    if kind == 'object':
+        fields = [(name, required, compile_schema(sub)) for name, (sub, required) in schema['fields'].items()]
+
+        def check(value, path, errors):
+            if value is None and nullable:
+                return
+            if not isinstance(value, dict):
+                errors.append(f"{path or '<root>'}: expected object, got {_json_type_name(value)}")
+                return
+            for name, required, check_field in fields:
+                field_path = f"{path}.{name}" if path else name
+                if name in value:
+                    check_field(value[name], field_path, errors)
+                elif required:
+                    errors.append(f"{field_path}: required field is missing")
+        return check
+
+    if kind == 'array':
+        check_item = compile_schema(schema['items'])
+
+        def check(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected array, got {_json_type_name(value)}")
+                return
+            for i, item in enumerate(value):
+                check_item(item, f"{path}[{i}]", errors)
+        return check
+
+    types = _JSON_TYPES[kind]
+    enum = schema.get('enum')
+    pattern = re.compile(schema['pattern']) if 'pattern' in schema else None
+    minimum, maximum, exclusive_min = schema.get('min'), schema.get('max'), schema.get('exclusive_min')
+
+    def check(value, path, errors):
+        if value is None and nullable:
+            return
+        if not isinstance(value, types) or (isinstance(value, bool) and kind != 'boolean'):
+            errors.append(f"{path}: expected {kind}{' or null' if nullable else ''}, got {_json_type_name(value)}")
+        elif enum is not None and value not in enum:
+            errors.append(f"{path}: {value!r} is not one of {', '.join(map(repr, enum))}")
+        elif pattern is not None and not pattern.fullmatch(value):
+            errors.append(f"{path}: {value!r} does not match {pattern.pattern}")
+        elif minimum is not None and value < minimum:
+            errors.append(f"{path}: {value} is below the minimum {minimum}")
+        elif maximum is not None and value > maximum:
+            errors.append(f"{path}: {value} is above the maximum {maximum}")
+        elif exclusive_min is not None and value <= exclusive_min:
+            errors.append(f"{path}: {value} must be greater than {exclusive_min}")
+    return check
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(kind):
+    """Compiled validator for a SCHEMAS kind, e.g. 'layout' (compiled on first use)."""
+    return compile_schema(SCHEMAS[kind])
+
+
+def validate_data(kind, data):
+    """Return list of schema problems in already-parsed data (empty if valid)."""
+    errors = []
+    get_validator(kind)(data, '', errors)
+    return errors
+
+
+VALIDATION_CACHE_SIZE = 4096  # Files whose validation results are kept, by (kind, content hash)
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ValidationCache:
+    """Bounded map of (kind, content hash) -> problems; the least recently used goes first.
+
+    Holds only hashes and problems, not whole files. Has cache_info() and cache_clear()
+    like an lru_cache, so get_metrics() reports it alongside them.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._results = {}
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+    def problems(self, kind, content):
+        """Problems in one file's content, validated only if this content wasn't seen recently."""
+        key = (kind, hashlib.sha1(content).hexdigest())
+        with self._lock:
+            if key in self._results:
+                self._hits += 1
+                self._results[key] = problems = self._results.pop(key)  # Now most recent
+                return problems
+            self._misses += 1
+        problems = _validate_content(kind, content)
+        with self._lock:
+            self._results[key] = problems
+            while len(self._results) > self.maxsize:
+                del self._results[next(iter(self._results))]
+        return problems
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.maxsize, len(self._results))
+
+    def cache_clear(self):
+        with self._lock:
+            self._results.clear()
+            self._hits = self._misses = 0
+
+
+def _validate_content(kind, content):
+    """Problems in one file's content (bytes), as a tuple."""
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        return (f"invalid JSON: {e}",)
+    return tuple(validate_data(kind, data))
+
+
+VALIDATION_CACHE = ValidationCache(VALIDATION_CACHE_SIZE)
+
+
+def validate_file(kind, path):
+    """Return list of 'path: problem' strings for a layout/theme/batch file (empty if valid).
+
+    Results are cached by a hash of the file's bytes, so re-validating an unchanged file
+    is a read plus a hash.
+    """
     try:
-        with open(theme_path, 'r') as f:
-            return json.load(f)
+        with open(path, 'rb') as f:
+            content = f.read()
     except FileNotFoundError:
+        return [f"{path}: file not found"]
+    return _content_problems(kind, path, content)
+
+
+def _content_problems(kind, path, content):
+    return [f"{path}: {problem}" for problem in VALIDATION_CACHE.problems(kind, content)]
+
+
+def _load_validated(kind, path):
+    """Read, validate and parse a JSON file; raises ValidationError listing every problem."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    errors = _content_problems(kind, path, content)
+    if errors:
+        raise ValidationError(errors)
+    return json.loads(content)
+
+
+def validate_catalog(batch_path):
+    """Validate a batch file plus every layout and theme it references, aggregating all errors.
+
+    Returns list of problems (empty if the whole catalog is valid). Each distinct file is
+    checked once, however many entries use it. A .jsonl batch is read a line at a time.
+    """
+    batch_dir = os.path.dirname(batch_path) or '.'
+    files = {}
+
+    def reference(entry):
+        files[os.path.join(batch_dir, 'layouts', entry['layout'])] = 'layout'
+        for key in ('front_theme', 'back_theme'):
+            files[os.path.join(batch_dir, 'themes', entry[key])] = 'theme'
+
+    if is_streaming_batch(batch_path):
+        errors = []
+        try:
+            for line_number, data, is_settings in iter_jsonl_batch(batch_path):
+                problems = validate_data('batch_settings' if is_settings else 'batch_entry', data)
+                errors.extend(f"{batch_path}:{line_number}: {problem}" for problem in problems)
+                if not is_settings and not problems:
+                    reference(data)
+        except ValidationError as e:
+            return errors + e.errors
+    else:
+        errors = validate_file('batch', batch_path)
+        if errors:
+            return errors  # Entries can't be trusted enough to resolve their files
+        with open(batch_path, 'r') as f:
+            for entry in json.load(f).get('batch', []):
+                reference(entry)
+
+    for path, kind in files.items():
+        errors.extend(validate_file(kind, path))
+    return errors
+
+
+# --- THEME AND LAYOUT LOADING ---
+
+def load_theme(theme_path):
+    """Load a theme from the given path (validated against THEME_SCHEMA)."""
+    if not os.path.exists(theme_path):
         raise FileNotFoundError(f"Theme not found: {theme_path}")
+    with METRICS.timer('theme_load'):
+        return _load_validated('theme', theme_path)
 
 
 def load_layout(layout_path):
-    """Load a layout from the given path."""
-    try:
-        with open(layout_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
+    """Load a layout from the given path (validated against LAYOUT_SCHEMA)."""
+    if not os.path.exists(layout_path):
         raise FileNotFoundError(f"Layout not found: {layout_path}")
+    with METRICS.timer('layout_load'):
+        return _load_validated('layout', layout_path)
 
 
 # --- API: DISCOVERY FUNCTIONS ---
@@ -114,7 +725,68 @@ def get_layout_spec(layout_name, front_theme_name, back_theme_name, base_dir):
     layout = load_layout(base / 'layouts' / f'{layout_name}.json')
     front_theme = load_theme(base / 'themes' / f'{front_theme_name}.json')
     back_theme = load_theme(base / 'themes' / f'{back_theme_name}.json')
+    return build_layout_spec(layout_geometry(layout), theme_spec_colors(front_theme)['front'],
+                             theme_spec_colors(back_theme)['back'])
+
+
+def get_layout_specs(base_dir, layout_names='all', front_theme_names='all', back_theme_names='all'):
+    """Return specs for every layout x front theme x back theme combination.
+
+    Same as calling get_layout_spec() for each combination, but every file is loaded
+    once and geometry/colours are computed once per layout/theme (see iter_layout_specs()).
+
+    Args:
+        base_dir: Path to directory containing 'layouts' and 'themes' subdirectories
+        layout_names, front_theme_names, back_theme_names: Lists of names (without
+            .json extension), or 'all' for every file in the directory
+
+    Returns:
+        Dict mapping (layout_name, front_theme_name, back_theme_name) to its spec
+    """
+    return dict(iter_layout_specs(base_dir, layout_names, front_theme_names, back_theme_names))
+
+
+def iter_layout_specs(base_dir, layout_names='all', front_theme_names='all', back_theme_names='all'):
+    """Yield ((layout_name, front_theme_name, back_theme_name), spec) for every combination.
+
+    Arguments are as for get_layout_specs(). All files are loaded (and a missing or
+    invalid one raises) before the first spec is yielded; specs are then built one at a
+    time, in layout, front theme, back theme order, each with its own dicts.
+    """
+    base = Path(base_dir)
+
+    def names(selected, subdir):
+        if selected == 'all':
+            return sorted(f.stem for f in (base / subdir).glob('*.json'))
+        return list(selected)
 
+    layout_names = names(layout_names, 'layouts')
+    front_theme_names = names(front_theme_names, 'themes')
+    back_theme_names = names(back_theme_names, 'themes')
+    geometries = {name: layout_geometry(load_layout(base / 'layouts' / f'{name}.json')) for name in layout_names}
+    colors = {name: theme_spec_colors(load_theme(base / 'themes' / f'{name}.json'))
+              for name in dict.fromkeys(front_theme_names + back_theme_names)}
+
+    for layout_name in layout_names:
+        geometry = geometries[layout_name]
+        for front_name in front_theme_names:
+            front_colors = colors[front_name]['front']
+            for back_name in back_theme_names:
+                yield ((layout_name, front_name, back_name),
+                       build_layout_spec(geometry, front_colors, colors[back_name]['back']))
+
+
+DEFAULT_GUTTER = 0.25  # Inches between a double_col caption's columns
+
+
+def layout_gutter(front):
+    """Column gap of a layout's double_col caption in inches; DEFAULT_GUTTER if unset or null."""
+    gutter = front.get('gutter')
+    return DEFAULT_GUTTER if gutter is None else gutter
+
+
+def layout_geometry(layout):
+    """Theme-independent part of a layout spec: paper, boxes, border widths and text styles."""
     front = layout.get('front', {})
     back = layout.get('back', {})
     front_borders = front.get('border_widths', {})
@@ -122,10 +794,6 @@ def get_layout_spec(layout_name, front_theme_name, back_theme_name, base_dir):
     front_text = front.get('text_style', {})
     back_text = back.get('text_style', {})
 
-    def get_color(theme, style_key):
-        color_role = theme['styles'].get(style_key)
-        return theme['colors'].get(color_role) if color_role else None
-
     return {
         'paper': layout.get('paper_size', {'width': 8.5, 'height': 11}),
         'front': {
@@ -141,16 +809,7 @@ def get_layout_spec(layout_name, front_theme_name, back_theme_name, base_dir):
             },
             'paper_border_width': front_borders.get('paper', 0),
             'special': front.get('special'),
-            'gutter': front.get('gutter'),
-            'colors': {
-                'paper_bg': get_color(front_theme, 'paper_background'),
-                'paper_border': get_color(front_theme, 'paper_border'),
-                'image_bg': get_color(front_theme, 'img_background'),
-                'image_border': get_color(front_theme, 'img_border'),
-                'caption_bg': get_color(front_theme, 'caption_background'),
-                'caption_border': get_color(front_theme, 'caption_border'),
-                'font': get_color(front_theme, 'font_color'),
-            },
+            'gutter': layout_gutter(front),
             'text': {
                 'align_h': front_text.get('align_h', 'left'),
                 'align_v': front_text.get('align_v', 'top'),
@@ -165,13 +824,6 @@ def get_layout_spec(layout_name, front_theme_name, back_theme_name, base_dir):
                 'border_width': back_borders.get('note', 0),
             },
             'paper_border_width': back_borders.get('paper', 0),
-            'colors': {
-                'paper_bg': get_color(back_theme, 'paper_background'),
-                'paper_border': get_color(back_theme, 'paper_border'),
-                'note_bg': get_color(back_theme, 'note_background'),
-                'note_border': get_color(back_theme, 'note_border'),
-                'font': get_color(back_theme, 'font_color'),
-            },
             'text': {
                 'align_h': back_text.get('align_h', 'left'),
                 'align_v': back_text.get('align_v', 'top'),
@@ -182,8 +834,63 @@ def get_layout_spec(layout_name, front_theme_name, back_theme_name, base_dir):
     }
 
 
+def theme_spec_colors(theme):
+    """Resolved colours a theme gives each side of a layout spec: {'front': {...}, 'back': {...}}."""
+    def get_color(style_key):
+        color_role = theme['styles'].get(style_key)
+        return theme['colors'].get(color_role) if color_role else None
+
+    return {
+        'front': {
+            'paper_bg': get_color('paper_background'),
+            'paper_border': get_color('paper_border'),
+            'image_bg': get_color('img_background'),
+            'image_border': get_color('img_border'),
+            'caption_bg': get_color('caption_background'),
+            'caption_border': get_color('caption_border'),
+            'font': get_color('font_color'),
+        },
+        'back': {
+            'paper_bg': get_color('paper_background'),
+            'paper_border': get_color('paper_border'),
+            'note_bg': get_color('note_background'),
+            'note_border': get_color('note_border'),
+            'font': get_color('font_color'),
+        },
+    }
+
+
+def build_layout_spec(geometry, front_colors, back_colors):
+    """Assemble a layout spec from layout_geometry() and theme_spec_colors() parts.
+
+    The parts are shared between specs, so everything is copied: callers may mutate
+    the result.
+    """
+    front = geometry['front']
+    back = geometry['back']
+    return {
+        'paper': dict(geometry['paper']),
+        'front': {
+            'image': dict(front['image']),
+            'caption': dict(front['caption']),
+            'paper_border_width': front['paper_border_width'],
+            'special': front['special'],
+            'gutter': front['gutter'],
+            'colors': dict(front_colors),
+            'text': dict(front['text']),
+        },
+        'back': {
+            'note': dict(back['note']),
+            'paper_border_width': back['paper_border_width'],
+            'colors': dict(back_colors),
+            'text': dict(back['text']),
+        },
+    }
+
+
 # --- API: HTML TEMPLATE ---
 
+@METRICS.timed('template')
 def get_html_template(layout_name, front_theme_name, back_theme_name, base_dir):
     """Return HTML template with placeholders for content injection.
 
@@ -264,13 +971,13 @@ def get_html_template(layout_name, front_theme_name, back_theme_name, base_dir):
 
     # Handle special double-column layout
     special_mode = front.get('special')
-    gutter = front.get('gutter', 0.25)
+    gutter = layout_gutter(front)
 
     if special_mode == 'double_col':
         caption_border = caption_style.get('border', {}) if caption_style else {}
         rule_color = caption_border.get('color', '#000000')
         caption_block_html = f'''
-            <div class="caption-box" style="{caption_css} overflow: hidden; padding: 0.1in; column-count: 2; column-gap: {gutter}in; column-fill: auto; column-rule: 1px solid {rule_color}; text-align: {front_css['text_align']}; font-family: {{{{FONT_FAMILY}}}}; font-size: {front_css['font_size']}pt; color: {font_color or '#000000'};">{{{{CAPTION}}}}</div>'''
+            <div class="caption-box" style="{caption_css} overflow: hidden; padding: 0.1in; column-count: 2; column-gap: {gutter}in; column-fill: balance; column-rule: 1px solid {rule_color}; text-align: {front_css['text_align']}; font-family: {{{{FONT_FAMILY}}}}; font-size: {front_css['font_size']}pt; color: {font_color or '#000000'};">{{{{CAPTION}}}}</div>'''
     else:
         caption_block_html = f'''
             <div class="caption-box" style="{caption_css} display: flex; flex-direction: column; justify-content: {front_css['align_items']}; overflow: hidden; padding: 0.1in;">
@@ -409,6 +1116,7 @@ def build_back_styles(layout, theme):
 
 # --- HTML GENERATION ---
 
+@METRICS.timed('markdown')
 def render_markdown_to_html(text):
     """Convert markdown text to HTML."""
     if not text:
@@ -467,10 +1175,15 @@ def generate_box_css(x, y, w, h, style, paper_h):
     return css
 
 
+@METRICS.timed('html_write')
 def generate_html_output(batch_entry, layout, front_theme, back_theme,
                          image_path, text_content, note_content,
-                         layout_name, output_dir, blueprint_png=None):
-    """Generate HTML file for print mode output."""
+                         layout_name, output_dir, blueprint_png=None, sink=None):
+    """Generate HTML file for print mode output.
+
+    With a sink (ArchiveWriter) the file becomes an archive member instead; the returned
+    path is where it would sit in output_dir either way.
+    """
 
     paper_w = layout['paper_size']['width']
     paper_h = layout['paper_size']['height']
@@ -538,13 +1251,13 @@ def generate_html_output(batch_entry, layout, front_theme, back_theme,
 
     # Handle special double-column layout
     special_mode = front.get('special')
-    gutter = front.get('gutter', 0.25)
+    gutter = layout_gutter(front)
 
     if special_mode == 'double_col':
         caption_border = caption_style.get('border', {}) if caption_style else {}
         rule_color = caption_border.get('color', '#000000')
         caption_block_html = f'''
-            <div class="caption-box" style="{caption_css} overflow: hidden; padding: 0.1in; column-count: 2; column-gap: {gutter}in; column-fill: auto; column-rule: 1px solid {rule_color}; text-align: {front_css['text_align']}; font-family: {front_css['font_family']}; font-size: {front_css['font_size']}pt; color: {font_color or '#000000'};">{caption_html}</div>'''
+            <div class="caption-box" style="{caption_css} overflow: hidden; padding: 0.1in; column-count: 2; column-gap: {gutter}in; column-fill: balance; column-rule: 1px solid {rule_color}; text-align: {front_css['text_align']}; font-family: {front_css['font_family']}; font-size: {front_css['font_size']}pt; color: {font_color or '#000000'};">{caption_html}</div>'''
     else:
         caption_block_html = f'''
             <div class="caption-box" style="{caption_css} display: flex; flex-direction: column; justify-content: {front_css['align_items']}; overflow: hidden; padding: 0.1in;">
@@ -658,36 +1371,166 @@ def generate_html_output(batch_entry, layout, front_theme, back_theme,
 '''
 
     # Write HTML file
-    os.makedirs(output_dir, exist_ok=True)
     output_filename = f"{layout_name}.html"
     output_path = os.path.join(output_dir, output_filename)
+    if sink is not None:
+        sink.write(output_filename, html.encode('utf-8'), keep=True)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(html)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html)
-
-    print(f"Generated: {output_path}")
+    print(f"Generated: {output_label(output_dir, output_filename, sink)}")
     return output_path
 
 
+BATCH_DEFAULTS = {
+    'mode': 'design',
+    'show_blueprints': True,
+    'image_path_landscape': None,
+    'image_path_portrait': None,
+    'text_path': None,
+    'personal_note_path': None,
+    'pdf_output': False,
+    'pdf_blueprints': False,
+    'pdf_dpi': None,
+    'preview': False,
+    'blueprint_dpi': None,
+    'thumbnails': True,
+    'thumbnail_width': THUMBNAIL_WIDTH,
+    'png_mode': 'rgb',
+    'png_compress_level': 6,
+    'render_memory_mb': None,
+    'all_html_page_size': ALL_HTML_PAGE_SIZE,
+    'shard': None,
+    'resume': False,
+    'memory_report': False,
+    'memory_limit_mb': None,
+    'web_images': True,
+    'web_image_format': 'jpeg',
+    'web_image_dpi': WEB_IMAGE_DPI,
+    'print_dpi': PRINT_DPI,
+    'print_format': 'tiff',
+    'workers': None,
+    'archive': None,
+}
+
+
+BATCH_ASSET_KEYS = ('image_path_landscape', 'image_path_portrait', 'text_path', 'personal_note_path')
+TEXT_CACHE_SIZE = 256  # Caption/note files kept in memory while unchanged on disk
+
+
+def is_streaming_batch(batch_path):
+    """True for a .jsonl batch (one entry per line, read incrementally)."""
+    return batch_path.lower().endswith('.jsonl')
+
+
+def iter_jsonl_batch(batch_path):
+    """Yield (line_number, object, is_settings) for each non-blank line of a .jsonl batch.
+
+    The first object is the batch settings when it has no 'layout' field. Raises
+    ValidationError on a line that isn't a JSON object, since later lines can't be trusted.
+    """
+    first = True
+    with open(batch_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValidationError([f"{batch_path}:{line_number}: invalid JSON: {e}"]) from None
+            if not isinstance(data, dict):
+                raise ValidationError([f"{batch_path}:{line_number}: expected object, got {_json_type_name(data)}"])
+            yield line_number, data, first and 'layout' not in data
+            first = False
+
+
+def iter_batch_entries(batch_path):
+    """Yield the entries of a batch file one at a time.
+
+    A .jsonl batch is read a line at a time, so memory doesn't grow with batch size;
+    a batch.json is loaded whole and validated first.
+    """
+    if not is_streaming_batch(batch_path):
+        yield from load_batch_config(batch_path)['batch']
+        return
+    for _, data, is_settings in iter_jsonl_batch(batch_path):
+        if not is_settings:
+            yield data
+
+
+def load_batch_config(batch_path):
+    """Load batch configuration from a JSON or JSONL file with defaults applied.
+
+    Returns dict with every key in BATCH_DEFAULTS plus 'batch': the list of entries, or
+    for a .jsonl batch a generator that reads them lazily (see iter_batch_entries).
+    Raises ValidationError if the settings don't match their schema.
+    """
+    if not os.path.exists(batch_path):
+        raise FileNotFoundError(f"Batch file not found: {batch_path}")
+    if is_streaming_batch(batch_path):
+        data = {}
+        for line_number, settings, is_settings in iter_jsonl_batch(batch_path):
+            if is_settings:
+                errors = [f"{batch_path}:{line_number}: {p}" for p in validate_data('batch_settings', settings)]
+                if errors:
+                    raise ValidationError(errors)
+                data = settings
+            break  # Only the first line can hold settings
+        data = dict(data, batch=iter_batch_entries(batch_path))
+    else:
+        data = _load_validated('batch', batch_path)
+
+    config = dict(BATCH_DEFAULTS)
+    config.update(data)
+    config['batch'] = data.get('batch', [])
+    return config
+
+
+def entry_assets(entry, config):
+    """Image, caption and note paths for an entry: its own, else the batch-wide ones."""
+    return {key: entry.get(key) or config[key] for key in BATCH_ASSET_KEYS}
+
+
+def entry_output_name(entry):
+    """Base filename of an entry's outputs: its 'name', else '{layout}_{front theme}'."""
+    if entry.get('name'):
+        return re.sub(r'[^\w .-]+', '_', entry['name'])
+    return '_'.join(os.path.splitext(os.path.basename(entry.get(key) or '?'))[0]
+                    for key in ('layout', 'front_theme'))
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _read_text_file(path, mtime_ns):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def read_text_file(path):
+    """Stripped contents of a caption/note file, or None if unset or missing.
+
+    Cached by path and modification time, so entries sharing a file read it once.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    return _read_text_file(path, os.stat(path).st_mtime_ns)
+
+
 def load_batch(batch_path):
     """Load batch configuration from JSON file.
 
     Returns (batch_entries, mode, image_path_landscape, image_path_portrait, text_path, personal_note_path, show_blueprints).
     """
-    try:
-        with open(batch_path, 'r') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Batch file not found: {batch_path}")
-
+    config = load_batch_config(batch_path)
     return (
-        data.get('batch', []),
-        data.get('mode', 'design'),
-        data.get('image_path_landscape'),
-        data.get('image_path_portrait'),
-        data.get('text_path'),
-        data.get('personal_note_path'),
-        data.get('show_blueprints', True)
+        config['batch'],
+        config['mode'],
+        config['image_path_landscape'],
+        config['image_path_portrait'],
+        config['text_path'],
+        config['personal_note_path'],
+        config['show_blueprints']
     )
 
 
@@ -734,14 +1577,27 @@ def draw_content_block(ax, x, y, w, h, style, content_renderer=None):
     if content_renderer:
         content_renderer()
 
-def setup_canvas(paper_w, paper_h, paper_style, mode):
+def new_figure(figsize, dpi=DPI):
+    """Create a figure with one axes on its own Agg canvas.
+
+    Uses Figure + FigureCanvasAgg directly instead of pyplot, so no global figure
+    manager is involved: figures are freed when dereferenced and separate figures
+    can be rendered concurrently from threads.
+    """
+    fig = mfigure.Figure(figsize=figsize, dpi=dpi)
+    backend_agg.FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    return fig, ax
+
+
+def setup_canvas(paper_w, paper_h, paper_style, mode, dpi=DPI):
     """Setup figure and axes for rendering.
 
     Returns (fig, ax, paper_x, paper_y, title_block_top) where title_block_top
     is None in print mode.
     """
     if mode == "print":
-        fig, ax = plt.subplots(figsize=(paper_w, paper_h), dpi=DPI)
+        fig, ax = new_figure((paper_w, paper_h), dpi=dpi)
         ax.set_xlim(0, paper_w)
         ax.set_ylim(0, paper_h)
         fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
@@ -751,7 +1607,7 @@ def setup_canvas(paper_w, paper_h, paper_style, mode):
         ax.set_facecolor(paper_bg)
         return fig, ax, paper_x, paper_y, None
     else:
-        fig, ax = plt.subplots(figsize=(CANVAS_W, CANVAS_H), dpi=DPI)
+        fig, ax = new_figure((CANVAS_W, CANVAS_H), dpi=dpi)
         ax.set_xlim(-1, CANVAS_W - 1)
         ax.set_ylim(-1, CANVAS_H - 1)
         fig.patch.set_facecolor(CANVAS_COLOR)
@@ -808,33 +1664,97 @@ def format_style_for_display(style, name):
         parts.append("border=null")
     return f"{name}: {', '.join(parts)}"
 
-def draw_dim_line(ax, x, y_start, y_end, label, dim_id=None):
-    """Draws a vertical dimension line with arrows and optional ID"""
-    ax.annotate(text='', xy=(x, y_start), xytext=(x, y_end),
-                arrowprops=dict(arrowstyle='<->', color=BLUE, lw=0.8))
-    mid_y = (y_start + y_end) / 2
-    if dim_id:
-        label_text = f"{dim_id}: {label}"
-    else:
-        label_text = label
-    ax.text(x - 0.1, mid_y, label_text, ha='right', va='center', fontsize=12, color=BLUE, rotation=90)
-
-def draw_horizontal_dim_line(ax, y, x_start, x_end, label, dim_id=None, offset=0):
-    """Draws a horizontal dimension line with arrows and optional ID"""
-    ax.annotate(text='', xy=(x_start, y), xytext=(x_end, y),
-                arrowprops=dict(arrowstyle='<->', color=BLUE, lw=0.8))
-    mid_x = (x_start + x_end) / 2
-    if dim_id:
-        label_text = f"{dim_id}: {label}"
-    else:
-        label_text = label
-    ax.text(mid_x, y + 0.1 + offset, label_text, ha='center', va='bottom', fontsize=12, color=BLUE)
+DIM_LINE_WIDTH = 0.8   # Points
+DIM_HEAD_LENGTH = 4.0  # Points; arrowstyle '<->' at the default 10pt mutation scale
+DIM_HEAD_WIDTH = 2.0   # Points, either side of the line
+DIM_SHRINK = 2.0       # Points the arrow stops short of each end (annotate's shrinkA/B)
+
+
+class DimensionLayer:
+    """Collects a blueprint's dimension lines and draws them as one LineCollection.
+
+    Matches the look of annotate(arrowstyle='<->'), but arrowheads are computed once
+    as plain segments instead of one FancyArrowPatch per dimension whose path is
+    rebuilt on every draw.
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self._lines = []   # (vertical, fixed coordinate, start, end)
+        self._labels = []  # (x, y, text, text kwargs)
+
+    def vertical(self, x, y_start, y_end, label, dim_id=None):
+        """Add a vertical dimension line with arrows and optional ID."""
+        self._lines.append((True, x, y_start, y_end))
+        label_text = f"{dim_id}: {label}" if dim_id else label
+        self._labels.append((x - 0.1, (y_start + y_end) / 2, label_text,
+                             {'ha': 'right', 'va': 'center', 'rotation': 90}))
+
+    def horizontal(self, y, x_start, x_end, label, dim_id=None, offset=0):
+        """Add a horizontal dimension line with arrows and optional ID."""
+        self._lines.append((False, y, x_start, x_end))
+        label_text = f"{dim_id}: {label}" if dim_id else label
+        self._labels.append(((x_start + x_end) / 2, y + 0.1 + offset, label_text, {'ha': 'center', 'va': 'bottom'}))
+
+    def draw(self):
+        """Add every collected line and label to the axes."""
+        ax = self.ax
+        pos = ax.get_position()
+        fig_w, fig_h = ax.figure.get_size_inches()
+        (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+        point_x = (x1 - x0) / (pos.width * fig_w * 72)  # Data units per point
+        point_y = (y1 - y0) / (pos.height * fig_h * 72)
+        # Tips sit inside the shrunk ends by half the mitered line width, as in FancyArrowPatch
+        sin_t = DIM_HEAD_WIDTH / np.hypot(DIM_HEAD_LENGTH, DIM_HEAD_WIDTH)
+        inset = DIM_SHRINK + 0.5 * DIM_LINE_WIDTH / sin_t
+
+        segments = []
+        for vertical, fixed, start, end in self._lines:
+            along, across = (point_y, point_x) if vertical else (point_x, point_y)
+            sign = 1 if end >= start else -1
+
+            def point(a, c):
+                return (c, a) if vertical else (a, c)
+
+            tip_start, tip_end = start + sign * inset * along, end - sign * inset * along
+            segments.append([point(tip_start, fixed), point(tip_end, fixed)])
+            for tip, inward in ((tip_start, sign), (tip_end, -sign)):
+                back = tip + inward * DIM_HEAD_LENGTH * along
+                segments.append([point(back, fixed - DIM_HEAD_WIDTH * across), point(tip, fixed),
+                                 point(back, fixed + DIM_HEAD_WIDTH * across)])
+        # Unsnapped, like the patches it replaces, so lines land on the same subpixels
+        ax.add_collection(mcollections.LineCollection(
+            segments, colors=BLUE, linewidths=DIM_LINE_WIDTH, capstyle='butt', joinstyle='miter',
+            snap=False, zorder=3), autolim=False)
+
+        for x, y, text, kwargs in self._labels:
+            ax.text(x, y, text, fontsize=12, color=BLUE, **kwargs)
+
+
+def draw_overflow_marker(ax, right_x, bottom_y, fit):
+    """Flag a text box whose content overflows, just below its bottom-right corner."""
+    if fit['overflow'] > 0:
+        ax.text(right_x, bottom_y - 0.05, f"OVERFLOW +{fit['overflow']:.2f}\"",
+                ha='right', va='top', fontsize=10, fontweight='bold', color='#D0021B', zorder=6)
 
 
 def draw_combined_blueprint(filename, layout, front_theme, back_theme,
                             image_path_landscape, image_path_portrait,
-                            text_path, personal_note_path, output_dir):
-    """Generate combined front+back blueprint as single PNG."""
+                            text_path, personal_note_path, output_dir, pdf_writer=None,
+                            dpi=DPI, thumbnail_width=None, png_mode='rgb', compress_level=6,
+                            memory_budget_mb=None, sink=None):
+    """Generate combined front+back blueprint as single PNG.
+
+    If pdf_writer is given, the blueprint is also appended to it as a page.
+    If thumbnail_width is given, a downscaled copy is written alongside it
+    (see thumbnail_filename()). png_mode and compress_level are passed to save_png().
+    If the canvas would need more than memory_budget_mb to render at once, it is
+    rendered in horizontal bands and streamed to an RGB PNG instead (see
+    render_tiled_png()). With a sink (ArchiveWriter) the PNGs are encoded straight
+    into the archive.
+    """
+
+    draw_start = time.perf_counter()
 
     # Extract layout info
     title = layout.get('title', 'Layout')
@@ -849,7 +1769,7 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
     back_paper_style, back_note_style, back_font_color = build_back_styles(layout, back_theme)
 
     # Create combined canvas
-    fig, ax = plt.subplots(figsize=(CANVAS_W, CANVAS_H), dpi=DPI)
+    fig, ax = new_figure((CANVAS_W, CANVAS_H), dpi=dpi)
     ax.set_xlim(-1, CANVAS_W - 1)
     ax.set_ylim(-1, CANVAS_H - 1)
     fig.patch.set_facecolor(CANVAS_COLOR)
@@ -905,7 +1825,8 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
     def render_front_image():
         if image_path and os.path.exists(image_path):
             try:
-                sample_img = mpimg.imread(image_path)
+                with METRICS.timer('image_decode'):
+                    sample_img = mpimg.imread(image_path)
                 ax.imshow(sample_img, extent=[img_x, img_x + img_w, img_y, img_y + img_h],
                          aspect='auto', zorder=2)
             except Exception:
@@ -933,37 +1854,25 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
 
     text_color = font_color if font_color else '#000000'
     special_mode = front.get('special')
-    gutter = front.get('gutter', 0.25)
+    gutter = layout_gutter(front)
 
     # Draw front caption
     if special_mode == 'double_col':
-        col_w = (caption_w - gutter) / 2
-        col1_x = caption_x
-        col2_x = caption_x + col_w + gutter
-        rule_x = caption_x + col_w + gutter / 2  # Center of gutter
+        rule_x = caption_x + caption_w / 2  # Center of gutter
 
         # Get border color for column rule
         caption_border = caption_style.get('border', {}) if caption_style else {}
         rule_color = caption_border.get('color', '#000000')
 
-        col1_text, col2_text = '', ''
-        if sample_text:
-            chars_per_col = int(col_w * 7)
-            wrapped = textwrap.fill(sample_text, width=chars_per_col)
-            lines = wrapped.split('\n')
-            mid = len(lines) // 2
-            col1_text = '\n'.join(lines[:mid]) if mid > 0 else lines[0] if lines else ''
-            col2_text = '\n'.join(lines[mid:]) if mid < len(lines) else ''
-
         def render_double_col():
             # Draw column rule (vertical line in center of gutter)
             ax.plot([rule_x, rule_x], [caption_y, caption_y + caption_h],
                     color=rule_color, linewidth=0.5, zorder=5)
             if sample_text:
-                ax.text(col1_x + 0.1, caption_y + caption_h - 0.1, col1_text,
-                        ha='left', va='top', color=text_color, fontsize=12, wrap=True)
-                ax.text(col2_x + 0.1, caption_y + caption_h - 0.1, col2_text,
-                        ha='left', va='top', color=text_color, fontsize=12, wrap=True)
+                fit = draw_double_column_text(ax, caption_x, caption_y, caption_w, caption_h, sample_text,
+                                              gutter, front.get('text_style', {}), text_color,
+                                              front.get('border_widths', {}).get('caption'))
+                draw_overflow_marker(ax, caption_x + caption_w, caption_y, fit)
             else:
                 ax.text(caption_x + caption_w/2, caption_y + caption_h/2, "CAPTION",
                         ha='center', va='center', color='#666666', fontsize=13, alpha=0.5)
@@ -972,46 +1881,47 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
     else:
         def render_caption():
             if sample_text:
-                chars_per_line = int(caption_w * 7)
-                wrapped = textwrap.fill(sample_text, width=chars_per_line)
-                ax.text(caption_x + 0.1, caption_y + caption_h - 0.1, wrapped,
-                        ha='left', va='top', color=text_color, fontsize=12)
+                fit = draw_box_text(ax, caption_x, caption_y, caption_w, caption_h, sample_text,
+                                    front.get('text_style', {}), text_color,
+                                    front.get('border_widths', {}).get('caption'))
+                draw_overflow_marker(ax, caption_x + caption_w, caption_y, fit)
             else:
                 ax.text(caption_x + caption_w/2, caption_y + caption_h/2, "CAPTION TEXT\n(Greeked)",
                         ha='center', va='center', color='#666666', fontsize=13, alpha=0.6, style='italic')
         draw_content_block(ax, caption_x, caption_y, caption_w, caption_h, caption_style, render_caption)
 
-    # Front dimensions
+    # Front dimensions (drawn with the back's, as one layer)
+    dims = DimensionLayer(ax)
     caption_top = caption_y + caption_h
     if 'top' in front['img_pos']:
         d1_x = front_paper_x - 1.0
-        draw_dim_line(ax, d1_x, paper_y + paper_h, img_y + img_h, f"{img_top_margin}\"", dim_id="D1")
-    draw_dim_line(ax, front_paper_x - 1.0, img_y, img_y + img_h, f"{img_h:.2f}\"", dim_id="D13")
+        dims.vertical(d1_x, paper_y + paper_h, img_y + img_h, f"{img_top_margin}\"", dim_id="D1")
+    dims.vertical(front_paper_x - 1.0, img_y, img_y + img_h, f"{img_h:.2f}\"", dim_id="D13")
     img_bottom_margin = img_y - paper_y
     if img_bottom_margin > 0.1:
-        draw_dim_line(ax, front_paper_x - 1.0, paper_y, img_y, f"{img_bottom_margin:.2f}\"", dim_id="D14")
+        dims.vertical(front_paper_x - 1.0, paper_y, img_y, f"{img_bottom_margin:.2f}\"", dim_id="D14")
     gap_distance = img_y - caption_top
     if gap_distance > 0.1:
-        draw_dim_line(ax, front_paper_x - 0.5, img_y, caption_top, f"{gap_distance:.2f}\"", dim_id="D5")
-    draw_dim_line(ax, front_paper_x + paper_w + 0.5, paper_y + paper_h, caption_top,
+        dims.vertical(front_paper_x - 0.5, img_y, caption_top, f"{gap_distance:.2f}\"", dim_id="D5")
+    dims.vertical(front_paper_x + paper_w + 0.5, paper_y + paper_h, caption_top,
                   f"{(paper_y + paper_h) - caption_top:.2f}\"", dim_id="D4")
     if caption_h > 0.1:
-        draw_dim_line(ax, front_paper_x + paper_w + 0.5, caption_y, caption_top, f"{caption_h:.2f}\"", dim_id="D6")
+        dims.vertical(front_paper_x + paper_w + 0.5, caption_y, caption_top, f"{caption_h:.2f}\"", dim_id="D6")
     bottom_margin = caption_y - paper_y
     if bottom_margin > 0.1:
-        draw_dim_line(ax, front_paper_x + paper_w + 0.5, paper_y, caption_y, f"{bottom_margin:.2f}\"", dim_id="D12")
+        dims.vertical(front_paper_x + paper_w + 0.5, paper_y, caption_y, f"{bottom_margin:.2f}\"", dim_id="D12")
     left_margin = img_x - front_paper_x
-    draw_horizontal_dim_line(ax, paper_y + paper_h + 0.5, front_paper_x, img_x, f"{left_margin:.2f}\"", dim_id="D2")
-    draw_horizontal_dim_line(ax, paper_y + paper_h + 0.5, img_x, img_x + img_w, f"{img_w:.2f}\"", dim_id="D16")
+    dims.horizontal(paper_y + paper_h + 0.5, front_paper_x, img_x, f"{left_margin:.2f}\"", dim_id="D2")
+    dims.horizontal(paper_y + paper_h + 0.5, img_x, img_x + img_w, f"{img_w:.2f}\"", dim_id="D16")
     right_margin = (front_paper_x + paper_w) - (img_x + img_w)
-    draw_horizontal_dim_line(ax, paper_y + paper_h + 0.5, img_x + img_w, front_paper_x + paper_w, f"{right_margin:.2f}\"", dim_id="D3")
-    draw_horizontal_dim_line(ax, paper_y - 0.5, front_paper_x, caption_x, f"{caption_x - front_paper_x:.2f}\"", dim_id="D9")
-    draw_horizontal_dim_line(ax, paper_y - 0.5, caption_x, caption_x + caption_w, f"{caption_w:.2f}\"", dim_id="D10")
+    dims.horizontal(paper_y + paper_h + 0.5, img_x + img_w, front_paper_x + paper_w, f"{right_margin:.2f}\"", dim_id="D3")
+    dims.horizontal(paper_y - 0.5, front_paper_x, caption_x, f"{caption_x - front_paper_x:.2f}\"", dim_id="D9")
+    dims.horizontal(paper_y - 0.5, caption_x, caption_x + caption_w, f"{caption_w:.2f}\"", dim_id="D10")
     caption_right_margin = (front_paper_x + paper_w) - (caption_x + caption_w)
     if caption_right_margin > 0.1:
-        draw_horizontal_dim_line(ax, paper_y - 0.5, caption_x + caption_w, front_paper_x + paper_w, f"{caption_right_margin:.2f}\"", dim_id="D15")
-    draw_horizontal_dim_line(ax, paper_y - 1.0, front_paper_x, front_paper_x + paper_w, f"{paper_w}\"", dim_id="D7")
-    draw_dim_line(ax, front_paper_x + paper_w + 1.0, paper_y, paper_y + paper_h, f"{paper_h}\"", dim_id="D8")
+        dims.horizontal(paper_y - 0.5, caption_x + caption_w, front_paper_x + paper_w, f"{caption_right_margin:.2f}\"", dim_id="D15")
+    dims.horizontal(paper_y - 1.0, front_paper_x, front_paper_x + paper_w, f"{paper_w}\"", dim_id="D7")
+    dims.vertical(front_paper_x + paper_w + 1.0, paper_y, paper_y + paper_h, f"{paper_h}\"", dim_id="D8")
 
     # ===== DRAW BACK PANEL (RIGHT) =====
     back_paper_bg = back_paper_style.get('background', '#FFFFFF') if back_paper_style else '#FFFFFF'
@@ -1048,10 +1958,10 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
 
     def render_note():
         if note_text:
-            chars_per_line = int(note_w * 7)
-            wrapped = textwrap.fill(note_text, width=chars_per_line)
-            ax.text(note_x + 0.1, note_y + note_h - 0.1, wrapped,
-                    ha='left', va='top', color=back_text_color, fontsize=12)
+            fit = draw_box_text(ax, note_x, note_y, note_w, note_h, note_text,
+                                back.get('text_style', {}), back_text_color,
+                                back.get('border_widths', {}).get('note'))
+            draw_overflow_marker(ax, note_x + note_w, note_y, fit)
         else:
             ax.text(note_x + note_w/2, note_y + note_h/2, "PERSONAL NOTE\n(Greeked)",
                     ha='center', va='center', color='#666666', fontsize=13, alpha=0.6, style='italic')
@@ -1062,14 +1972,15 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
     right_margin_back = (back_paper_x + paper_w) - (note_x + note_w)
     top_margin_back = (paper_y + paper_h) - (note_y + note_h)
     bottom_margin_back = note_y - paper_y
-    draw_dim_line(ax, back_paper_x - 0.5, paper_y + paper_h, note_y + note_h, f"{top_margin_back:.2f}\"", dim_id="D1")
-    draw_dim_line(ax, back_paper_x - 0.5, note_y, note_y + note_h, f"{note_h:.2f}\"", dim_id="D2")
-    draw_dim_line(ax, back_paper_x - 0.5, paper_y, note_y, f"{bottom_margin_back:.2f}\"", dim_id="D3")
-    draw_horizontal_dim_line(ax, paper_y - 0.5, back_paper_x, note_x, f"{left_margin_back:.2f}\"", dim_id="D4")
-    draw_horizontal_dim_line(ax, paper_y - 0.5, note_x, note_x + note_w, f"{note_w:.2f}\"", dim_id="D5")
-    draw_horizontal_dim_line(ax, paper_y - 0.5, note_x + note_w, back_paper_x + paper_w, f"{right_margin_back:.2f}\"", dim_id="D6")
-    draw_horizontal_dim_line(ax, paper_y - 1.0, back_paper_x, back_paper_x + paper_w, f"{paper_w}\"", dim_id="D7")
-    draw_dim_line(ax, back_paper_x + paper_w + 0.5, paper_y, paper_y + paper_h, f"{paper_h}\"", dim_id="D8")
+    dims.vertical(back_paper_x - 0.5, paper_y + paper_h, note_y + note_h, f"{top_margin_back:.2f}\"", dim_id="D1")
+    dims.vertical(back_paper_x - 0.5, note_y, note_y + note_h, f"{note_h:.2f}\"", dim_id="D2")
+    dims.vertical(back_paper_x - 0.5, paper_y, note_y, f"{bottom_margin_back:.2f}\"", dim_id="D3")
+    dims.horizontal(paper_y - 0.5, back_paper_x, note_x, f"{left_margin_back:.2f}\"", dim_id="D4")
+    dims.horizontal(paper_y - 0.5, note_x, note_x + note_w, f"{note_w:.2f}\"", dim_id="D5")
+    dims.horizontal(paper_y - 0.5, note_x + note_w, back_paper_x + paper_w, f"{right_margin_back:.2f}\"", dim_id="D6")
+    dims.horizontal(paper_y - 1.0, back_paper_x, back_paper_x + paper_w, f"{paper_w}\"", dim_id="D7")
+    dims.vertical(back_paper_x + paper_w + 0.5, paper_y, paper_y + paper_h, f"{paper_h}\"", dim_id="D8")
+    dims.draw()
 
     # ===== SHARED TITLE BLOCK =====
     title_block_x = -1 + BORDER_MARGIN
@@ -1129,249 +2040,2920 @@ def draw_combined_blueprint(filename, layout, front_theme, back_theme,
 
     # Clean up and save
     ax.axis('off')
-    os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, filename)
-    plt.savefig(output_path, bbox_inches='tight', pad_inches=0.1)
-    plt.close()
-    print(f"Generated: {output_path}")
+    crop = blueprint_crop_box(ax)
+    crop_w, crop_h = crop[2] - crop[0], crop[3] - crop[1]
+    with open_output(output_dir, filename, sink) as fh:
+        if memory_budget_mb and crop_w * crop_h * TILE_BYTES_PER_PIXEL > memory_budget_mb * 2**20:
+            # Too big to hold at once: stream bands, keep only a reduced proxy for thumbnail/PDF
+            proxy_px = memory_budget_mb * 2**20 // TILE_BYTES_PER_PIXEL
+            proxy_width = int(crop_w * min(1, (proxy_px / (crop_w * crop_h)) ** 0.5))
+            stats, image = render_tiled_png(fig, ax, crop, fh, memory_budget_mb,
+                                            compress_level, proxy_width)
+            detail = f"{format_png_stats(stats)}, {stats['bands']} bands"
+        else:
+            image = figure_to_image(fig, crop)
+            stats = save_png(image, fh, png_mode, compress_level)
+            detail = format_png_stats(stats)
+    METRICS.observe('blueprint_draw', time.perf_counter() - draw_start - stats['encode_s'])
+    METRICS.observe('blueprint_encode', stats['encode_s'])
+    METRICS.inc('blueprint_bytes', stats['bytes'])
+    print(f"Generated: {output_label(output_dir, filename, sink)} ({detail})")
+    if sink is not None:
+        sink.image_sizes[filename] = (crop_w, crop_h)
+    if pdf_writer is not None:
+        pdf_writer.add_page(image, crop_w / dpi, crop_h / dpi)
+    if thumbnail_width and image.width > thumbnail_width:
+        thumb_name = thumbnail_filename(filename)
+        with open_output(output_dir, thumb_name, sink) as fh:
+            write_thumbnail(image, fh, thumbnail_width, png_mode, compress_level)
+        if sink is not None:
+            sink.image_sizes[thumb_name] = thumbnail_size(image.size, thumbnail_width)
+        print(f"Generated: {output_label(output_dir, thumb_name, sink)}")
     return output_path
 
 
-def generate_combined_html(html_files, output_dir):
-    """Generate an all.html with all layouts in continuous scrollable sequence."""
-    import re
+# --- PNG ENCODING ---
 
-    all_pages = []
+PNG_MODES = ('palette', 'rgb', 'rgba')
+BLUEPRINT_PAD = 0.1  # Inches of canvas kept around the blueprint axes
 
-    for path in html_files:
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
 
-        # Extract layout name from filename
-        layout_name = os.path.splitext(os.path.basename(path))[0]
+def blueprint_crop_box(ax, pad=BLUEPRINT_PAD):
+    """Pixel box (left, upper, right, lower) of the blueprint canvas plus padding.
 
-        # Extract the pages-container content (greedy match to get all nested divs)
-        match = re.search(r'<div class="pages-container">(.*)</div>\s*\n\s*<!-- Blueprint -->', content, re.DOTALL)
-        # Extract the blueprint image
-        blueprint_match = re.search(r'<div class="blueprint">.*?<img src="([^"]+)"', content, re.DOTALL)
-        blueprint_img = blueprint_match.group(1) if blueprint_match else None
+    The drawing fills the axes' data limits (CANVAS_W x CANVAS_H), so the box
+    is known from the axes position without the extra draw pass that
+    bbox_inches='tight' needs to measure artists.
+    """
+    fig = ax.figure
+    dpi = fig.dpi
+    fig_w, fig_h = fig.get_size_inches()
+    pos = ax.get_position()
+    left = max((pos.x0 * fig_w - pad) * dpi, 0)
+    right = min((pos.x1 * fig_w + pad) * dpi, fig_w * dpi)
+    upper = max(((1 - pos.y1) * fig_h - pad) * dpi, 0)
+    lower = min(((1 - pos.y0) * fig_h + pad) * dpi, fig_h * dpi)
+    return (round(left), round(upper), round(right), round(lower))
 
-        if match:
-            pages_content = match.group(1)
-            blueprint_html = f'<div class="blueprint"><img src="{blueprint_img}" alt="Blueprint"></div>' if blueprint_img else ''
-            # Add a section header for this layout
-            all_pages.append(f'''
-    <!-- {layout_name} -->
-    <div class="layout-section" id="{layout_name}">
-        <div class="layout-header">{layout_name}</div>
-        <div class="pages-row">
-            {pages_content}
-        </div>
-        {blueprint_html}
-    </div>''')
 
-    combined_pages = '\n'.join(all_pages)
+def save_png(image, output_path, png_mode='rgb', compress_level=6):
+    """Encode a PIL image as PNG.
 
-    # Build navigation
-    nav_items = '\n'.join([
-        f'<a href="#{os.path.splitext(os.path.basename(p))[0]}" class="nav-link">{os.path.splitext(os.path.basename(p))[0]}</a>'
-        for p in html_files
-    ])
+    Args:
+        image: RGB PIL image
+        output_path: Destination file path, or a writable binary file
+        png_mode: 'rgb' keeps truecolour (lossless), 'palette' quantises to an 8-bit
+            palette (typically 3x smaller, but lossy: the photo and anti-aliased text
+            shift colour), 'rgba' adds an opaque alpha channel for old behaviour
+        compress_level: zlib level 0-9; lower is faster, higher is smaller
 
-    html = f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>All Layouts - Continuous Scroll</title>
-    <style>
-        * {{ box-sizing: border-box; margin: 0; padding: 0; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-            background: #ecf0f1;
-            padding: 20px;
-        }}
-        .layout-section {{
-            margin-bottom: 40px;
-            scroll-margin-top: 20px;
-        }}
-        .layout-header {{
-            background: #2c3e50;
-            color: white;
-            padding: 10px 20px;
-            font-size: 14px;
-            font-weight: bold;
-            border-radius: 4px 4px 0 0;
-            position: sticky;
-            top: 0;
-            z-index: 10;
-        }}
-        .pages-row {{
-            display: flex;
-            flex-wrap: wrap;
-            justify-content: center;
-            gap: 20px;
-            padding: 20px;
-            background: #ddd;
-            border-radius: 0 0 4px 4px;
-        }}
-        .page {{
-            position: relative;
-            overflow: hidden;
-            flex-shrink: 0;
-        }}
-        .image-box img {{
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-        }}
-        p {{
-            margin: 0 0 0.5em 0;
-        }}
-        p:last-child {{
-            margin-bottom: 0;
-        }}
-        .nav-sidebar {{
-            position: fixed;
-            right: 20px;
-            top: 20px;
-            background: rgba(44, 62, 80, 0.9);
-            padding: 10px;
-            border-radius: 4px;
-            max-height: 90vh;
-            overflow-y: auto;
-            z-index: 100;
-            font-size: 11px;
-        }}
-        .nav-link {{
-            display: block;
-            color: #ecf0f1;
-            text-decoration: none;
-            padding: 4px 8px;
-            border-radius: 2px;
-        }}
-        .nav-link:hover {{
-            background: #3498db;
-        }}
-        .blueprint {{
-            text-align: center;
-            padding: 20px;
-            background: #ccc;
-            margin-top: 10px;
-        }}
-        .blueprint img {{
-            max-width: 100%;
-            height: auto;
-            box-shadow: 0 0 10px rgba(0,0,0,0.2);
-        }}
-    </style>
-</head>
-<body>
-    <div class="nav-sidebar">
-        <strong style="color: white; display: block; margin-bottom: 8px;">Jump to:</strong>
-        {nav_items}
-    </div>
-    {combined_pages}
+    Returns:
+        Dict with 'path', 'bytes' and 'encode_s' (quantise + compress + write time)
+    """
+    if png_mode not in PNG_MODES:
+        raise ValueError(f"Unknown png_mode {png_mode!r}; expected one of {PNG_MODES}")
+    start = time.perf_counter()
+    if png_mode == 'palette':
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    elif png_mode == 'rgba':
+        image = image.convert('RGBA')
+    image.save(output_path, format='PNG', compress_level=compress_level)
+    return {
+        'path': output_path,
+        'bytes': written_bytes(output_path),
+        'encode_s': time.perf_counter() - start,
+    }
+
+
+def written_bytes(output):
+    """Size of a finished output given as a path, or bytes written so far to a file."""
+    return output.tell() if hasattr(output, 'write') else os.path.getsize(output)
+
+
+def format_png_stats(stats):
+    """One-line summary of save_png() stats for progress output."""
+    return f"{stats['bytes'] / 1024:.0f} KB, encoded in {stats['encode_s']:.2f}s"
+
+
+def thumbnail_filename(blueprint_filename):
+    """Return the thumbnail filename that goes with a blueprint PNG."""
+    stem, ext = os.path.splitext(blueprint_filename)
+    return f"{stem}_thumb{ext}"
+
+
+def thumbnail_size(size, width):
+    """(width, height) of the thumbnail of an image of the given size."""
+    return width, round(size[1] * width / size[0])
+
+
+def write_thumbnail(image, thumb_path, width, png_mode='rgb', compress_level=6):
+    """Write a copy of an image downscaled to `width` pixels wide.
+
+    Returns thumb_path, or None if the image is already no wider than `width`
+    (e.g. in preview mode), in which case it serves as its own thumbnail.
+    """
+    if image.width <= width:
+        return None
+    thumb = image.resize(thumbnail_size(image.size, width), Image.LANCZOS)
+    save_png(thumb, thumb_path, png_mode, compress_level)
+    return thumb_path
+
+
+# --- TILED RENDERING ---
+
+TILE_BYTES_PER_PIXEL = 12  # Agg RGBA band + RGB copy + filtered rows + compressor input
+MIN_BAND_HEIGHT = 16       # Pixel rows; below this per-band draw overhead dominates
+
+
+class StreamingPngWriter:
+    """Write an RGB PNG from horizontal bands of rows without holding the image.
+
+    Rows are Up-filtered (cheap to vectorise and effective on flat-colour
+    drawings) and fed through a single zlib stream, emitting IDAT chunks as
+    compressed data becomes available. `path` may also be an open binary file,
+    which is left open.
+    """
+
+    def __init__(self, path, width, height, compress_level=6):
+        self.path = path
+        self.width = width
+        self.height = height
+        self._rows_written = 0
+        self._prev_row = np.zeros((1, width, 3), dtype=np.uint8)
+        self._compressor = zlib.compressobj(compress_level)
+        self._owns_file = not hasattr(path, 'write')
+        self._fh = open(path, 'wb') if self._owns_file else path
+        self._closed = False
+        self._fh.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write_chunk(self, kind, data):
+        self._fh.write(struct.pack('>I', len(data)))
+        self._fh.write(kind)
+        self._fh.write(data)
+        self._fh.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write_rows(self, rows):
+        """Append an (n, width, 3) uint8 array of rows."""
+        rows = np.ascontiguousarray(rows, dtype=np.uint8)
+        filtered = np.empty((rows.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # PNG filter type Up
+        previous = np.concatenate([self._prev_row, rows[:-1]])
+        filtered[:, 1:] = (rows - previous).reshape(rows.shape[0], -1)
+        self._prev_row = rows[-1:].copy()
+        self._rows_written += rows.shape[0]
+
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+
+    def close(self):
+        """Flush the zlib stream, write IEND and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._rows_written != self.height:
+                raise ValueError(f"{self.path}: wrote {self._rows_written} rows, expected {self.height}")
+            self._write_chunk(b'IDAT', self._compressor.flush())
+            self._write_chunk(b'IEND', b'')
+        finally:
+            if self._owns_file:
+                self._fh.close()
+
+
+def band_height_for_budget(width_px, memory_budget_mb):
+    """Rows per band so one band's working set stays within memory_budget_mb."""
+    return max(MIN_BAND_HEIGHT, int(memory_budget_mb * 2**20 // (width_px * TILE_BYTES_PER_PIXEL)))
+
+
+def iter_figure_bands(fig, ax, crop, band_height):
+    """Draw a figure one horizontal band at a time.
+
+    The figure is resized to a single band and the axes shifted so that each
+    band lands in the Agg buffer at the same DPI, fonts and line widths as a
+    full render. Yields (row_offset, rows) where rows is an (n, width, 3)
+    uint8 view valid until the next band is drawn. The figure is restored
+    afterwards.
+    """
+    dpi = fig.dpi
+    fig_w, fig_h = fig.get_size_inches()
+    pos = ax.get_position()
+    left, upper, right, lower = crop
+    width_px = right - left
+    band_w_in = width_px / dpi
+    ax_x0, ax_y0 = pos.x0 * fig_w, pos.y0 * fig_h
+    ax_w, ax_h = pos.width * fig_w, pos.height * fig_h
+
+    try:
+        for top in range(upper, lower, band_height):
+            bottom = min(top + band_height, lower)
+            band_h_in = (bottom - top) / dpi
+            band_y0 = fig_h - bottom / dpi
+            fig.set_size_inches(band_w_in, band_h_in, forward=False)
+            ax.set_position([(ax_x0 - left / dpi) / band_w_in, (ax_y0 - band_y0) / band_h_in,
+                             ax_w / band_w_in, ax_h / band_h_in])
+            fig.canvas.draw()
+            rgba = np.asarray(fig.canvas.buffer_rgba())
+            rows = rgba[:bottom - top, :width_px, :3]
+            if rows.shape[0] < bottom - top or rows.shape[1] < width_px:
+                # Agg truncates fractional pixel sizes; pad by repeating the edge
+                rows = np.pad(rows, ((0, bottom - top - rows.shape[0]), (0, width_px - rows.shape[1]), (0, 0)),
+                              mode='edge')
+            yield top - upper, rows
+    finally:
+        fig.set_size_inches(fig_w, fig_h, forward=False)
+        ax.set_position(pos)
+
+
+def render_tiled_png(fig, ax, crop, output_path, memory_budget_mb, compress_level=6, proxy_width=None):
+    """Render the crop box of a figure to PNG band by band within a memory budget.
+
+    Output is truecolour RGB (a palette cannot be chosen before every band is
+    seen). Pixels match a single-pass render except that edges falling exactly
+    on a half pixel may snap one pixel differently, since each band's
+    transform is computed separately. If proxy_width is given, a downscaled copy of the whole image is
+    assembled from the bands for thumbnails and PDF pages.
+
+    Returns (stats, proxy_image) with stats as from save_png().
+    """
+    width = crop[2] - crop[0]
+    height = crop[3] - crop[1]
+    band_height = band_height_for_budget(width, memory_budget_mb)
+    scale = min(proxy_width / width, 1) if proxy_width else None
+    proxy = Image.new('RGB', (round(width * scale), round(height * scale))) if scale else None
+
+    encode_s = 0.0
+    png = StreamingPngWriter(output_path, width, height, compress_level)
+    try:
+        for offset, rows in iter_figure_bands(fig, ax, crop, band_height):
+            start = time.perf_counter()
+            png.write_rows(rows)
+            encode_s += time.perf_counter() - start
+            if proxy:
+                y0 = round(offset * scale)
+                y1 = round((offset + rows.shape[0]) * scale)
+                if y1 > y0:
+                    band = Image.fromarray(np.ascontiguousarray(rows)).resize((proxy.width, y1 - y0), Image.LANCZOS)
+                    proxy.paste(band, (0, y0))
+    finally:
+        start = time.perf_counter()
+        png.close()
+        encode_s += time.perf_counter() - start
+
+    stats = {
+        'path': output_path,
+        'bytes': written_bytes(output_path),
+        'encode_s': encode_s,
+        'bands': -(-height // band_height),
+    }
+    return stats, proxy
+
+
+# --- TEXT MEASUREMENT ---
+
+TEXT_PADDING = 0.1   # Inches of padding inside caption/note boxes (matches HTML)
+PARAGRAPH_GAP = 0.5  # Em spacing between paragraphs (matches `p { margin-bottom: 0.5em }`)
+CSS_GENERIC_FAMILIES = {'serif', 'sans-serif', 'monospace', 'cursive', 'fantasy'}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_font_path(font_family):
+    """Resolve a CSS font-family list to an installed font file.
+
+    Each family is tried in order; CSS generic families map onto matplotlib's
+    configured serif/sans-serif/monospace fonts. Falls back to the default font.
+    """
+    for family in font_family.split(','):
+        family = family.strip().strip('"\'')
+        if not family:
+            continue
+        try:
+            return font_manager.findfont(font_manager.FontProperties(family=[family]), fallback_to_default=False)
+        except ValueError:
+            continue
+    return font_manager.findfont(font_manager.FontProperties())
+
+
+@functools.lru_cache(maxsize=None)
+def get_font_metrics(font_path):
+    """Return glyph advance table and vertical metrics for a font file, in em units.
+
+    Returns dict with 'advances' (codepoint -> advance width), 'default_advance',
+    'ascent', 'descent' and 'line_height' (CSS `line-height: normal`).
+    """
+    font = ttLib.TTFont(font_path, fontNumber=0, lazy=True)
+    units_per_em = font['head'].unitsPerEm
+    hmtx = font['hmtx'].metrics
+    advances = {codepoint: hmtx[glyph][0] / units_per_em
+                for codepoint, glyph in font.getBestCmap().items() if glyph in hmtx}
+    hhea = font['hhea']
+    ascent = hhea.ascent / units_per_em
+    descent = -hhea.descent / units_per_em
+    font.close()
+    return {
+        'advances': advances,
+        'default_advance': advances.get(ord('n'), 0.5),
+        'ascent': ascent,
+        'descent': descent,
+        'line_height': ascent + descent + hhea.lineGap / units_per_em,
+    }
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_width_em(word, font_path):
+    """Width of a single word in em units (cached; words repeat across a batch)."""
+    metrics = get_font_metrics(font_path)
+    advances = metrics['advances']
+    default = metrics['default_advance']
+    return sum(advances.get(ord(ch), default) for ch in word)
+
+
+def strip_markdown(text):
+    """Reduce markdown to the plain text a browser would lay out."""
+    text = re.sub(r'^\s{0,3}#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'!?\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'(\*\*|__|\*|_)(?=\S)(.+?)(?<=\S)\1', r'\2', text)
+    return text
+
+
+def measure_text_width(text, font_family, size):
+    """Return the rendered width of a single line of text in inches."""
+    font_path = resolve_font_path(font_family)
+    space = _word_width_em(' ', font_path)
+    words = text.split(' ')
+    em = sum(_word_width_em(word, font_path) for word in words) + space * (len(words) - 1)
+    return em * size / 72
+
+
+def wrap_text_to_width(text, font_family, size, width):
+    """Greedy word-wrap text to a measured width in inches.
+
+    Newlines are hard breaks and blank lines separate paragraphs (as rendered
+    with markdown's nl2br extension). Returns list of paragraphs, each a list
+    of lines.
+    """
+    font_path = resolve_font_path(font_family)
+    max_em = width * 72 / size
+    space = _word_width_em(' ', font_path)
+
+    paragraphs = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        lines = []
+        for hard_line in block.split('\n'):
+            line, line_em = [], 0.0
+            for word in hard_line.split():
+                word_em = _word_width_em(word, font_path)
+                if line and line_em + space + word_em > max_em:
+                    lines.append(' '.join(line))
+                    line, line_em = [word], word_em
+                else:
+                    line_em += (space if line else 0) + word_em
+                    line.append(word)
+            lines.append(' '.join(line))
+        paragraphs.append(lines)
+    return paragraphs
+
+
+def paragraphs_height(paragraphs, font_family, size):
+    """Height in inches of wrapped paragraphs, including inter-paragraph gaps."""
+    line_h = get_font_metrics(resolve_font_path(font_family))['line_height'] * size / 72
+    line_count = sum(len(lines) for lines in paragraphs)
+    gap_count = max(len(paragraphs) - 1, 0)
+    return line_count * line_h + gap_count * PARAGRAPH_GAP * size / 72
+
+
+def fit_text(text, box_w, box_h, text_style=None, border=0, pad=TEXT_PADDING):
+    """Lay out text in a box and report whether it overflows.
+
+    Box geometry follows the HTML output: border-box sizing with TEXT_PADDING
+    inside the border.
+
+    Returns dict with 'paragraphs', 'font', 'size', 'height', 'available_height',
+    'available_width' and 'overflow' (inches the text exceeds the box by, 0 if it fits).
+    """
+    css = get_css_text_alignment(text_style or {})
+    font, size = css['font_family'], css['font_size']
+    inner_w = box_w - 2 * (border or 0) - 2 * pad
+    inner_h = box_h - 2 * (border or 0) - 2 * pad
+    paragraphs = wrap_text_to_width(strip_markdown(text or ''), font, size, inner_w)
+    height = paragraphs_height(paragraphs, font, size) if text else 0
+    return {
+        'paragraphs': paragraphs,
+        'font': font,
+        'size': size,
+        'height': height,
+        'available_width': inner_w,
+        'available_height': inner_h,
+        'overflow': max(height - inner_h, 0),
+    }
+
+
+def find_max_font_size(text, box_w, box_h, text_style=None, border=0,
+                       min_size=4, max_size=72, precision=0.25):
+    """Binary-search the largest font size (points) at which text fits the box.
+
+    Returns min_size if even that overflows.
+    """
+    style = dict(text_style or {})
+    lo, hi = min_size, max_size
+    while hi - lo > precision:
+        mid = (lo + hi) / 2
+        style['size'] = mid
+        if fit_text(text, box_w, box_h, style, border)['overflow'] > 0:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+
+@functools.lru_cache(maxsize=4096)
+def _balance_columns(text, font_family, size, col_width):
+    """Cached core of balance_columns(); returns immutable tuples."""
+    paragraphs = wrap_text_to_width(strip_markdown(text), font_family, size, col_width)
+    line_h = get_font_metrics(resolve_font_path(font_family))['line_height'] * size / 72
+    gap = PARAGRAPH_GAP * size / 72
+
+    # Flatten to (paragraph index, line) and the running height after each line.
+    # A paragraph gap that lands on the column break is dropped, as in CSS.
+    lines = [(p, line) for p, para in enumerate(paragraphs) for line in para]
+    tops = []
+    height = 0.0
+    for i, (p, _) in enumerate(lines):
+        if i and p != lines[i - 1][0]:
+            height += gap
+        tops.append(height)
+        height += line_h
+    total = height
+
+    def split_cost(k):
+        first = tops[k - 1] + line_h if k else 0.0
+        second = total - tops[k] if k < len(lines) else 0.0
+        # On equal difference prefer the taller first column, as browsers do
+        return (round(abs(first - second), 9), first < second)
+
+    best_k = min(range(len(lines) + 1), key=split_cost)
+
+    def regroup(chunk):
+        grouped = []
+        for p, line in chunk:
+            if grouped and grouped[-1][0] == p:
+                grouped[-1][1].append(line)
+            else:
+                grouped.append((p, [line]))
+        return tuple(tuple(para) for _, para in grouped)
+
+    first_col, second_col = regroup(lines[:best_k]), regroup(lines[best_k:])
+    return (first_col, second_col,
+            paragraphs_height(first_col, font_family, size),
+            paragraphs_height(second_col, font_family, size))
+
+
+def balance_columns(text, font_family, size, col_width):
+    """Split text into two columns of near-equal measured height.
+
+    Wraps text to col_width (inches) and picks the line at which to break so
+    the column heights differ least, the way CSS `column-fill: balance` does.
+    Results are cached per (text, font, size, width), so the blueprint and the
+    HTML overflow check share the work.
+
+    Returns dict with 'columns' (two lists of paragraphs) and 'heights'.
+    """
+    first_col, second_col, first_h, second_h = _balance_columns(text, font_family, size, col_width)
+    return {
+        'columns': [[list(p) for p in first_col], [list(p) for p in second_col]],
+        'heights': (first_h, second_h),
+    }
+
+
+def fit_double_column(text, box_w, box_h, gutter, text_style=None, border=0, pad=TEXT_PADDING):
+    """Lay out text in a two-column box and report whether it overflows.
+
+    Columns are balanced with balance_columns(). Returns the fit_text() keys
+    plus 'columns' and 'column_width'; 'height' is the taller column.
+    """
+    css = get_css_text_alignment(text_style or {})
+    font, size = css['font_family'], css['font_size']
+    inner_w = box_w - 2 * (border or 0) - 2 * pad
+    inner_h = box_h - 2 * (border or 0) - 2 * pad
+    col_w = (inner_w - gutter) / 2
+    if text:
+        balanced = balance_columns(text, font, size, col_w)
+        columns, height = balanced['columns'], max(balanced['heights'])
+    else:
+        columns, height = [[], []], 0
+    return {
+        'paragraphs': columns[0] + columns[1],
+        'columns': columns,
+        'column_width': col_w,
+        'font': font,
+        'size': size,
+        'height': height,
+        'available_width': inner_w,
+        'available_height': inner_h,
+        'overflow': max(height - inner_h, 0),
+    }
+
+
+def check_text_overflow(layout, text_content, note_content):
+    """Measure caption and note text against a layout's boxes.
+
+    Returns dict with 'caption' and 'note' fit_text() results.
+    """
+    front = layout.get('front', {})
+    back = layout.get('back', {})
+    note_dims = back.get('note_dims', {'width': 6, 'height': 9})
+    caption_w = front['caption_dims']['width']
+    caption_h = front['caption_dims']['height']
+    caption_border = front.get('border_widths', {}).get('caption')
+    if front.get('special') == 'double_col':
+        caption_fit = fit_double_column(text_content, caption_w, caption_h, layout_gutter(front),
+                                        front.get('text_style', {}), caption_border)
+    else:
+        caption_fit = fit_text(text_content, caption_w, caption_h, front.get('text_style', {}), caption_border)
+    return {
+        'caption': caption_fit,
+        'note': fit_text(note_content, note_dims['width'], note_dims['height'],
+                         back.get('text_style', {}), back.get('border_widths', {}).get('note')),
+    }
+
+
+# --- PRINT PAGE RENDERING ---
+
+def axes_point_scale(ax):
+    """Physical inches per data unit of an axes.
+
+    Layout geometry is in paper inches; multiplying a paper font size by this
+    keeps glyphs at their printed size relative to the drawn paper.
+    """
+    x0, x1 = ax.get_xlim()
+    return ax.get_position().width * ax.figure.get_size_inches()[0] / (x1 - x0)
+
+
+def draw_paragraphs(ax, x, width, top, paragraphs, font_family, size, color,
+                    align_h='left', clip_box=None):
+    """Draw wrapped paragraphs line by line from `top` down, within [x, x + width].
+
+    Line pitch and paragraph gaps come from the font's metrics, matching
+    paragraphs_height().
+    """
+    font_path = resolve_font_path(font_family)
+    metrics = get_font_metrics(font_path)
+    line_h = metrics['line_height'] * size / 72
+    half_leading = (metrics['line_height'] - metrics['ascent'] - metrics['descent']) / 2
+    baseline_offset = (half_leading + metrics['ascent']) * size / 72
+    gap = PARAGRAPH_GAP * size / 72
+    text_x = {'left': x, 'center': x + width / 2, 'right': x + width}[align_h]
+    font = font_manager.FontProperties(fname=font_path, size=size * axes_point_scale(ax))
+
+    line_top = top
+    for i, lines in enumerate(paragraphs):
+        if i:
+            line_top -= gap
+        for line in lines:
+            if line:
+                t = ax.text(text_x, line_top - baseline_offset, line, ha=align_h, va='baseline',
+                            color=color, fontproperties=font, zorder=3)
+                if clip_box is not None:
+                    t.set_clip_box(clip_box)
+            line_top -= line_h
+
+
+def _box_clip(ax, x, y, w, h, border):
+    """Clip box for a content block's inner (border-excluded) area."""
+    return mtransforms.TransformedBbox(mtransforms.Bbox.from_bounds(x + border, y + border, w - 2 * border, h - 2 * border),
+                           ax.transData)
+
+
+def _text_align_h(text_style):
+    """Horizontal alignment usable by matplotlib (justify falls back to left)."""
+    align = get_css_text_alignment(text_style)['text_align']
+    return align if align in ('left', 'center', 'right') else 'left'
+
+
+def draw_box_text(ax, x, y, w, h, text, text_style, color, border=0):
+    """Draw text inside a box line by line, as laid out by fit_text().
+
+    Honors text_style alignment, font and size, and clips to the box like the
+    HTML `overflow: hidden`. Returns the fit_text() result.
+    """
+    text_style = text_style or {}
+    border = border or 0
+    fit = fit_text(text, w, h, text_style, border)
+
+    slack = fit['available_height'] - fit['height']
+    offset = {'top': 0, 'middle': slack / 2, 'bottom': slack}.get(text_style.get('align_v', 'top'), 0)
+    draw_paragraphs(ax, x + border + TEXT_PADDING, fit['available_width'],
+                    y + h - border - TEXT_PADDING - offset, fit['paragraphs'],
+                    fit['font'], fit['size'], color, _text_align_h(text_style),
+                    _box_clip(ax, x, y, w, h, border))
+    return fit
+
+
+def draw_double_column_text(ax, x, y, w, h, text, gutter, text_style, color, border=0):
+    """Draw text in two balanced columns, top-aligned like the HTML column layout.
+
+    Returns the fit_double_column() result.
+    """
+    text_style = text_style or {}
+    border = border or 0
+    fit = fit_double_column(text, w, h, gutter, text_style, border)
+
+    inner_x = x + border + TEXT_PADDING
+    top = y + h - border - TEXT_PADDING
+    clip_box = _box_clip(ax, x, y, w, h, border)
+    align_h = _text_align_h(text_style)
+    for i, paragraphs in enumerate(fit['columns']):
+        col_x = inner_x + i * (fit['column_width'] + gutter)
+        draw_paragraphs(ax, col_x, fit['column_width'], top, paragraphs,
+                        fit['font'], fit['size'], color, align_h, clip_box)
+    return fit
+
+
+@METRICS.timed('image_decode')
+def load_cover_image(image_path, box_w_px, box_h_px):
+    """Decode image_path cropped like CSS object-fit: cover for a box_w_px x box_h_px box.
+
+    The centered crop is scaled to the box (never upscaled) and returned as an RGB array.
+    JPEG sources are decoded at reduced scale and other formats are shrunk with
+    Image.reduce before the final resample, so a press-size box never costs a full-size
+    resample of a large master.
+    """
+    with Image.open(image_path) as im:
+        scale = max(box_w_px / im.width, box_h_px / im.height)
+        if scale < 1:
+            im.draft('RGB', (round(im.width * scale), round(im.height * scale)))
+            scale = max(box_w_px / im.width, box_h_px / im.height)
+        crop_w, crop_h = box_w_px / scale, box_h_px / scale
+        left, top = (im.width - crop_w) / 2, (im.height - crop_h) / 2
+        size = (box_w_px, box_h_px) if scale < 1 else (max(1, round(crop_w)), max(1, round(crop_h)))
+        if im.mode.startswith('I;16') or im.mode == 'I':
+            im = im.point(lambda v: v * (1 / 256)).convert('L')
+        elif im.mode not in ('RGB', 'RGBA', 'L'):
+            im = im.convert('RGB')
+        im = im.resize(size, Image.LANCZOS, box=(left, top, left + crop_w, top + crop_h), reducing_gap=3.0)
+        return np.asarray(im.convert('RGB'))
+
+
+def render_print_page(side, layout, theme, image_path=None, text_content=None, dpi=DPI):
+    """Render one side of a layout at its paper size, as it will be printed.
+
+    Args:
+        side: 'front' or 'back'
+        layout: Layout dict
+        theme: Theme dict for this side
+        image_path: Image for the front image box (ignored for the back)
+        text_content: Caption text (front) or personal note text (back)
+        dpi: Render resolution
+
+    Returns:
+        Matplotlib figure sized to layout['paper_size']. Caller closes it.
+    """
+    paper_w = layout['paper_size']['width']
+    paper_h = layout['paper_size']['height']
+
+    if side == 'front':
+        paper_style, img_style, caption_style, font_color = build_front_styles(layout, theme)
+    else:
+        paper_style, note_style, font_color = build_back_styles(layout, theme)
+
+    fig, ax, paper_x, paper_y, _ = setup_canvas(paper_w, paper_h, paper_style, "print", dpi=dpi)
+    draw_paper(ax, paper_x, paper_y, paper_w, paper_h, paper_style, "print")
+    text_color = font_color if font_color else '#000000'
+
+    if side == 'front':
+        front = layout.get('front', {})
+        img_w = front['img_dims']['width']
+        img_h = front['img_dims']['height']
+        img_x = front['img_pos']['left']
+        img_y = paper_h - front['img_pos']['top'] - img_h
+
+        def render_image():
+            # A source that can't be decoded raises: a press page with an empty image
+            # box must fail its entry, not go to print
+            if image_path and os.path.exists(image_path):
+                ax.imshow(load_cover_image(image_path, round(img_w * dpi), round(img_h * dpi)),
+                          extent=[img_x, img_x + img_w, img_y, img_y + img_h], aspect='auto', zorder=2)
+        draw_content_block(ax, img_x, img_y, img_w, img_h, img_style, render_image)
+
+        caption_w = front['caption_dims']['width']
+        caption_h = front['caption_dims']['height']
+        caption_x = front['caption_pos']['left']
+        caption_y = paper_h - front['caption_pos']['top'] - caption_h
+        text_style = front.get('text_style', {})
+
+        caption_border = front.get('border_widths', {}).get('caption')
+
+        def render_caption():
+            if not text_content:
+                return
+            if front.get('special') == 'double_col':
+                draw_double_column_text(ax, caption_x, caption_y, caption_w, caption_h, text_content,
+                                        layout_gutter(front), text_style, text_color, caption_border)
+            else:
+                draw_box_text(ax, caption_x, caption_y, caption_w, caption_h, text_content,
+                              text_style, text_color, caption_border)
+        draw_content_block(ax, caption_x, caption_y, caption_w, caption_h, caption_style, render_caption)
+    else:
+        back = layout.get('back', {})
+        note_dims = back.get('note_dims', {'width': 6, 'height': 9})
+        note_w = note_dims['width']
+        note_h = note_dims['height']
+        note_x = (paper_w - note_w) / 2
+        note_y = (paper_h - note_h) / 2
+        text_style = back.get('text_style', {})
+
+        def render_note():
+            if text_content:
+                draw_box_text(ax, note_x, note_y, note_w, note_h, text_content,
+                              text_style, text_color, back.get('border_widths', {}).get('note'))
+        draw_content_block(ax, note_x, note_y, note_w, note_h, note_style, render_note)
+
+    ax.axis('off')
+    return fig
+
+
+# --- PDF OUTPUT ---
+
+def figure_to_image(fig, crop=None):
+    """Draw a figure on its Agg canvas and return it as an RGB PIL image.
+
+    crop is an optional (left, upper, right, lower) pixel box.
+    """
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    image = Image.frombuffer('RGBA', (width, height), fig.canvas.buffer_rgba())
+    if crop:
+        image = image.crop(crop)
+    return image.convert('RGB')
+
+
+class StreamingPdfWriter:
+    """Write a multi-page PDF one raster page at a time.
+
+    Each page is JPEG-encoded and flushed to disk as soon as it is added, so
+    memory use is bounded by a single page regardless of how many pages the
+    document ends up with. Only the page tree and xref table are written at
+    close().
+    """
+
+    def __init__(self, path, jpeg_quality=90):
+        self.path = path
+        self.jpeg_quality = jpeg_quality
+        self._fh = open(path, 'wb')
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3  # 1 = catalog, 2 = page tree
+        self.page_log = None  # A list collects each page's (jpeg, width_px, height_px, width_in, height_in)
+        self._fh.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _reserve(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._fh.tell()
+        self._fh.write(f'{obj_id} 0 obj\n'.encode('ascii'))
+        self._fh.write(body.encode('ascii'))
+        if stream is not None:
+            self._fh.write(b'\nstream\n')
+            self._fh.write(stream)
+            self._fh.write(b'\nendstream')
+        self._fh.write(b'\nendobj\n')
+
+    def add_page(self, image, width_in, height_in):
+        """Append a page showing `image` scaled to width_in x height_in inches."""
+        buf = io.BytesIO()
+        image.convert('RGB').save(buf, format='JPEG', quality=self.jpeg_quality)
+        self.add_jpeg(buf.getvalue(), image.width, image.height, width_in, height_in)
+
+    def add_jpeg(self, jpeg, width_px, height_px, width_in, height_in):
+        """Append a page from an already-encoded RGB JPEG (e.g. saved by an earlier run)."""
+        if self.page_log is not None:
+            self.page_log.append((jpeg, width_px, height_px, width_in, height_in))
+        page_w = width_in * 72
+        page_h = height_in * 72
+        image_id, content_id, page_id = self._reserve(), self._reserve(), self._reserve()
+
+        self._write_object(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {width_px} /Height {height_px} '
+            f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>'
+        ), jpeg)
+        content = f'q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self._write_object(content_id, f'<< /Length {len(content)} >>', content)
+        self._write_object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ))
+        self._page_ids.append(page_id)
+        self._fh.flush()
+
+    def add_figure(self, fig, width_in=None, height_in=None):
+        """Render a matplotlib figure and append it as a page."""
+        fig_w, fig_h = fig.get_size_inches()
+        self.add_page(figure_to_image(fig), width_in or fig_w, height_in or fig_h)
+
+    def close(self):
+        """Write the page tree, catalog and xref table and close the file."""
+        if self._fh.closed:
+            return
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>')
+        self._write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self._fh.tell()
+        self._fh.write(f'xref\n0 {self._next_id}\n'.encode('ascii'))
+        self._fh.write(b'0000000000 65535 f \n')
+        for obj_id in range(1, self._next_id):
+            self._fh.write(f'{self._offsets[obj_id]:010d} 00000 n \n'.encode('ascii'))
+        self._fh.write((
+            f'trailer\n<< /Size {self._next_id} /Root 1 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n'
+        ).encode('ascii'))
+        self._fh.close()
+
+
+def write_pdf_pages(pdf_writer, layout, front_theme, back_theme, image_path,
+                    text_content, note_content, dpi=DPI):
+    """Render the front and back of one batch entry and append them to a PDF."""
+    paper_w = layout['paper_size']['width']
+    paper_h = layout['paper_size']['height']
+
+    for side, theme, content in (('front', front_theme, text_content),
+                                 ('back', back_theme, note_content)):
+        fig = render_print_page(side, layout, theme, image_path=image_path,
+                                text_content=content, dpi=dpi)
+        pdf_writer.add_figure(fig, paper_w, paper_h)
+
+
+PDF_PAGE_DIR = 'pdf_pages'  # Each entry's encoded all.pdf pages, reused by --resume
+
+
+def save_pdf_pages(pages, output_dir, output_name):
+    """Write an entry's encoded pages (a StreamingPdfWriter.page_log) into output_dir/pdf_pages.
+
+    Returns [filename, width_px, height_px, width_in, height_in] per page, for the journal.
+    """
+    os.makedirs(os.path.join(output_dir, PDF_PAGE_DIR), exist_ok=True)
+    saved = []
+    for number, (jpeg, width_px, height_px, width_in, height_in) in enumerate(pages, 1):
+        name = f"{PDF_PAGE_DIR}/{output_name}_{number}.jpg"
+        with open(os.path.join(output_dir, name), 'wb') as f:
+            f.write(jpeg)
+        saved.append([name, width_px, height_px, width_in, height_in])
+    return saved
+
+
+def add_saved_pdf_pages(pdf_writer, pages, output_dir):
+    """Append pages written by save_pdf_pages without re-rendering them.
+
+    Returns False, adding nothing, if any page file is gone.
+    """
+    paths = [os.path.join(output_dir, page[0]) for page in pages]
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    for path, (_, width_px, height_px, width_in, height_in) in zip(paths, pages):
+        with open(path, 'rb') as f:
+            pdf_writer.add_jpeg(f.read(), width_px, height_px, width_in, height_in)
+    return True
+
+
+THUMBNAIL_DISPLAY_WIDTH = THUMBNAIL_WIDTH // 2  # CSS px; thumbnails stay sharp on 2x displays
+
+
+def blueprint_img_html(blueprint_img, output_dir, sink=None):
+    """Blueprint markup for all.html: the thumbnail if one exists, linked to the full PNG."""
+    thumb = thumbnail_filename(blueprint_img)
+    thumb_path = os.path.join(output_dir, thumb)
+    if sink is not None:
+        has_thumb = thumb in sink.image_sizes
+    else:
+        has_thumb = os.path.exists(thumb_path)
+    if not has_thumb:
+        return f'<div class="blueprint"><img src="{blueprint_img}" alt="Blueprint" loading="lazy" decoding="async"></div>'
+
+    if sink is not None:
+        thumb_w, thumb_h = sink.image_sizes[thumb]
+        full_w = sink.image_sizes[blueprint_img][0]
+    else:
+        with Image.open(thumb_path) as im:
+            thumb_w, thumb_h = im.size
+        with Image.open(os.path.join(output_dir, blueprint_img)) as im:
+            full_w = im.width
+    return (
+        f'<div class="blueprint"><a href="{blueprint_img}" target="_blank">'
+        f'<img class="thumb" src="{thumb}" srcset="{thumb} {thumb_w}w, {blueprint_img} {full_w}w" '
+        f'sizes="(max-width: {THUMBNAIL_DISPLAY_WIDTH}px) 100vw, {THUMBNAIL_DISPLAY_WIDTH}px" '
+        f'width="{thumb_w}" height="{thumb_h}" loading="lazy" decoding="async" alt="Blueprint"></a></div>'
+    )
+
+
+def combined_section_html(path, output_dir, sink=None):
+    """Extract one entry's pages and blueprint from its HTML file as an all.html section.
+
+    With a sink (ArchiveWriter) the file is read back from the sink rather than output_dir.
+
+    Returns (layout_name, section_html), or None if the file has no pages container.
+    """
+    if sink is not None:
+        content = sink.read(os.path.relpath(path, output_dir)).decode('utf-8')
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+    # Extract layout name from filename
+    layout_name = os.path.splitext(os.path.basename(path))[0]
+
+    # Extract the pages-container content (greedy match to get all nested divs)
+    match = re.search(r'<div class="pages-container">(.*)</div>\s*\n\s*<!-- Blueprint -->', content, re.DOTALL)
+    if not match:
+        return None
+    # Images only load/decode once their section nears the viewport
+    pages_content = match.group(1).replace('<img src=', '<img loading="lazy" decoding="async" src=')
+
+    # Extract the blueprint image
+    blueprint_match = re.search(r'<div class="blueprint">.*?<img src="([^"]+)"', content, re.DOTALL)
+    blueprint_html = blueprint_img_html(blueprint_match.group(1), output_dir, sink) if blueprint_match else ''
+
+    return layout_name, f'''
+    <!-- {layout_name} -->
+    <div class="layout-section" id="{layout_name}">
+        <div class="layout-header">{layout_name}</div>
+        <div class="pages-row">
+            {pages_content}
+        </div>
+        {blueprint_html}
+    </div>'''
+
+
+def all_html_page_name(page_number, page_count):
+    """Filename of one all.html chunk (all.html itself when there is only one)."""
+    return 'all.html' if page_count == 1 else f'all_{page_number:03d}.html'
+
+
+def combined_html_document(title, body):
+    """Wrap all.html body markup in the shared document shell and styles."""
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+    <style>
+        * {{ box-sizing: border-box; margin: 0; padding: 0; }}
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
+            background: #ecf0f1;
+            padding: 20px;
+        }}
+        .layout-section {{
+            margin-bottom: 40px;
+            scroll-margin-top: 20px;
+            content-visibility: auto;  /* skip layout/paint until scrolled near */
+            contain-intrinsic-size: auto 1800px;
+        }}
+        .layout-header {{
+            background: #2c3e50;
+            color: white;
+            padding: 10px 20px;
+            font-size: 14px;
+            font-weight: bold;
+            border-radius: 4px 4px 0 0;
+            position: sticky;
+            top: 0;
+            z-index: 10;
+        }}
+        .pages-row {{
+            display: flex;
+            flex-wrap: wrap;
+            justify-content: center;
+            gap: 20px;
+            padding: 20px;
+            background: #ddd;
+            border-radius: 0 0 4px 4px;
+        }}
+        .page {{
+            position: relative;
+            overflow: hidden;
+            flex-shrink: 0;
+        }}
+        .image-box img {{
+            width: 100%;
+            height: 100%;
+            object-fit: cover;
+        }}
+        p {{
+            margin: 0 0 0.5em 0;
+        }}
+        p:last-child {{
+            margin-bottom: 0;
+        }}
+        .nav-sidebar {{
+            position: fixed;
+            right: 20px;
+            top: 20px;
+            background: rgba(44, 62, 80, 0.9);
+            padding: 10px;
+            border-radius: 4px;
+            max-height: 90vh;
+            overflow-y: auto;
+            z-index: 100;
+            font-size: 11px;
+        }}
+        .nav-link {{
+            display: block;
+            color: #ecf0f1;
+            text-decoration: none;
+            padding: 4px 8px;
+            border-radius: 2px;
+        }}
+        .nav-link:hover {{
+            background: #3498db;
+        }}
+        .blueprint {{
+            text-align: center;
+            padding: 20px;
+            background: #ccc;
+            margin-top: 10px;
+        }}
+        .blueprint img {{
+            max-width: 100%;
+            height: auto;
+            box-shadow: 0 0 10px rgba(0,0,0,0.2);
+        }}
+        .blueprint img.thumb {{
+            max-width: min(100%, {THUMBNAIL_DISPLAY_WIDTH}px);
+            cursor: zoom-in;
+        }}
+        .pager {{
+            display: flex;
+            gap: 12px;
+            align-items: center;
+            justify-content: center;
+            margin-bottom: 20px;
+            font-size: 14px;
+        }}
+        .pager a {{
+            color: #2c3e50;
+        }}
+        .index-page {{
+            background: white;
+            padding: 20px 30px;
+            border-radius: 4px;
+            max-width: 900px;
+            margin: 0 auto;
+        }}
+        .index-page h2 {{
+            font-size: 16px;
+            margin: 16px 0 6px;
+        }}
+        .index-page a {{
+            display: block;
+            color: #2c3e50;
+            font-size: 13px;
+            padding: 2px 0;
+        }}
+    </style>
+</head>
+<body>
+{body}
 </body>
 </html>
 '''
 
-    all_path = os.path.join(output_dir, 'all.html')
-    with open(all_path, 'w', encoding='utf-8') as f:
-        f.write(html)
 
-    print(f"Generated: {all_path}")
+def generate_combined_html(html_files, output_dir, page_size=ALL_HTML_PAGE_SIZE, sink=None):
+    """Generate all.html: every layout in continuous scrollable sequence.
+
+    Batches larger than page_size are split into all_001.html, all_002.html, ...
+    chunks with prev/next links, and all.html becomes a lightweight index of every
+    entry. Each chunk is written as soon as it is built, so memory tracks one chunk.
+    Sections use `content-visibility: auto` and images load lazily, so a chunk only
+    lays out, paints and decodes what is near the viewport. With a sink (ArchiveWriter)
+    entry HTML is read from and the pages are written to the archive.
+    """
+    page_size = max(1, page_size or len(html_files) or 1)
+    chunks = [html_files[i:i + page_size] for i in range(0, len(html_files), page_size)] or [[]]
+    page_count = len(chunks)
+    index_links = []
+
+    def write_page(name, title, body):
+        document = combined_html_document(title, body)
+        if sink is not None:
+            sink.write(name, document.encode('utf-8'))
+        else:
+            with open(os.path.join(output_dir, name), 'w', encoding='utf-8') as f:
+                f.write(document)
+
+    # Drop chunks left by an earlier, larger run into the same directory
+    if sink is None:
+        for stale in glob.glob(os.path.join(output_dir, 'all_[0-9][0-9][0-9].html')):
+            os.remove(stale)
+
+    for page_number, chunk in enumerate(chunks, 1):
+        page_name = all_html_page_name(page_number, page_count)
+        sections = [section for section in (combined_section_html(path, output_dir, sink) for path in chunk)
+                    if section]
+
+        # Build navigation
+        nav_items = '\n'.join(f'<a href="#{name}" class="nav-link">{name}</a>' for name, _ in sections)
+        pager = ''
+        if page_count > 1:
+            prev_link = (f'<a href="{all_html_page_name(page_number - 1, page_count)}">&laquo; Previous</a>'
+                         if page_number > 1 else '<span>&laquo; Previous</span>')
+            next_link = (f'<a href="{all_html_page_name(page_number + 1, page_count)}">Next &raquo;</a>'
+                         if page_number < page_count else '<span>Next &raquo;</span>')
+            pager = (f'<div class="pager">{prev_link} <a href="all.html">Index</a> '
+                     f'<span>Page {page_number} of {page_count}</span> {next_link}</div>')
+            index_links.append(f'<h2><a href="{page_name}">Page {page_number}</a></h2>\n' + '\n'.join(
+                f'<a href="{page_name}#{name}">{name}</a>' for name, _ in sections))
+
+        body = f'''    <div class="nav-sidebar">
+        <strong style="color: white; display: block; margin-bottom: 8px;">Jump to:</strong>
+        {nav_items}
+    </div>
+    {pager}
+    {''.join(section for _, section in sections)}
+    {pager}'''
+        title = 'All Layouts - Continuous Scroll'
+        if page_count > 1:
+            title += f' (page {page_number} of {page_count})'
+        write_page(page_name, title, body)
+        if page_count > 1:
+            print(f"Generated: {output_label(output_dir, page_name, sink)}")
+
+    all_path = os.path.join(output_dir, 'all.html')
+    if page_count > 1:
+        body = f'''    <div class="index-page">
+        <strong>{len(html_files)} layouts in {page_count} pages</strong>
+        {chr(10).join(index_links)}
+    </div>'''
+        write_page('all.html', 'All Layouts - Index', body)
+
+    print(f"Generated: {output_label(output_dir, 'all.html', sink)}")
     return all_path
 
 
-# Run Generator
-if __name__ == "__main__":
-    print(f"PrintLayoutDesigner v{VERSION}")
+# --- PRINT RASTER OUTPUT ---
+# mode "print" writes each entry's front and back at press resolution as files a RIP
+# accepts directly. Entries render and encode in worker processes while the main process
+# carries on with blueprints and HTML, then writes the files it gets back.
 
-    batch_path = sys.argv[1] if len(sys.argv) > 1 else 'production/batch.json'
-    batch_dir = os.path.dirname(batch_path) or '.'
-    output_dir = os.path.join(batch_dir, 'output')
+PRINT_FORMATS = {'tiff': '.tif', 'png': '.png'}
 
-    # Clear output directory
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
 
-    batch_entries, mode, image_path_landscape, image_path_portrait, text_path, personal_note_path, show_blueprints = load_batch(batch_path)
+def print_page_filename(output_name, side, fmt='tiff'):
+    """Filename of one printed side, e.g. 'order-1_front.tif'."""
+    return f"{output_name}_{side}{PRINT_FORMATS[fmt]}"
 
-    if not batch_entries:
-        print(f"Error: No entries in {batch_path} batch list.")
-        sys.exit(1)
 
-    # Load text content for HTML output
-    text_content = None
-    note_content = None
-    if text_path and os.path.exists(text_path):
-        with open(text_path, 'r') as f:
-            text_content = f.read().strip()
-    if personal_note_path and os.path.exists(personal_note_path):
-        with open(personal_note_path, 'r') as f:
-            note_content = f.read().strip()
+def print_page_bytes(layout, dpi=PRINT_DPI):
+    """Estimated peak memory of rendering and encoding one printed side."""
+    width_px = layout['paper_size']['width'] * dpi
+    height_px = layout['paper_size']['height'] * dpi
+    return int(width_px * height_px * (4 + 3))  # Agg RGBA canvas + RGB copy for the encoder
+
+
+def encode_print_pages(layout, front_theme, back_theme, image_path, text_content, note_content,
+                       output_name, dpi=PRINT_DPI, fmt='tiff'):
+    """Render the front and back of one entry at press resolution and encode them.
+
+    TIFFs are LZW-compressed; both formats carry the DPI so the RIP places them at paper
+    size. Module-level so it can run in a worker process; the caller writes the result
+    with save_print_pages().
+
+    Returns list of (filename, encoded bytes).
+    """
+    pages = []
+    for side, theme, content in (('front', front_theme, text_content), ('back', back_theme, note_content)):
+        image = figure_to_image(render_print_page(side, layout, theme, image_path=image_path,
+                                                  text_content=content, dpi=dpi))
+        buffer = io.BytesIO()
+        if fmt == 'tiff':
+            image.save(buffer, format='TIFF', compression='tiff_lzw', dpi=(dpi, dpi))
+        else:
+            image.save(buffer, format='PNG', dpi=(dpi, dpi))
+        pages.append((print_page_filename(output_name, side, fmt), buffer.getvalue()))
+    return pages
+
+
+def save_print_pages(pages, output_dir, sink=None):
+    """Write encode_print_pages() results to output_dir, or into a sink (ArchiveWriter).
+
+    Returns list of filenames (relative to output_dir).
+    """
+    for filename, data in pages:
+        if sink is not None:
+            sink.write(filename, data)
+        else:
+            path = os.path.join(output_dir, filename)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        print(f"Generated: {output_label(output_dir, filename, sink)} ({len(data) // 1024} KB)")
+    return [filename for filename, _ in pages]
+
+
+# --- ARCHIVE OUTPUT ---
+# With `archive` set, a batch's deliverables (entry HTML, blueprints, thumbnails, print
+# pages, all.html and the web images they use) are streamed into one .zip or .tar as each
+# entry completes, instead of being written to output/ and packed in a second pass.
+
+ARCHIVE_FORMATS = {'zip': '.zip', 'tar': '.tar'}
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.pdf')  # Already compressed
+ARCHIVE_SPOOL_BYTES = 32 << 20  # Tar members bigger than this spool to disk until their size is known
+
+
+class _CountingWriter:
+    """Write-only file wrapper that counts bytes, for encoders that report tell()."""
+
+    def __init__(self, fh):
+        self._fh = fh
+        self._bytes = 0
+
+    def write(self, data):
+        self._bytes += len(data)
+        return self._fh.write(data)
+
+    def tell(self):
+        return self._bytes
+
+    def flush(self):
+        self._fh.flush()
+
+
+class ArchiveWriter:
+    """Stream output files into a .zip or .tar archive.
+
+    open(name) yields a write-only file whose bytes go straight into a zip member:
+    stored for formats that are already compressed, deflated otherwise. A tar header
+    carries the member's size, so tar members are spooled until closed (in memory up to
+    ARCHIVE_SPOOL_BYTES). The archive is built as <path>.tmp and renamed by close(), so
+    a failed run never leaves a truncated archive under the final name.
+
+    Entry HTML written with keep=True stays readable through read(), and writers record
+    blueprint sizes in image_sizes, so all.html is assembled without a pass over the
+    archive.
+    """
+
+    def __init__(self, path, fmt='zip'):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format {fmt!r}; expected one of {tuple(ARCHIVE_FORMATS)}")
+        self.path = path
+        self.fmt = fmt
+        self.names = set()
+        self.image_sizes = {}
+        self._tmp_path = f"{path}.tmp"
+        if fmt == 'zip':
+            self._archive = zipfile.ZipFile(self._tmp_path, 'w')
+        else:
+            self._archive = tarfile.open(self._tmp_path, 'w')
+        self._kept = {}
+        self._kept_fh = tempfile.TemporaryFile()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+    def _compress_type(self, name):
+        return zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+    @contextlib.contextmanager
+    def open(self, name):
+        """Context manager yielding a binary file that becomes archive member `name`."""
+        self.names.add(name)
+        if self.fmt == 'zip':
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = self._compress_type(name)
+            info.external_attr = 0o644 << 16
+            # Sizes aren't known up front; zip64 headers let any member pass 2 GiB
+            with self._archive.open(info, 'w', force_zip64=True) as fh:
+                yield _CountingWriter(fh)
+        else:
+            with tempfile.SpooledTemporaryFile(ARCHIVE_SPOOL_BYTES) as fh:
+                yield _CountingWriter(fh)
+                info = tarfile.TarInfo(name)
+                info.size = fh.tell()
+                info.mtime = time.time()
+                info.mode = 0o644
+                fh.seek(0)
+                self._archive.addfile(info, fh)
+
+    def write(self, name, data, keep=False):
+        """Add member `name` with bytes `data`; keep=True also keeps it for read()."""
+        with self.open(name) as fh:
+            fh.write(data)
+        if keep:
+            self._kept_fh.seek(0, os.SEEK_END)
+            self._kept[name] = (self._kept_fh.tell(), len(data))
+            self._kept_fh.write(data)
+
+    def read(self, name):
+        """Bytes of a member written with keep=True."""
+        offset, size = self._kept[name]
+        self._kept_fh.seek(offset)
+        return self._kept_fh.read(size)
+
+    def add_file(self, name, path):
+        """Copy a file from disk (e.g. a cached web image) in as member `name`, once."""
+        if name in self.names:
+            return
+        self.names.add(name)
+        if self.fmt == 'zip':
+            self._archive.write(path, name, compress_type=self._compress_type(name))
+        else:
+            self._archive.add(path, arcname=name)
+
+    def close(self, discard=False):
+        """Finish the archive and move it into place (or delete it if discard)."""
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive = None
+        self._kept_fh.close()
+        if discard:
+            os.remove(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, self.path)
+
+
+@contextlib.contextmanager
+def open_output(output_dir, name, sink=None):
+    """Open output file `name` for binary writing: in output_dir, or as a member of sink."""
+    if sink is not None:
+        with sink.open(name) as fh:
+            yield fh
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, name), 'wb') as fh:
+            yield fh
+
+
+def output_label(output_dir, name, sink=None):
+    """Where an output went, for progress messages (e.g. 'output/batch.zip/x.html')."""
+    return os.path.join(sink.path if sink is not None else output_dir, name)
+
+
+# --- WEB IMAGE DERIVATIVES ---
+# Source photos are print masters (often multi-hundred-MB TIFFs). HTML output points at
+# JPEG/WebP copies sized for screens instead; print/PDF rendering keeps the originals.
+
+WEB_IMAGE_DIR = 'web_images'  # Cache directory inside output/ (kept between runs)
+WEB_IMAGE_QUALITY = 82
+WEB_IMAGE_FORMATS = {'jpeg': '.jpg', 'webp': '.webp'}
+EXIF_ORIENTATION = 0x0112  # EXIF tag: how a camera image must be turned to display upright
+HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_SOURCE_HASH_INDEXES = {}  # cache_dir -> {source path: index record}, loaded once per process
+_SOURCE_HASH_LOCK = threading.Lock()
+
+
+def _source_hash_index(cache_dir):
+    """In-memory view of cache_dir/index.jsonl (later lines win)."""
+    index = _SOURCE_HASH_INDEXES.get(cache_dir)
+    if index is None:
+        index = {}
+        index_path = os.path.join(cache_dir, 'index.jsonl')
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line of an interrupted run
+                    index[record['path']] = record
+        _SOURCE_HASH_INDEXES[cache_dir] = index
+    return index
+
+
+def source_hash(image_path, cache_dir):
+    """Return SHA-256 of a source image, memoized in cache_dir/index.jsonl by size and mtime.
+
+    The index is append-only, so streaming batches with many distinct images add one
+    line per new source instead of rewriting the whole index.
+    """
+    path = os.path.abspath(image_path)
+    stat = os.stat(path)
+    with _SOURCE_HASH_LOCK:
+        entry = _source_hash_index(cache_dir).get(path)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        METRICS.inc('source_hashes_cache_hits')
+        return entry['sha256']
+    METRICS.inc('source_hashes_cache_misses')
+
+    record = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+    os.makedirs(cache_dir, exist_ok=True)
+    with _SOURCE_HASH_LOCK:
+        _source_hash_index(cache_dir)[path] = record
+        with open(os.path.join(cache_dir, 'index.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    return record['sha256']
+
+
+def web_image_size(src_w, src_h, box_w_px, box_h_px):
+    """Pixel size that covers a box (object-fit: cover) without upscaling the source."""
+    scale = min(1.0, max(box_w_px / src_w, box_h_px / src_h))
+    return max(1, round(src_w * scale)), max(1, round(src_h * scale))
+
+
+def make_web_image(image_path, box_w, box_h, cache_dir, fmt='jpeg', dpi=WEB_IMAGE_DPI,
+                   quality=WEB_IMAGE_QUALITY):
+    """Return path of a cached screen-size copy of image_path for a box_w x box_h inch slot.
+
+    Derivatives are named by source hash, box size, format and quality, so an unchanged
+    source is decoded at most once across runs and edited sources never hit stale copies.
+    """
+    box_w_px, box_h_px = round(box_w * dpi), round(box_h * dpi)
+    stem = re.sub(r'[^\w.-]+', '_', Path(image_path).stem)
+    digest = source_hash(image_path, cache_dir)[:16]
+    out_path = os.path.join(cache_dir, f"{stem}_{digest}_{box_w_px}x{box_h_px}_q{quality}{WEB_IMAGE_FORMATS[fmt]}")
+    if os.path.exists(out_path):
+        METRICS.inc('web_images_cache_hits')
+        return out_path
+    METRICS.inc('web_images_cache_misses')
+
+    with METRICS.timer('image_decode'), Image.open(image_path) as im:
+        # Browsers show the source turned upright by its EXIF orientation; the copy is
+        # written upright (it carries no EXIF), so size it in display orientation
+        orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        src_w, src_h = (im.height, im.width) if rotated else im.size
+        size = web_image_size(src_w, src_h, box_w_px, box_h_px)
+        im.draft('RGB', size[::-1] if rotated else size)  # JPEG sources decode at reduced scale
+        if orientation != 1:
+            im = ImageOps.exif_transpose(im)
+        if im.mode.startswith('I;16') or im.mode == 'I':
+            im = im.point(lambda v: v * (1 / 256)).convert('L')
+        im = im.convert('RGB')
+        if im.size != size:
+            im = im.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    im.save(tmp_path, format=fmt.upper(), quality=quality, optimize=fmt == 'jpeg')
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def build_web_images(image_boxes, output_dir, fmt='jpeg', dpi=WEB_IMAGE_DPI):
+    """Make web derivatives for {image_path: (max_w, max_h)} and return {image_path: relative src}.
+
+    Missing or unreadable sources are left out, so HTML falls back to the original path.
+    """
+    cache_dir = os.path.join(output_dir, WEB_IMAGE_DIR)
+    web_images = {}
+    for image_path, (box_w, box_h) in image_boxes.items():
+        if not image_path or not os.path.exists(image_path):
+            continue
+        start = time.perf_counter()
+        try:
+            web_path = make_web_image(image_path, box_w, box_h, cache_dir, fmt, dpi)
+        except (OSError, Image.DecompressionBombError) as e:
+            print(f"Warning: could not make web image for {image_path}: {e}")
+            continue
+        web_images[image_path] = os.path.relpath(web_path, output_dir)
+        print(f"Web image: {web_images[image_path]} ({os.path.getsize(web_path) // 1024} KB, "
+              f"{time.perf_counter() - start:.2f}s)")
+    return web_images
+
+
+def clear_output_dir(output_dir, keep=(WEB_IMAGE_DIR,)):
+    """Remove everything in output_dir except cache directories listed in keep."""
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name in keep:
+            continue
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+# --- SHARDING AND MANIFESTS ---
+# A batch can be split across machines with --shard i/N. Each shard renders its share of
+# entries and writes a manifest; `merge` combines manifests into one all.html without
+# re-rendering. Unsharded runs write manifest.json too.
+
+MANIFEST_VERSION = 1
+
+
+def parse_shard(shard):
+    """Parse 'i/N' (1 <= i <= N) into (i, N); None passes through."""
+    if shard is None:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(shard))
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f"Invalid shard '{shard}': expected i/N with 1 <= i <= N")
+    return int(match.group(1)), int(match.group(2))
+
+
+def entry_key(entry):
+    """Stable identity of a batch entry: its layout and theme filenames, plus its name if set."""
+    key = f"{entry.get('layout')}|{entry.get('front_theme')}|{entry.get('back_theme')}"
+    return f"{key}|{entry['name']}" if entry.get('name') else key
+
+
+def entry_shard(entry, shard_count):
+    """Shard number (1-based) an entry belongs to; stable across machines and Python runs."""
+    digest = hashlib.sha1(entry_key(entry).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count + 1
+
+
+def manifest_filename(shard=None):
+    """manifest.json, or manifest-{i}-of-{N}.json for a shard."""
+    return f"manifest-{shard[0]}-of-{shard[1]}.json" if shard else 'manifest.json'
+
+
+def write_manifest(output_dir, batch_path, shard, total_entries, entries, pdf_path=None):
+    """Write the run manifest (entry outputs relative to output_dir) and return its path."""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'generator': f"PrintLayoutDesigner v{VERSION}",
+        'batch': os.path.abspath(batch_path),
+        'shard': list(shard) if shard else None,
+        'total_entries': total_entries,
+        'entries': entries,
+        'pdf': os.path.relpath(pdf_path, output_dir) if pdf_path else None,
+    }
+    manifest_path = os.path.join(output_dir, manifest_filename(shard))
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+def merge_manifests(output_dir, manifest_paths=None, page_size=ALL_HTML_PAGE_SIZE):
+    """Combine shard manifests in output_dir into manifest.json and all.html.
+
+    Entries are ordered as in the original batch. Nothing is re-rendered: shard
+    outputs must already be in output_dir (e.g. copied there from each machine).
+
+    Returns dict with 'manifest', 'all_html', 'entries' and 'missing_shards'.
+    Raises ValueError if no shard manifests are found or they disagree.
+    """
+    if manifest_paths is None:
+        manifest_paths = sorted(glob.glob(os.path.join(output_dir, 'manifest-*-of-*.json')))
+    if not manifest_paths:
+        raise ValueError(f"No shard manifests found in {output_dir}")
+
+    manifests = []
+    for path in manifest_paths:
+        with open(path, 'r') as f:
+            manifests.append(json.load(f))
+
+    shard_counts = {m['shard'][1] for m in manifests if m.get('shard')}
+    total_entries = {m['total_entries'] for m in manifests}
+    if len(shard_counts) > 1 or len(total_entries) > 1:
+        raise ValueError(f"Manifests come from different sharding runs: shard counts {sorted(shard_counts)}, "
+                         f"entry totals {sorted(total_entries)}")
+    shard_count = shard_counts.pop() if shard_counts else 1
+    present = {m['shard'][0] for m in manifests if m.get('shard')}
+    missing = [i for i in range(1, shard_count + 1) if i not in present]
+
+    entries = {}
+    for manifest in manifests:
+        for entry in manifest['entries']:
+            if entry['index'] in entries:
+                raise ValueError(f"Batch entry {entry['index']} ({entry['key']}) appears in more than one manifest")
+            entries[entry['index']] = entry
+    merged = [entries[i] for i in sorted(entries)]
+
+    html_files = [os.path.join(output_dir, entry['html']) for entry in merged if entry.get('html')]
+    all_path = generate_combined_html(html_files, output_dir, page_size)
+    manifest_path = write_manifest(output_dir, manifests[0]['batch'], None, total_entries.pop(), merged)
+
+    if missing:
+        print(f"Warning: missing manifests for shard(s) {', '.join(map(str, missing))} of {shard_count}")
+    return {'manifest': manifest_path, 'all_html': all_path, 'entries': len(merged), 'missing_shards': missing}
+
+
+# --- MEMORY INSTRUMENTATION ---
+# Opt-in (memory_report / memory_limit_mb). Each entry's stages are wrapped in
+# MemoryMonitor.stage(), which records peak RSS, tracemalloc peak and time, and raises
+# MemoryBudgetExceeded before a stage whose estimate won't fit (the batch runner journals
+# that as a failed entry and moves on). A stage that went over anyway is only flagged.
+
+MEMORY_TOP_ALLOCATIONS = 5  # Allocation sites listed per entry in the report
+IMAGE_DECODE_COPIES = 3     # imread array + imshow's masked copy + resampled output
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """An entry needed, or was about to need, more memory than the configured budget."""
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux /proc; 0 where unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss() in MB (process lifetime peak off Linux)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB elsewhere
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS watermark where supported (Linux 4.0+)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def image_decode_bytes(image_path):
+    """Approximate memory to decode and draw an image via mpimg.imread/imshow, from its header."""
+    if not image_path or not os.path.exists(image_path):
+        return 0
+    with Image.open(image_path) as im:
+        bytes_per_sample = 4 if im.format == 'PNG' else 1  # imread returns float32 for PNG
+        return im.width * im.height * len(im.getbands()) * bytes_per_sample * IMAGE_DECODE_COPIES
+
+
+def raster_bytes(width_in, height_in, dpi, memory_budget_mb=None):
+    """Approximate memory to rasterize and encode a figure (or its bands, when budgeted)."""
+    full = width_in * dpi * height_in * dpi * TILE_BYTES_PER_PIXEL
+    return min(full, memory_budget_mb * 2**20) if memory_budget_mb else full
+
+
+class MemoryMonitor:
+    """Per-entry, per-stage memory watermarks with optional budget enforcement."""
+
+    def __init__(self, limit_mb=None, report=False, top_allocations=MEMORY_TOP_ALLOCATIONS):
+        self.limit_mb = limit_mb
+        self.enabled = bool(limit_mb or report)
+        self.tracing = report
+        self.top_allocations = top_allocations
+        self.entries = []
+        self._entry = None
+        self._snapshot = None
+        self._started_tracing = False
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def begin_entry(self, index, key):
+        if not self.enabled:
+            return
+        self._entry = {'index': index, 'key': key, 'rss_start_mb': round(current_rss_mb(), 1),
+                       'peak_rss_mb': 0.0, 'stages': {}}
+        if self.tracing:
+            self._snapshot = tracemalloc.take_snapshot()
+
+    @contextlib.contextmanager
+    def stage(self, name, estimate_bytes=0):
+        """Measure one stage; enforce the budget before it runs (by estimate).
+
+        A stage that peaks over the budget anyway has already written its outputs, so
+        the overrun is flagged in the report and printed as a warning, not raised.
+        """
+        if not self.enabled or self._entry is None:
+            yield
+            return
+        if self.limit_mb and estimate_bytes:
+            needed = current_rss_mb() + estimate_bytes / 2**20
+            if needed > self.limit_mb:
+                self._entry['stages'][name] = {'skipped': True, 'estimate_mb': round(estimate_bytes / 2**20, 1)}
+                raise MemoryBudgetExceeded(f"{name} would need ~{needed:.0f} MB (budget {self.limit_mb} MB)")
+
+        reset_peak_rss()
+        if self.tracing:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            peak = peak_rss_mb()
+            stats = {'peak_rss_mb': round(peak, 1), 'seconds': round(time.perf_counter() - start, 3)}
+            if estimate_bytes:
+                stats['estimate_mb'] = round(estimate_bytes / 2**20, 1)
+            if self.tracing:
+                stats['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            if self.limit_mb and peak > self.limit_mb:
+                stats['over_budget'] = True
+                print(f"Warning: {self._entry['key']} {name} peaked at {peak:.0f} MB (budget {self.limit_mb} MB)")
+            self._entry['stages'][name] = stats
+            self._entry['peak_rss_mb'] = max(self._entry['peak_rss_mb'], stats['peak_rss_mb'])
+
+    def end_entry(self, status, error=None):
+        if not self.enabled or self._entry is None:
+            return
+        entry, self._entry = self._entry, None
+        entry['status'] = status
+        if error:
+            entry['error'] = error
+        # Figures are reference cycles: collect them so what remains is really retained
+        gc.collect()
+        if self.tracing:
+            # Where memory still held after the entry was allocated (caches, leaks)
+            growth = tracemalloc.take_snapshot().compare_to(self._snapshot, 'lineno')
+            entry['top_allocations'] = [
+                {'where': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 'size_kb': round(stat.size_diff / 1024, 1), 'count': stat.count_diff}
+                for stat in growth[:self.top_allocations] if stat.size_diff > 0
+            ]
+            self._snapshot = None
+        entry['rss_end_mb'] = round(current_rss_mb(), 1)
+        self.entries.append(entry)
+
+    def write_report(self, report_path):
+        """Write memory_report.json and print the heaviest entries."""
+        heaviest = sorted(self.entries, key=lambda e: e['peak_rss_mb'], reverse=True)
+        report = {
+            'generator': f"PrintLayoutDesigner v{VERSION}",
+            'limit_mb': self.limit_mb,
+            'peak_rss_mb': heaviest[0]['peak_rss_mb'] if heaviest else 0.0,
+            'entries': self.entries,
+        }
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Generated: {report_path}")
+        for entry in heaviest[:3]:
+            stage = max(entry['stages'].items(), key=lambda item: item[1].get('peak_rss_mb', 0), default=('-', {}))
+            print(f"  {entry['peak_rss_mb']:7.1f} MB peak  {entry['key']}  (heaviest stage: {stage[0]})")
+        return report_path
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+# --- CHECKPOINT JOURNAL ---
+# Every finished entry is appended to journal.jsonl (fsync'd) with a hash of everything
+# that went into it. `--resume` keeps the output directory and skips entries whose last
+# record is 'ok' with a matching hash and intact outputs; failed entries are retried.
+
+# Config keys that change an entry's blueprint/HTML (PDF pages are rebuilt every run)
+RESUME_CONFIG_KEYS = ('show_blueprints', 'blueprint_dpi', 'thumbnails', 'thumbnail_width', 'png_mode',
+                      'png_compress_level', 'render_memory_mb', 'web_images', 'web_image_format',
+                      'web_image_dpi', 'mode', 'print_dpi', 'print_format')
+
+
+def journal_filename(shard=None):
+    """journal.jsonl, or journal-{i}-of-{N}.jsonl for a shard."""
+    return f"journal-{shard[0]}-of-{shard[1]}.jsonl" if shard else 'journal.jsonl'
+
+
+def entry_input_hash(input_paths, text_content, note_content, image_paths, render_config, cache_dir):
+    """Hash of one entry's inputs: layout/theme files, text, source images and render settings."""
+    digest = hashlib.sha256(VERSION.encode('utf-8'))
+    for path in input_paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    for text in (text_content, note_content):
+        digest.update(b'\0' + (text or '').encode('utf-8'))
+    for path in image_paths:
+        digest.update(b'\0' + (source_hash(path, cache_dir) if path and os.path.exists(path) else '').encode())
+    digest.update(json.dumps(render_config, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_journal(journal_path):
+    """Return {batch index: last journal record}. A torn final line (crash mid-write) is ignored."""
+    records = {}
+    if not os.path.exists(journal_path):
+        return records
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['index']] = record
+    return records
+
+
+def journal_record_done(record, input_hash, output_dir):
+    """True if a journal record is a success for the same inputs and its outputs still exist."""
+    return (record is not None and record['status'] == 'ok' and record['input_hash'] == input_hash
+            and all(os.path.exists(os.path.join(output_dir, path)) for path in record['outputs']))
+
+
+class CheckpointJournal:
+    """Append-only JSONL journal; each record is flushed and fsync'd before returning."""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, **fields):
+        fields['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        self._file.write(json.dumps(fields) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# --- MAIL MERGE ---
+# Fills get_html_template() pages from a stream of order records (CSV or JSONL), one
+# record at a time. Templates are compiled once per (layout, front theme, back theme)
+# and caption/note Markdown is rendered once per unique text; both caches are bounded,
+# so memory stays flat however many records stream through.
+
+MAIL_MERGE_CACHE_SIZE = 256  # Compiled templates / rendered texts kept in memory
+
+
+def iter_records(records_path):
+    """Yield order records (dicts) from a .csv (header row) or .jsonl file, one at a time."""
+    with open(records_path, 'r', encoding='utf-8', newline='') as f:
+        if records_path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if v not in (None, '')}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def compile_template(html):
+    """Split an HTML template into literal and placeholder parts for fast repeated filling.
+
+    Returns dict with 'document' (whole page) and 'body' (just the pages, for combined
+    output) part lists; odd-indexed parts are placeholder names.
+    """
+    body = html[html.index('<body>') + len('<body>'):html.rindex('</body>')]
+    return {'document': re.split(r'\{\{(\w+)\}\}', html), 'body': re.split(r'\{\{(\w+)\}\}', body)}
+
+
+def fill_template(parts, values):
+    """Join compiled template parts, substituting values for placeholders."""
+    return ''.join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
+
+@functools.lru_cache(maxsize=MAIL_MERGE_CACHE_SIZE)
+def _compiled_template(base_dir, layout_name, front_theme_name, back_theme_name, mtimes_ns):
+    layout = load_layout(Path(base_dir) / 'layouts' / f'{layout_name}.json')
+    compiled = compile_template(get_html_template(layout_name, front_theme_name, back_theme_name, base_dir))
+    compiled['paper_size'] = (layout['paper_size']['width'], layout['paper_size']['height'])
+    compiled['font'] = layout['front'].get('text_style', {}).get('font', get_text_style_defaults()['font'])
+    return compiled
+
+
+def get_compiled_template(base_dir, layout_name, front_theme_name, back_theme_name):
+    """Compiled template plus the layout facts mail merge needs, cached per combination.
+
+    Cached by the layout and theme files' modification times, so editing one
+    recompiles the templates that use it.
+    """
+    base = Path(base_dir)
+    paths = (base / 'layouts' / f'{layout_name}.json', base / 'themes' / f'{front_theme_name}.json',
+             base / 'themes' / f'{back_theme_name}.json')
+    mtimes_ns = tuple(os.stat(path).st_mtime_ns for path in paths)
+    return _compiled_template(base_dir, layout_name, front_theme_name, back_theme_name, mtimes_ns)
+
+
+@functools.lru_cache(maxsize=MAIL_MERGE_CACHE_SIZE)
+def render_markdown_cached(text):
+    """render_markdown_to_html, memoized: orders often share captions and notes."""
+    return render_markdown_to_html(text)
+
+
+def record_text(record, key, records_dir):
+    """Inline text for `key` ('caption'/'note'), else the contents of `{key}_path`."""
+    if record.get(key):
+        return record[key]
+    path = record.get(f'{key}_path')
+    if not path:
+        return ''
+    path = os.path.join(records_dir, path)
+    return _read_text_file(path, os.stat(path).st_mtime_ns)
+
+
+def paper_class(paper_size):
+    """CSS class / @page name for a paper size, e.g. paper-8_5x11."""
+    return 'paper-' + 'x'.join(f"{d:g}".replace('.', '_') for d in paper_size)
+
+
+def combined_document_head(paper_sizes, title='Orders'):
+    """Head of a combined print document with a named @page for every paper size."""
+    size_css = '\n'.join(
+        f"        @page {paper_class(size)} {{ size: {size[0]}in {size[1]}in; margin: 0; }}\n"
+        f"        .{paper_class(size)} > .page {{ width: {size[0]}in; height: {size[1]}in; page: {paper_class(size)}; }}"
+        for size in sorted(paper_sizes))
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{html_lib.escape(title)}</title>
+    <style>
+        @page {{ margin: 0; }}
+{size_css}
+        * {{ box-sizing: border-box; }}
+        body {{ margin: 0; padding: 0; }}
+        .page {{ position: relative; overflow: hidden; break-after: page; }}
+        .image-box img {{ width: 100%; height: 100%; object-fit: cover; }}
+        p {{ margin: 0 0 0.5em 0; }}
+        p:last-child {{ margin-bottom: 0; }}
+        @media screen {{
+            body {{ background: #ddd; }}
+            .page {{ margin: 20px auto; box-shadow: 0 0 10px rgba(0,0,0,0.3); }}
+        }}
+    </style>
+</head>
+<body>
+'''
+
+
+def mail_merge(records, base_dir, output_dir, combined=False, records_dir='.'):
+    """Fill print pages for a stream of order records.
+
+    Args:
+        records: Iterable of dicts (see iter_records) with 'layout', 'front_theme',
+            'back_theme' (names, .json optional), 'image', 'caption'/'caption_path',
+            'note'/'note_path', and optional 'id' and 'font'
+        base_dir: Directory containing 'layouts' and 'themes'
+        output_dir: Where to write {id}.html per order, or orders.html when combined
+        combined: Write one multi-page print document instead of one file per order
+        records_dir: Base for relative image/caption/note paths in records
+
+    Returns:
+        Dict with 'records', 'written' (paths; just orders.html when combined),
+        'failed' ((id, error) pairs), 'templates' and 'texts' (cache misses during
+        this call; the caches persist across calls) and 'seconds'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    template_misses = _compiled_template.cache_info().misses
+    text_misses = render_markdown_cached.cache_info().misses
+    start = time.perf_counter()
+    written, failed, count = [], [], 0
+    combined_file = None
+    if combined:
+        combined_path = os.path.join(output_dir, 'orders.html')
+        combined_file = open(combined_path, 'w', encoding='utf-8')
+        combined_file.write(combined_document_head({tuple(l['paper_size'].values()) for l in list_layouts(base_dir)}))
+        written.append(combined_path)
+
+    try:
+        for count, record in enumerate(records, 1):
+            order_id = str(record.get('id', count))
+            try:
+                names = [os.path.splitext(record[key])[0] for key in ('layout', 'front_theme', 'back_theme')]
+                compiled = get_compiled_template(str(base_dir), *names)
+                image_path = os.path.join(records_dir, record['image']) if record.get('image') else None
+                values = {
+                    'IMAGE': (f'<img src="{html_lib.escape(os.path.relpath(image_path, output_dir))}" alt="">'
+                              if image_path else ''),
+                    'CAPTION': render_markdown_cached(record_text(record, 'caption', records_dir)),
+                    'NOTE': render_markdown_cached(record_text(record, 'note', records_dir)),
+                    # Fills style attributes as well as CSS, so a record's font must not close them
+                    'FONT_FAMILY': html_lib.escape(record.get('font', compiled['font']), quote=True),
+                }
+                with METRICS.timer('html_write'):
+                    if combined_file:
+                        combined_file.write(f'<section class="order {paper_class(compiled["paper_size"])}" '
+                                            f'id="order-{html_lib.escape(order_id)}" style="font-family: {values["FONT_FAMILY"]};">')
+                        combined_file.write(fill_template(compiled['body'], values))
+                        combined_file.write('</section>\n')
+                    else:
+                        order_name = re.sub(r'[^\w.-]+', '_', order_id)
+                        order_path = os.path.join(output_dir, f'{order_name}.html')
+                        with open(order_path, 'w', encoding='utf-8') as f:
+                            f.write(fill_template(compiled['document'], values))
+                        written.append(order_path)
+            except (KeyError, OSError, ValueError) as e:
+                failed.append((order_id, f"{type(e).__name__}: {e}"))
+    finally:
+        if combined_file:
+            combined_file.write('</body>\n</html>\n')
+            combined_file.close()
+
+    return {
+        'records': count,
+        'written': written,
+        'failed': failed,
+        'templates': _compiled_template.cache_info().misses - template_misses,
+        'texts': render_markdown_cached.cache_info().misses - text_misses,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# --- CONTACT SHEETS ---
+# An overview of every layout in every theme, for picking themes without rendering full
+# 36x24" blueprints. Pages are sketched with PIL at low resolution straight from layout
+# specs: paper, borders, box colours and the photo, with text drawn as greeked bars laid
+# out by fit_text(). Each worker sketches one layout in every theme.
+
+CONTACT_DPI = 20              # Pixels per inch of sketched pages
+CONTACT_ROWS_PER_SHEET = 10   # Layouts per PNG sheet
+CONTACT_SOURCE_PX = 1024      # The photo is decoded once, to at most this many pixels a side
+CONTACT_GAP = 4               # Pixels between a cell's front and back
+CONTACT_PAD = 8               # Pixels around each cell
+CONTACT_LABEL_W = 200         # Width of the layout-name column
+CONTACT_LABEL_H = 24          # Height of the theme-name row
+CONTACT_LABEL_SIZE = 12
+CONTACT_SAMPLE_TEXT = (
+    "A quiet morning by the water, with the light just breaking over the hills and the whole "
+    "valley still asleep.\n\nPrinted for you with love."
+)
+
+
+def text_bars(text, box_w, box_h, text_style=None, border=0, special=None, gutter=DEFAULT_GUTTER):
+    """Greeked text for a sketch: (left, top, width, height) bars in inches from the box's top-left.
+
+    Lines are laid out by fit_text() (or fit_double_column()) as they print; each becomes
+    a bar as wide as the line and half an em tall, sitting on its baseline. Bars are
+    clipped to the box inside its border.
+    """
+    text_style = text_style or {}
+    border = border or 0
+    if special == 'double_col':
+        fit = fit_double_column(text, box_w, box_h, gutter, text_style, border)
+        columns = [(i * (fit['column_width'] + gutter), fit['column_width'], column)
+                   for i, column in enumerate(fit['columns'])]
+        offset = 0  # Columns are top-aligned, as in the HTML
+    else:
+        fit = fit_text(text, box_w, box_h, text_style, border)
+        columns = [(0, fit['available_width'], fit['paragraphs'])]
+        slack = fit['available_height'] - fit['height']
+        offset = {'top': 0, 'middle': slack / 2, 'bottom': slack}.get(text_style.get('align_v', 'top'), 0)
+
+    font, size = fit['font'], fit['size']
+    metrics = get_font_metrics(resolve_font_path(font))
+    line_h = metrics['line_height'] * size / 72
+    baseline = ((metrics['line_height'] - metrics['ascent'] - metrics['descent']) / 2 + metrics['ascent']) * size / 72
+    bar_h = size / 72 / 2
+    gap = PARAGRAPH_GAP * size / 72
+    align = get_css_text_alignment(text_style)['text_align']
+    inner = border + TEXT_PADDING
+
+    bars = []
+    for column_x, column_w, paragraphs in columns:
+        line_top = inner + offset
+        for i, lines in enumerate(paragraphs):
+            if i:
+                line_top += gap
+            for j, line in enumerate(lines):
+                width = min(measure_text_width(line, font, size), column_w) if line else 0
+                if align == 'justify' and j < len(lines) - 1:
+                    width = column_w
+                left = {'center': (column_w - width) / 2, 'right': column_w - width}.get(align, 0)
+                top = max(line_top + baseline - bar_h, border)
+                bottom = min(line_top + baseline, box_h - border)
+                if width and bottom > top:
+                    bars.append((inner + column_x + left, top, width, bottom - top))
+                line_top += line_h
+    return bars
+
+
+def contact_source(image_path):
+    """Decode a photo once for sketching: the whole image, at most CONTACT_SOURCE_PX a side."""
+    with Image.open(image_path) as im:
+        scale = min(1, CONTACT_SOURCE_PX / max(im.size))
+        size = (max(1, round(im.width * scale)), max(1, round(im.height * scale)))
+    return Image.fromarray(load_cover_image(image_path, *size))
+
+
+def cover_crop(source, width, height):
+    """Crop and scale a decoded image to fill width x height, like CSS object-fit: cover."""
+    scale = max(width / source.width, height / source.height)
+    crop_w, crop_h = width / scale, height / scale
+    left, top = (source.width - crop_w) / 2, (source.height - crop_h) / 2
+    return source.resize((width, height), Image.BILINEAR, box=(left, top, left + crop_w, top + crop_h))
+
+
+def sketch_page(spec, side, bars, photo=None, dpi=CONTACT_DPI):
+    """Sketch one side of a layout spec (see build_layout_spec()) as a small RGB image.
+
+    Follows render_print_page(): the paper border is inset, box borders are outset,
+    boxes without a background are white, and the photo (a decoded image, see
+    contact_source(); cropped here unless already the box's size) covers the image box. `bars` are text_bars() for the caption
+    or note, drawn in the font colour.
+    """
+    def px(value):
+        return round(value * dpi)
+
+    def rect(x, y, w, h, fill):
+        x0, y0 = px(x), px(y)
+        draw.rectangle([x0, y0, max(px(x + w) - 1, x0), max(px(y + h) - 1, y0)], fill=fill)
+
+    def block(x, y, w, h, border_width, border_color, background):
+        if border_width and border_color:
+            rect(x - border_width, y - border_width, w + 2 * border_width, h + 2 * border_width, border_color)
+        rect(x, y, w, h, background or 'white')
+
+    paper_w, paper_h = spec['paper']['width'], spec['paper']['height']
+    page = spec[side]
+    colors = page['colors']
+    paper_bg = colors['paper_bg'] or '#FFFFFF'
+    image = Image.new('RGB', (px(paper_w), px(paper_h)), paper_bg)
+    draw = ImageDraw.Draw(image)
+    border = page['paper_border_width']
+    if border and colors['paper_border']:
+        rect(0, 0, paper_w, paper_h, colors['paper_border'])
+        rect(border, border, paper_w - 2 * border, paper_h - 2 * border, paper_bg)
+
+    if side == 'front':
+        img = page['image']
+        block(img['left'], img['top'], img['width'], img['height'], img['border_width'],
+              colors['image_border'], colors['image_bg'])
+        size = (px(img['width']), px(img['height']))
+        if photo is not None and min(size) > 0:
+            if photo.size != size:
+                photo = cover_crop(photo, *size)
+            image.paste(photo, (px(img['left']), px(img['top'])))
+        box = page['caption']
+        box_x, box_y = box['left'], box['top']
+        block(box_x, box_y, box['width'], box['height'], box['border_width'],
+              colors['caption_border'], colors['caption_bg'])
+    else:
+        box = page['note']
+        box_x, box_y = (paper_w - box['width']) / 2, (paper_h - box['height']) / 2
+        block(box_x, box_y, box['width'], box['height'], box['border_width'],
+              colors['note_border'], colors['note_bg'])
+
+    for left, top, width, height in bars:
+        rect(box_x + left, box_y + top, width, height, colors['font'] or '#000000')
+    return image
+
+
+def sketch_contact_row(layout, theme_colors, photo=None, caption=None, note=None, dpi=CONTACT_DPI):
+    """Sketch one layout in each theme; returns a (front, back) image pair per theme.
+
+    Geometry, text layout and the photo crop are worked out once for the row and reused
+    for every theme. Module-level so it can run in a worker process.
+    """
+    geometry = layout_geometry(layout)
+    front, back = geometry['front'], geometry['back']
+    box_w, box_h = round(front['image']['width'] * dpi), round(front['image']['height'] * dpi)
+    if photo is not None and box_w > 0 and box_h > 0:
+        photo = cover_crop(photo, box_w, box_h)
+    caption_bars = text_bars(caption, front['caption']['width'], front['caption']['height'],
+                             layout['front'].get('text_style'), front['caption']['border_width'],
+                             front['special'], front['gutter']) if caption else []
+    note_bars = text_bars(note, back['note']['width'], back['note']['height'],
+                          layout['back'].get('text_style'), back['note']['border_width']) if note else []
+    pairs = []
+    for colors in theme_colors:
+        spec = build_layout_spec(geometry, colors['front'], colors['back'])
+        pairs.append((sketch_page(spec, 'front', caption_bars, photo, dpi),
+                      sketch_page(spec, 'back', note_bars, dpi=dpi)))
+    return pairs
+
+
+def _fit_label(draw, text, font, width):
+    """Truncate text with an ellipsis so it fits width pixels."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def contact_sheet(base_dir, output_dir, layout_names='all', theme_names='all', image_path=None,
+                  caption=CONTACT_SAMPLE_TEXT, note=CONTACT_SAMPLE_TEXT, dpi=CONTACT_DPI,
+                  workers=None, rows_per_sheet=CONTACT_ROWS_PER_SHEET):
+    """Sketch every layout x theme (the theme on both sides) into PNG sheets and an HTML grid.
+
+    Sheets have one row per layout and one column per theme, each cell holding the front
+    and back; contact_001.png, contact_002.png, ... hold rows_per_sheet layouts each.
+    contact.html shows the whole grid, using the sheets as CSS sprites. Rows are sketched
+    in `workers` processes (default: CPU count; 1 = in-process) and assembled in order.
+
+    Args:
+        base_dir: Directory containing 'layouts' and 'themes'
+        output_dir: Where to write the sheets and contact.html
+        layout_names, theme_names: Lists of names (without .json), or 'all'
+        image_path: Photo shown in every image box (decoded once), or None
+        caption, note: Sample text laid out in the caption and note boxes
+        dpi: Resolution of the sketched pages
+
+    Returns:
+        Dict with 'sheets' and 'html' paths, 'cells' (layout x theme count) and 'seconds'
+    """
+    start = time.perf_counter()
+    base = Path(base_dir)
+    if layout_names == 'all':
+        layout_names = sorted(f.stem for f in (base / 'layouts').glob('*.json'))
+    if theme_names == 'all':
+        theme_names = sorted(f.stem for f in (base / 'themes').glob('*.json'))
+    if not layout_names or not theme_names:
+        missing = 'layouts' if not layout_names else 'themes'
+        raise ValueError(f"No {missing} to sketch in {base_dir} (contact sheets need at least one layout and theme).")
+    layouts = [load_layout(base / 'layouts' / f'{name}.json') for name in layout_names]
+    theme_colors = [theme_spec_colors(load_theme(base / 'themes' / f'{name}.json')) for name in theme_names]
+    photo = contact_source(image_path) if image_path else None
+
+    page_w = max(round(layout['paper_size']['width'] * dpi) for layout in layouts)
+    page_h = max(round(layout['paper_size']['height'] * dpi) for layout in layouts)
+    cell_w, cell_h = 2 * page_w + CONTACT_GAP + 2 * CONTACT_PAD, page_h + 2 * CONTACT_PAD
+    sheet_w = CONTACT_LABEL_W + cell_w * len(theme_names)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(output_dir, 'contact_[0-9][0-9][0-9].png')):
+        os.remove(stale)
+    font = ImageFont.load_default(CONTACT_LABEL_SIZE)
+    sheets, rows_html = [], []
+    sheet = draw = None
+
+    def save_sheet():
+        path = os.path.join(output_dir, f'contact_{len(sheets) + 1:03d}.png')
+        save_png(sheet, path, png_mode='rgb', compress_level=1)
+        sheets.append(path)
+        print(f"Generated: {path}")
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(layouts) > 1 else None
+    try:
+        row_args = [(layout, theme_colors, photo, caption, note, dpi) for layout in layouts]
+        rows = pool.map(sketch_contact_row, *zip(*row_args)) if pool else (sketch_contact_row(*a) for a in row_args)
+        for index, pairs in enumerate(rows):
+            row = index % rows_per_sheet
+            if row == 0:
+                if sheet is not None:
+                    save_sheet()
+                sheet_rows = min(rows_per_sheet, len(layouts) - index)
+                sheet = Image.new('RGB', (sheet_w, CONTACT_LABEL_H + cell_h * sheet_rows), CANVAS_COLOR)
+                draw = ImageDraw.Draw(sheet)
+                for column, name in enumerate(theme_names):
+                    draw.text((CONTACT_LABEL_W + column * cell_w + CONTACT_PAD, CONTACT_LABEL_H // 2),
+                              _fit_label(draw, name, font, cell_w - 2 * CONTACT_PAD), fill=BLUE, font=font,
+                              anchor='lm')
+            y = CONTACT_LABEL_H + row * cell_h
+            draw.text((CONTACT_PAD, y + cell_h // 2), _fit_label(draw, layout_names[index], font,
+                                                                 CONTACT_LABEL_W - 2 * CONTACT_PAD),
+                      fill=BLUE, font=font, anchor='lm')
+            cells_html = []
+            for column, (front, back) in enumerate(pairs):
+                x = CONTACT_LABEL_W + column * cell_w
+                sheet.paste(front, (x + CONTACT_PAD, y + CONTACT_PAD))
+                sheet.paste(back, (x + CONTACT_PAD + front.width + CONTACT_GAP, y + CONTACT_PAD))
+                title = html_lib.escape(f"{layout_names[index]} / {theme_names[column]}")
+                cells_html.append(f'<td><div class="cell" title="{title}" style="background-image: '
+                                  f'url(contact_{len(sheets) + 1:03d}.png); background-position: -{x}px -{y}px">'
+                                  f'</div></td>')
+            rows_html.append(f'<tr><th>{html_lib.escape(layout_names[index])}</th>{"".join(cells_html)}</tr>')
+        if sheet is not None:
+            save_sheet()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    header = ''.join(f'<th>{html_lib.escape(name)}</th>' for name in theme_names)
+    html_path = os.path.join(output_dir, 'contact.html')
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(f'''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Contact Sheet - {len(layouts)} layouts x {len(theme_names)} themes</title>
+    <style>
+        body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
+               background: {CANVAS_COLOR}; margin: 0; }}
+        table {{ border-collapse: collapse; }}
+        th {{ color: #2c3e50; font-size: 12px; font-weight: 600; padding: 4px 8px; background: {CANVAS_COLOR}; }}
+        thead th {{ position: sticky; top: 0; z-index: 1; }}
+        tbody th {{ position: sticky; left: 0; text-align: left; max-width: {CONTACT_LABEL_W}px; }}
+        td {{ padding: 0; }}
+        .cell {{ width: {cell_w}px; height: {cell_h}px; background-repeat: no-repeat; }}
+    </style>
+</head>
+<body>
+<table>
+<thead><tr><th></th>{header}</tr></thead>
+<tbody>
+{chr(10).join(rows_html)}
+</tbody>
+</table>
+</body>
+</html>
+''')
+    print(f"Generated: {html_path}")
+    return {'sheets': sheets, 'html': html_path, 'cells': len(layouts) * len(theme_names),
+            'seconds': time.perf_counter() - start}
+
+
+# --- BATCH RUNNER ---
+
+def run_batch(batch_path, **overrides):
+    """Generate all outputs for a batch file.
+
+    Args:
+        batch_path: Path to batch.json, or a .jsonl batch whose entries are read as they
+            are rendered; layouts/, themes/ and output/ are resolved next to it
+        **overrides: Batch config keys (see BATCH_DEFAULTS) that take precedence over
+            the file. None values are ignored.
+
+    Returns:
+        Dict with 'html_files', 'all_html' (None for a shard), 'pdf' (None unless
+        pdf_output), 'archive' (None unless archive is set), 'manifest' and 'journal'
+        paths, 'skipped' (entries reused by resume) and 'failed' (keys of entries that
+        raised; the rest still render). With an archive, the html_files, all_html and pdf
+        paths name members as if the archive were extracted into output/.
+    """
+    renders = iter_render(batch_path, **overrides)
+    while True:
+        try:
+            next(renders)
+        except StopIteration as finished:
+            return finished.value
+
+
+def iter_render(batch_path, **overrides):
+    """Render a batch, yielding each entry's result as soon as it finishes.
+
+    Takes the same arguments as run_batch(). Each result is a dict with:
+        'index', 'key', 'name': batch position, entry_key() and output name
+        'entry': the batch entry
+        'status': 'ok', 'skipped' (done in an earlier run, see resume) or 'failed'
+        'html', 'blueprint', 'thumbnail': output paths (None if not written)
+        'print_pages': list of press-file paths (mode "print")
+        'error': 'Type: message' for a failed entry, else None
+        'seconds': wall time from the entry's start to its result
+        'stages': seconds per stage run in this process (load, pdf, print, blueprint, html)
+
+    Entries render one at a time, and only while the consumer asks for results, so a
+    slow consumer holds up rendering instead of results piling up. With `workers`, press
+    pages render in parallel and results come in completion order, at most two per worker
+    in flight. Stopping early (break, or close()) cancels queued work, discards an
+    unfinished archive and skips manifest and all.html; the journal keeps every entry
+    already yielded, so --resume picks up from there.
+
+    The generator's return value (what run_batch() returns) is the summary dict,
+    written once every entry is done.
+    """
+    batch_dir = os.path.dirname(batch_path) or '.'
+    output_dir = os.path.join(batch_dir, 'output')
+
+    config = load_batch_config(batch_path)
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    streaming = is_streaming_batch(batch_path)
+    batch_entries = config['batch']
+    show_blueprints = config['show_blueprints']
+    default_dpi = PREVIEW_DPI if config['preview'] else DPI
+    blueprint_dpi = config['blueprint_dpi'] or default_dpi
+    pdf_dpi = config['pdf_dpi'] or default_dpi
+    thumbnail_width = config['thumbnail_width'] if config['thumbnails'] else None
+    shard = parse_shard(config['shard'])
+
+    if not streaming and not batch_entries:
+        raise ValueError(f"No entries in {batch_path} batch list.")
+    if config['archive'] and config['resume']:
+        raise ValueError("resume needs outputs on disk; it can't be combined with archive output.")
+
+    # Check the batch file and every layout/theme it uses before rendering anything.
+    # A streamed batch starts rendering at once instead; each entry is checked as it's read.
+    if not streaming:
+        errors = validate_catalog(batch_path)
+        if errors:
+            raise ValidationError(errors)
+
+    # Clear output directory (web image cache survives between runs). Shards may share
+    # an output directory, and resumed runs reuse earlier outputs, so neither clears it.
+    if shard or config['resume']:
+        os.makedirs(output_dir, exist_ok=True)
+    else:
+        clear_output_dir(output_dir)
 
     output_types = "PNG + HTML" if show_blueprints else "HTML only"
-    print(f"Generating {len(batch_entries)} batch entries ({output_types})...")
+    if config['pdf_output']:
+        output_types += " + PDF"
+    if config['preview']:
+        output_types += f", preview @ {blueprint_dpi} DPI"
+    if shard:
+        output_types += f", shard {shard[0]}/{shard[1]}"
+    if config['archive']:
+        output_types += f", into a {config['archive']} archive"
+    if streaming:
+        print(f"Streaming batch entries from {batch_path} ({output_types})...")
+    elif shard:
+        selected_count = sum(entry_shard(entry, shard[1]) == shard[0] for entry in batch_entries)
+        print(f"Generating {selected_count} of {len(batch_entries)} batch entries ({output_types})...")
+    else:
+        print(f"Generating {len(batch_entries)} batch entries ({output_types})...")
     print(f"Output directory: {output_dir}")
 
-    html_files = []
-
-    for entry in batch_entries:
-        layout_path = os.path.join(batch_dir, 'layouts', entry['layout'])
-        front_theme_path = os.path.join(batch_dir, 'themes', entry['front_theme'])
-        back_theme_path = os.path.join(batch_dir, 'themes', entry['back_theme'])
-
-        # Extract names from paths for filenames (remove directory and .json extension)
-        layout_name = os.path.splitext(os.path.basename(layout_path))[0]
-        front_theme_name = os.path.splitext(os.path.basename(front_theme_path))[0]
-        back_theme_name = os.path.splitext(os.path.basename(back_theme_path))[0]
-
-        # Load layout and themes
-        layout = load_layout(layout_path)
-        front_theme = load_theme(front_theme_path)
-        back_theme = load_theme(back_theme_path)
-
-        # --- Generate combined PNG blueprint (if enabled) ---
-        blueprint_filename = None
-        if show_blueprints:
-            blueprint_filename = f"{layout_name}_{front_theme_name}_blueprint.png"
-            draw_combined_blueprint(
-                filename=blueprint_filename,
-                layout=layout,
-                front_theme=front_theme,
-                back_theme=back_theme,
-                image_path_landscape=image_path_landscape,
-                image_path_portrait=image_path_portrait,
-                text_path=text_path,
-                personal_note_path=personal_note_path,
-                output_dir=output_dir
-            )
-
-        # --- Generate HTML (print preview) ---
-        front = layout.get('front', {})
-        img_w = front['img_dims']['width']
-        img_h = front['img_dims']['height']
-        image_path = image_path_landscape if img_w > img_h else image_path_portrait
-
-        html_path = generate_html_output(
-            batch_entry=entry,
-            layout=layout,
-            front_theme=front_theme,
-            back_theme=back_theme,
-            image_path=image_path,
-            text_content=text_content,
-            note_content=note_content,
-            layout_name=f"{layout_name}_{front_theme_name}",
-            output_dir=output_dir,
-            blueprint_png=blueprint_filename
-        )
-        html_files.append(html_path)
-
-    # Generate combined all.html
-    all_path = generate_combined_html(html_files, output_dir)
+    # Deliverables go straight into one archive as entries complete; the journal, manifest
+    # and web image cache stay on disk
+    archive = None
+    if config['archive']:
+        stem = os.path.splitext(os.path.basename(batch_path))[0]
+        if shard:
+            stem += f"-{shard[0]}-of-{shard[1]}"
+        archive = ArchiveWriter(os.path.join(output_dir, stem + ARCHIVE_FORMATS[config['archive']]),
+                                config['archive'])
+
+    def archive_web_images(images):
+        if archive:
+            for web_rel in images.values():
+                archive.add_file(web_rel.replace(os.sep, '/'), os.path.join(output_dir, web_rel))
+
+    # Screen-size copies for HTML, each sized to the largest image box it fills in this batch.
+    # A streamed batch can't be scanned ahead, so its copies are made per entry instead.
+    # A shard only scans (and hashes and resizes images for) the entries it renders.
+    web_images = {}
+    if config['web_images'] and not streaming:
+        image_boxes = {}
+        for entry in batch_entries:
+            if shard and entry_shard(entry, shard[1]) != shard[0]:
+                continue
+            dims = load_layout(os.path.join(batch_dir, 'layouts', entry['layout']))['front']['img_dims']
+            assets = entry_assets(entry, config)
+            path = assets['image_path_landscape'] if dims['width'] > dims['height'] else assets['image_path_portrait']
+            box_w, box_h = image_boxes.get(path, (0, 0))
+            image_boxes[path] = (max(box_w, dims['width']), max(box_h, dims['height']))
+        web_images = build_web_images(image_boxes, output_dir, config['web_image_format'],
+                                      config['web_image_dpi'])
+        archive_web_images(web_images)
+
+    manifest_entries = []
+    failed = []
+    skipped = 0
+    pdf_name = f"all-{shard[0]}-of-{shard[1]}.pdf" if shard else 'all.pdf'
+    pdf_path = os.path.join(output_dir, pdf_name) if config['pdf_output'] else None
+    pdf_writer = StreamingPdfWriter(pdf_path) if pdf_path else None
+
+    # Checkpoint journal: what each entry was rendered from, so --resume can skip it
+    journal_path = os.path.join(output_dir, journal_filename(shard))
+    previous = load_journal(journal_path) if config['resume'] else {}
+    journal = CheckpointJournal(journal_path, resume=config['resume'])
+    render_config = {key: config[key] for key in RESUME_CONFIG_KEYS}
+    render_config['blueprint_dpi'] = blueprint_dpi
+    hash_cache_dir = os.path.join(output_dir, WEB_IMAGE_DIR)
+    monitor = MemoryMonitor(config['memory_limit_mb'], config['memory_report'])
+
+    # Press-resolution pages (mode "print") render in worker processes while this one moves
+    # on. An entry is finished (manifest, journal) once its pages are written, oldest first,
+    # and at most two jobs per worker wait in the queue.
+    print_mode = config['mode'] == 'print'
+    workers = config['workers'] or os.cpu_count() or 1
+    print_pool = ProcessPoolExecutor(max_workers=workers) if print_mode and workers > 1 else None
+    pending = collections.deque()
+
+    def entry_result(index, entry, output_name, entry_start, stages, status, html=None, blueprint=None,
+                     thumbnail=None, print_pages=(), error=None):
+        def path(name):
+            return os.path.join(output_dir, name) if name else None
+        METRICS.inc(f'entries_{status}')
+        return {'index': index, 'key': entry_key(entry), 'name': output_name, 'entry': entry, 'status': status,
+                'html': path(html), 'blueprint': path(blueprint), 'thumbnail': path(thumbnail),
+                'print_pages': [path(name) for name in print_pages], 'error': error,
+                'seconds': round(time.perf_counter() - entry_start, 3), 'stages': stages}
+
+    def fail_entry(index, entry, output_name, input_hash, entry_start, stages, error):
+        # Record the failure and move on; --resume retries it
+        print(f"Error: {output_name} failed: {error}")
+        failed.append(entry_key(entry))
+        journal.record(index=index, key=entry_key(entry), input_hash=input_hash, status='failed',
+                       error=error, outputs=[], seconds=round(time.perf_counter() - entry_start, 3))
+        return entry_result(index, entry, output_name, entry_start, stages, 'failed', error=error)
+
+    def finish_entry(index, entry, output_name, input_hash, entry_start, stages, html_path, blueprint_filename,
+                     pdf_pages, print_pages):
+        html_rel = os.path.relpath(html_path, output_dir)
+        outputs = [html_rel] + print_pages
+        thumb = None
+        if blueprint_filename:
+            outputs.append(blueprint_filename)
+            thumb = thumbnail_filename(blueprint_filename)
+            if thumb in archive.names if archive else os.path.exists(os.path.join(output_dir, thumb)):
+                outputs.append(thumb)
+            else:
+                thumb = None
+        manifest_entries.append({
+            'index': index,
+            'key': entry_key(entry),
+            'html': html_rel,
+            'blueprint': blueprint_filename,
+            'print_pages': print_pages,
+        })
+        journal.record(index=index, key=entry_key(entry), input_hash=input_hash, status='ok',
+                       html=html_rel, blueprint=blueprint_filename, print_pages=print_pages,
+                       pdf_pages=pdf_pages, outputs=outputs, seconds=round(time.perf_counter() - entry_start, 3))
+        return entry_result(index, entry, output_name, entry_start, stages, 'ok', html_rel, blueprint_filename,
+                            thumb, print_pages)
+
+    def finish_pending(limit):
+        while pending and (len(pending) > limit or pending[0][0].done()):
+            job, done = pending.popleft()
+            try:
+                print_pages = save_print_pages(job.result(), output_dir, archive)
+            except Exception as e:
+                yield fail_entry(*done[:6], f"{type(e).__name__}: {e}")
+            else:
+                yield finish_entry(*done, print_pages)
+
+    @contextlib.contextmanager
+    def stage(name, estimate_bytes=0):
+        # Time every stage for the entry's result; memory checks are up to the monitor
+        start = time.perf_counter()
+        try:
+            with monitor.stage(name, estimate_bytes):
+                yield
+        finally:
+            stages[name] = round(time.perf_counter() - start, 3)
+
+    total_entries = 0
+    try:
+        for index, entry in enumerate(batch_entries):
+            total_entries += 1
+            if shard and entry_shard(entry, shard[1]) != shard[0]:
+                continue
+            output_name = entry_output_name(entry)
+            entry_start = time.perf_counter()
+            input_hash = None
+            stages = {}
+
+            monitor.begin_entry(index, entry_key(entry))
+
+            try:
+                with stage('load'):
+                    if streaming:
+                        problems = validate_data('batch_entry', entry)
+                        if problems:
+                            raise ValidationError([f"{batch_path} entry {index}: {p}" for p in problems])
+                    layout_path = os.path.join(batch_dir, 'layouts', entry['layout'])
+                    front_theme_path = os.path.join(batch_dir, 'themes', entry['front_theme'])
+                    back_theme_path = os.path.join(batch_dir, 'themes', entry['back_theme'])
+                    layout_name = os.path.splitext(os.path.basename(layout_path))[0]
+
+                    # Per-entry image, caption and note (falling back to the batch-wide ones)
+                    assets = entry_assets(entry, config)
+                    image_path_landscape = assets['image_path_landscape']
+                    image_path_portrait = assets['image_path_portrait']
+                    text_content = read_text_file(assets['text_path'])
+                    note_content = read_text_file(assets['personal_note_path'])
+
+                    input_hash = entry_input_hash(
+                        [layout_path, front_theme_path, back_theme_path], text_content, note_content,
+                        [image_path_landscape, image_path_portrait], render_config, hash_cache_dir)
+
+                    # Load layout and themes
+                    layout = load_layout(layout_path)
+                    front_theme = load_theme(front_theme_path)
+                    back_theme = load_theme(back_theme_path)
+
+                    front = layout.get('front', {})
+                    img_w = front['img_dims']['width']
+                    img_h = front['img_dims']['height']
+                    image_path = image_path_landscape if img_w > img_h else image_path_portrait
+
+                # Memory estimates for budget checks (only computed when a limit is set)
+                pdf_estimate = blueprint_estimate = 0
+                if monitor.limit_mb:
+                    decode_bytes = image_decode_bytes(image_path)
+                    pdf_estimate = raster_bytes(layout['paper_size']['width'], layout['paper_size']['height'],
+                                                pdf_dpi) + decode_bytes
+                    blueprint_estimate = raster_bytes(CANVAS_W, CANVAS_H, blueprint_dpi,
+                                                      config['render_memory_mb']) + decode_bytes
+
+                # --- Already done in an earlier run: reuse outputs and its saved PDF pages ---
+                record = previous.get(index)
+                if journal_record_done(record, input_hash, output_dir):
+                    saved = record.get('pdf_pages')
+                    if saved and saved['dpi'] == pdf_dpi and saved['blueprints'] == config['pdf_blueprints']:
+                        saved = saved['pages']
+                    else:
+                        saved = None  # Rendered without all.pdf, or with other PDF settings
+                    if pdf_writer and not (saved and add_saved_pdf_pages(pdf_writer, saved, output_dir)):
+                        with stage('pdf', pdf_estimate):
+                            write_pdf_pages(pdf_writer, layout, front_theme, back_theme, image_path,
+                                            text_content, note_content, dpi=pdf_dpi)
+                            if config['pdf_blueprints'] and record['blueprint']:
+                                with Image.open(os.path.join(output_dir, record['blueprint'])) as im:
+                                    pdf_writer.add_page(im, im.width / blueprint_dpi, im.height / blueprint_dpi)
+                    monitor.end_entry('skipped')
+                    print(f"Skipped: {output_name} (completed in an earlier run)")
+                    skipped += 1
+                    manifest_entries.append({'index': index, 'key': entry_key(entry), 'html': record['html'],
+                                             'blueprint': record['blueprint'],
+                                             'print_pages': record.get('print_pages', [])})
+                    thumb = record['blueprint'] and thumbnail_filename(record['blueprint'])
+                    yield entry_result(index, entry, output_name, entry_start, stages, 'skipped', record['html'],
+                                       record['blueprint'], thumb if thumb in record.get('outputs', []) else None,
+                                       record.get('print_pages', []))
+                    continue
+
+                # --- Warn about text that won't fit its box when printed ---
+                for box, fit in check_text_overflow(layout, text_content, note_content).items():
+                    if fit['overflow'] > 0:
+                        print(f"Warning: {layout_name} {box} text overflows by {fit['overflow']:.2f}\" "
+                              f"at {fit['size']}pt (needs {fit['height']:.2f}\", box has {fit['available_height']:.2f}\")")
+
+                # --- Stream front/back pages into the proof book (if enabled) ---
+                # Its pages are kept on disk too, so --resume can reuse them (not with an archive)
+                if pdf_writer:
+                    pdf_writer.page_log = None if archive else []
+                    with stage('pdf', pdf_estimate):
+                        write_pdf_pages(pdf_writer, layout, front_theme, back_theme, image_path,
+                                        text_content, note_content, dpi=pdf_dpi)
+
+                # --- Press-resolution front/back files (mode "print") ---
+                print_job = None
+                if print_mode:
+                    print_args = (layout, front_theme, back_theme, image_path, text_content, note_content,
+                                  output_name, config['print_dpi'], config['print_format'])
+                    if print_pool:
+                        print_job = print_pool.submit(encode_print_pages, *print_args)
+                    else:
+                        with stage('print', print_page_bytes(layout, config['print_dpi'])):
+                            print_job = save_print_pages(encode_print_pages(*print_args), output_dir, archive)
+
+                # --- Generate combined PNG blueprint (if enabled) ---
+                blueprint_filename = None
+                if show_blueprints:
+                    blueprint_filename = f"{output_name}_blueprint.png"
+                    with stage('blueprint', blueprint_estimate):
+                        draw_combined_blueprint(
+                            filename=blueprint_filename,
+                            layout=layout,
+                            front_theme=front_theme,
+                            back_theme=back_theme,
+                            image_path_landscape=image_path_landscape,
+                            image_path_portrait=image_path_portrait,
+                            text_path=assets['text_path'],
+                            personal_note_path=assets['personal_note_path'],
+                            output_dir=output_dir,
+                            pdf_writer=pdf_writer if config['pdf_blueprints'] else None,
+                            dpi=blueprint_dpi,
+                            thumbnail_width=thumbnail_width,
+                            png_mode=config['png_mode'],
+                            compress_level=config['png_compress_level'],
+                            memory_budget_mb=config['render_memory_mb'],
+                            sink=archive
+                        )
+
+                # --- Generate HTML (print preview) ---
+                with stage('html'):
+                    if streaming and config['web_images'] and image_path not in web_images:
+                        built = build_web_images({image_path: (img_w, img_h)}, output_dir,
+                                                 config['web_image_format'], config['web_image_dpi'])
+                        web_images.update(built)
+                        archive_web_images(built)
+                    html_path = generate_html_output(
+                        batch_entry=entry,
+                        layout=layout,
+                        front_theme=front_theme,
+                        back_theme=back_theme,
+                        image_path=web_images.get(image_path, image_path),
+                        text_content=text_content,
+                        note_content=note_content,
+                        layout_name=output_name,
+                        output_dir=output_dir,
+                        blueprint_png=blueprint_filename,
+                        sink=archive
+                    )
+
+                pdf_pages = None
+                if pdf_writer and pdf_writer.page_log is not None:
+                    pdf_pages = {'dpi': pdf_dpi, 'blueprints': config['pdf_blueprints'],
+                                 'pages': save_pdf_pages(pdf_writer.page_log, output_dir, output_name)}
+                    pdf_writer.page_log = None
+            except Exception as e:
+                if pdf_writer:
+                    pdf_writer.page_log = None
+                monitor.end_entry('failed', f"{type(e).__name__}: {e}")
+                yield fail_entry(index, entry, output_name, input_hash, entry_start, stages,
+                                 f"{type(e).__name__}: {e}")
+                continue
+
+            monitor.end_entry('ok')
+            done = (index, entry, output_name, input_hash, entry_start, stages, html_path, blueprint_filename,
+                    pdf_pages)
+            if print_pool:
+                pending.append((print_job, done))
+                yield from finish_pending(limit=2 * workers)
+            else:
+                yield finish_entry(*done, print_job or [])
+        yield from finish_pending(limit=0)
+    except BaseException:
+        # Failed, or stopped early (GeneratorExit): never leave a partial archive behind
+        if archive:
+            archive.close(discard=True)
+        raise
+    finally:
+        if print_pool:
+            print_pool.shutdown(cancel_futures=True)
+        journal.close()
+        monitor.close()
+        if pdf_writer:
+            pdf_writer.close()
+
+    if not total_entries:
+        if archive:
+            archive.close(discard=True)
+        raise ValueError(f"No entries in {batch_path} batch list.")
+
+    memory_report = None
+    if config['memory_report']:
+        memory_report = monitor.write_report(os.path.join(output_dir, 'memory_report.json'))
+    if skipped:
+        print(f"Resumed: skipped {skipped} entries completed in an earlier run")
+    if failed:
+        print(f"Warning: {len(failed)} entries failed (see {journal_path}); rerun with --resume to retry them")
+    if pdf_path:
+        if archive:
+            # The PDF's page tree is written last, so it's finished on disk and then moved in
+            archive.add_file(pdf_name, pdf_path)
+            os.remove(pdf_path)
+        print(f"Generated: {output_label(output_dir, pdf_name, archive)} ({pdf_writer.page_count} pages)")
+
+    manifest_entries.sort(key=lambda e: e['index'])  # Print jobs can finish out of batch order
+    html_files = [os.path.join(output_dir, e['html']) for e in manifest_entries]
+    manifest_path = write_manifest(output_dir, batch_path, shard, total_entries,
+                                   manifest_entries, pdf_path)
+    print(f"Generated: {manifest_path}")
+
+    # Generate combined all.html (shards leave this to `merge`)
+    all_path = None
+    if not shard:
+        all_path = generate_combined_html(html_files, output_dir, config['all_html_page_size'], archive)
+    if archive:
+        archive.close()
+        print(f"Generated: {archive.path} ({len(archive.names)} files)")
+
+    return {'html_files': html_files, 'all_html': all_path, 'pdf': pdf_path,
+            'archive': archive.path if archive else None, 'manifest': manifest_path, 'journal': journal_path, 'memory_report': memory_report, 'skipped': skipped, 'failed': failed}
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Generate print layouts and blueprints from a batch file.")
+    parser.add_argument('batch_path', nargs='?', default='production/batch.json',
+                        help="Batch file (default: production/batch.json)")
+    parser.add_argument('--pdf', dest='pdf_output', action='store_true', default=None,
+                        help="Also stream all front/back pages into output/all.pdf")
+    parser.add_argument('--pdf-blueprints', dest='pdf_blueprints', action='store_true', default=None,
+                        help="Include each entry's blueprint as a page in all.pdf")
+    parser.add_argument('--pdf-dpi', dest='pdf_dpi', type=int, default=None,
+                        help=f"Raster resolution of PDF pages (default: {DPI}, {PREVIEW_DPI} in preview)")
+    parser.add_argument('--print', dest='mode', action='store_const', const='print', default=None,
+                        help=f"Also write each front/back at press resolution (TIFF, {PRINT_DPI} DPI)")
+    parser.add_argument('--print-dpi', dest='print_dpi', type=int, default=None,
+                        help=f"Resolution of --print pages (default: {PRINT_DPI})")
+    parser.add_argument('--print-format', dest='print_format', choices=PRINT_FORMATS, default=None,
+                        help="File format of --print pages (default: tiff)")
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help="Processes rendering --print pages in parallel (default: CPU count; 1 = in-process)")
+    parser.add_argument('--preview', action='store_true', default=None,
+                        help=f"Quick review pass: render blueprints and PDF pages at {PREVIEW_DPI} DPI")
+    parser.add_argument('--dpi', dest='blueprint_dpi', type=int, default=None,
+                        help=f"Blueprint resolution (default: {DPI}, {PREVIEW_DPI} in preview)")
+    parser.add_argument('--png-mode', dest='png_mode', choices=PNG_MODES, default=None,
+                        help="Blueprint PNG encoding (default: rgb; palette is smaller but lossy)")
+    parser.add_argument('--png-compress', dest='png_compress_level', type=int, choices=range(10),
+                        metavar='0-9', default=None, help="PNG zlib compression level (default: 6)")
+    parser.add_argument('--memory-budget', dest='render_memory_mb', type=int, default=None, metavar='MB',
+                        help="Render blueprints in bands when a full canvas would exceed this many MB")
+    parser.add_argument('--no-thumbnails', dest='thumbnails', action='store_false', default=None,
+                        help="Don't write blueprint thumbnails; all.html embeds full-size PNGs")
+    parser.add_argument('--page-size', dest='all_html_page_size', type=int, default=None, metavar='N',
+                        help=f"Entries per all.html page before it is split (default: {ALL_HTML_PAGE_SIZE})")
+    parser.add_argument('--shard', default=None, metavar='i/N',
+                        help="Render only shard i of N (stable split by layout+themes); combine with `merge`")
+    parser.add_argument('--resume', action='store_true', default=None,
+                        help="Keep output/ and skip entries the journal records as done with unchanged inputs")
+    parser.add_argument('--memory-report', dest='memory_report', action='store_true', default=None,
+                        help="Record peak RSS and top allocations per entry and stage in output/memory_report.json")
+    parser.add_argument('--memory-limit', dest='memory_limit_mb', type=int, default=None, metavar='MB',
+                        help="Skip (and journal as failed) any entry whose stage would exceed this RSS")
+    parser.add_argument('--web-format', dest='web_image_format', choices=WEB_IMAGE_FORMATS, default=None,
+                        help="Format of screen-size image copies used by HTML output (default: jpeg)")
+    parser.add_argument('--no-web-images', dest='web_images', action='store_false', default=None,
+                        help="Point HTML at the original image files instead of screen-size copies")
+    parser.add_argument('--archive', choices=ARCHIVE_FORMATS, default=None,
+                        help="Stream HTML, PNGs, print pages and all.html into output/<batch>.zip or .tar "
+                             "instead of separate files")
+    return parser.parse_args(argv)
+
+
+def parse_merge_args(argv=None):
+    """Parse arguments of the `merge` subcommand."""
+    parser = argparse.ArgumentParser(prog='PrintLayoutDesigner.py merge',
+                                     description="Combine shard manifests into one all.html without re-rendering.")
+    parser.add_argument('output_dir', nargs='?', default='production/output',
+                        help="Directory holding every shard's outputs and manifests (default: production/output)")
+    parser.add_argument('--page-size', dest='page_size', type=int, default=ALL_HTML_PAGE_SIZE, metavar='N',
+                        help=f"Entries per all.html page before it is split (default: {ALL_HTML_PAGE_SIZE})")
+    return parser.parse_args(argv)
+
+
+def parse_mailmerge_args(argv=None):
+    """Parse arguments of the `mailmerge` subcommand."""
+    parser = argparse.ArgumentParser(prog='PrintLayoutDesigner.py mailmerge',
+                                     description="Fill HTML print pages for every order in a CSV or JSONL file.")
+    parser.add_argument('records_path', help="Order records (.csv with a header row, or .jsonl)")
+    parser.add_argument('--base-dir', dest='base_dir', default='production', metavar='DIR',
+                        help="Directory containing 'layouts' and 'themes' (default: production)")
+    parser.add_argument('--output-dir', dest='output_dir', default=None, metavar='DIR',
+                        help="Where to write the pages (default: <base-dir>/output/orders)")
+    parser.add_argument('--combined', action='store_true',
+                        help="Write one multi-page orders.html instead of one file per order")
+    return parser.parse_args(argv)
+
+
+def parse_contactsheet_args(argv=None):
+    """Parse arguments of the `contactsheet` subcommand."""
+    parser = argparse.ArgumentParser(prog='PrintLayoutDesigner.py contactsheet',
+                                     description="Sketch every layout in every theme into PNG sheets and an HTML grid.")
+    parser.add_argument('--base-dir', dest='base_dir', default='production', metavar='DIR',
+                        help="Directory containing 'layouts' and 'themes' (default: production)")
+    parser.add_argument('--output-dir', dest='output_dir', default=None, metavar='DIR',
+                        help="Where to write the sheets (default: <base-dir>/output/contact_sheet)")
+    parser.add_argument('--layouts', default=None, metavar='A,B,...',
+                        help="Comma-separated layout names (default: all)")
+    parser.add_argument('--themes', default=None, metavar='A,B,...',
+                        help="Comma-separated theme names (default: all)")
+    parser.add_argument('--image', dest='image_path', default=None,
+                        help="Photo to show in every image box (default: none)")
+    parser.add_argument('--caption', dest='caption_path', default=None,
+                        help="Caption file laid out in the caption boxes (default: sample text)")
+    parser.add_argument('--note', dest='note_path', default=None,
+                        help="Note file laid out in the note boxes (default: sample text)")
+    parser.add_argument('--dpi', type=int, default=CONTACT_DPI,
+                        help=f"Resolution of the sketched pages (default: {CONTACT_DPI})")
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help="Processes sketching layouts in parallel (default: CPU count; 1 = in-process)")
+    return parser.parse_args(argv)
+
+
+# Run Generator
+if __name__ == "__main__":
+    print(f"PrintLayoutDesigner v{VERSION}")
+
+    try:
+        if sys.argv[1:2] == ['merge']:
+            merge_args = parse_merge_args(sys.argv[2:])
+            result = merge_manifests(merge_args.output_dir, page_size=merge_args.page_size)
+        elif sys.argv[1:2] == ['mailmerge']:
+            merge_args = parse_mailmerge_args(sys.argv[2:])
+            result = mail_merge(iter_records(merge_args.records_path), merge_args.base_dir,
+                                merge_args.output_dir or os.path.join(merge_args.base_dir, 'output', 'orders'),
+                                combined=merge_args.combined,
+                                records_dir=os.path.dirname(os.path.abspath(merge_args.records_path)))
+            print(f"Merged {result['records']} orders in {result['seconds']:.2f}s "
+                  f"({result['templates']} templates, {result['texts']} unique texts)")
+            for order_id, error in result['failed']:
+                print(f"  Failed order {order_id}: {error}")
+        elif sys.argv[1:2] == ['contactsheet']:
+            sheet_args = parse_contactsheet_args(sys.argv[2:])
+            result = contact_sheet(
+                sheet_args.base_dir,
+                sheet_args.output_dir or os.path.join(sheet_args.base_dir, 'output', 'contact_sheet'),
+                layout_names=sheet_args.layouts.split(',') if sheet_args.layouts else 'all',
+                theme_names=sheet_args.themes.split(',') if sheet_args.themes else 'all',
+                image_path=sheet_args.image_path,
+                caption=read_text_file(sheet_args.caption_path) or CONTACT_SAMPLE_TEXT,
+                note=read_text_file(sheet_args.note_path) or CONTACT_SAMPLE_TEXT,
+                dpi=sheet_args.dpi, workers=sheet_args.workers)
+            print(f"Sketched {result['cells']} layout x theme combinations in {result['seconds']:.2f}s")
+        else:
+            overrides = vars(parse_args())
+            batch_path = overrides.pop('batch_path')
+            result = run_batch(batch_path, **overrides)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     print("Done!")
+    if result.get('failed'):
+        sys.exit(1)
 
-    # Open all.html in browser (continuous scroll view)
-    webbrowser.open('file://' + os.path.abspath(all_path))
\ No newline at end of file
+    # Open all.html in browser (continuous scroll view); shards have none until merged,
+    # and an archive has to be extracted first
+    if result.get('all_html') and not result.get('archive'):
+        webbrowser.open('file://' + os.path.abspath(result['all_html']))
@@ -1,9 +1,14 @@
 # ABOUTME: Migrates layouts.json to new architecture with individual layout files.
-# ABOUTME: Creates layouts/*.json geometry files and batch.json master file.
+# ABOUTME: Writes only changed layouts/*.json files (atomically) and creates batch.json if missing.
 
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 import os
 import re
+import sys
+
+PARALLEL_MIN_LAYOUTS = 256  # Smaller exports migrate faster in-process than via a worker pool
 
 def extract_border_width(style_obj, key='border'):
     """Extract border width from style object, handling null values."""
@@ -72,27 +77,50 @@ def migrate_layout(layout):
         "notes": layout.get('notes')
     }
 
-def main():
-    # Read current layouts.json
-    with open('layouts.json', 'r') as f:
-        data = json.load(f)
+def layout_json(layout):
+    """Serialized layout file contents (the same bytes on every run)."""
+    return json.dumps(layout, indent=2).encode('utf-8')
+
+
+def file_sha256(path):
+    """SHA-256 of a file's contents, or None if it doesn't exist."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def write_atomic(path, content):
+    """Write bytes to a temporary file beside path, then rename it into place."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
 
-    # Create layouts directory if needed
-    os.makedirs('layouts', exist_ok=True)
 
-    # Migrate each layout to individual file
-    layout_names = []
-    for layout in data['layouts']:
-        migrated = migrate_layout(layout)
-        filename = f"layouts/{migrated['name']}.json"
+def sync_layout(layout, layouts_dir='layouts'):
+    """Migrate one layout and write it only if its file content changed.
 
-        with open(filename, 'w') as f:
-            json.dump(migrated, f, indent=2)
+    Returns (filename, status) where status is 'created', 'updated' or 'unchanged'.
+    """
+    migrated = migrate_layout(layout)
+    filename = os.path.join(layouts_dir, f"{migrated['name']}.json")
+    content = layout_json(migrated)
+    existing = file_sha256(filename)
+    if existing == hashlib.sha256(content).hexdigest():
+        return filename, 'unchanged'
+    write_atomic(filename, content)
+    return filename, 'created' if existing is None else 'updated'
 
-        print(f"Created: {filename}")
-        layout_names.append(migrated['name'])
 
-    # Create batch.json with globals
+def create_batch(data, batch_path='batch.json'):
+    """Create batch.json with the export's globals; returns False if it already exists.
+
+    An existing batch.json (its settings and batch list) is left untouched.
+    """
+    if os.path.exists(batch_path):
+        return False
     batch = {
         "mode": data.get('mode', 'design'),
         "image_path_landscape": data.get('image_path_landscape'),
@@ -101,18 +129,54 @@ def main():
         "personal_note_path": data.get('personal_note_path'),
         "batch": []  # Empty batch list - user will populate
     }
+    write_atomic(batch_path, json.dumps(batch, indent=2).encode('utf-8'))
+    return True
+
+
+def main():
+    export_path = sys.argv[1] if len(sys.argv) > 1 else 'layouts.json'
+
+    # Read legacy layouts export
+    with open(export_path, 'r') as f:
+        data = json.load(f)
+
+    # Create layouts directory if needed
+    os.makedirs('layouts', exist_ok=True)
 
-    with open('batch.json', 'w') as f:
-        json.dump(batch, f, indent=2)
-
-    print(f"\nCreated: batch.json")
-    print(f"\nMigrated {len(layout_names)} layouts to layouts/")
-    print("\nTo use a layout, add entries to batch.json like:")
-    print(json.dumps({
-        "layout": layout_names[0],
-        "front_theme": "theme_name_light",
-        "back_theme": "theme_name_light"
-    }, indent=2))
+    # A name exported twice would race between workers; the last definition wins, as before
+    layouts = list({sanitize_filename(layout['file']): layout for layout in data['layouts']}.values())
+    if len(layouts) < len(data['layouts']):
+        print(f"Warning: {len(data['layouts']) - len(layouts)} duplicate layout names; using the last of each")
+
+    # Migrate each layout to individual file, writing only those whose content changed
+    if len(layouts) >= PARALLEL_MIN_LAYOUTS:
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(sync_layout, layouts, chunksize=max(1, len(layouts) // (workers * 4))))
+    else:
+        results = [sync_layout(layout) for layout in layouts]
+
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for filename, status in results:
+        counts[status] += 1
+        if status != 'unchanged':
+            print(f"{status.capitalize()}: {filename}")
+    layout_names = [os.path.splitext(os.path.basename(filename))[0] for filename, _ in results]
+
+    if create_batch(data):
+        print("\nCreated: batch.json")
+    else:
+        print("\nKept existing batch.json")
+
+    print(f"\nMigrated {len(layout_names)} layouts to layouts/ "
+          f"({counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged)")
+    if layout_names:
+        print("\nTo use a layout, add entries to batch.json like:")
+        print(json.dumps({
+            "layout": layout_names[0],
+            "front_theme": "theme_name_light",
+            "back_theme": "theme_name_light"
+        }, indent=2))
 
 if __name__ == '__main__':
     main()
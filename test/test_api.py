@@ -1,9 +1,17 @@
 # ABOUTME: Test script for the PrintLayoutDesigner API functions.
-# ABOUTME: Exercises list_layouts, list_themes, get_layout_spec, and get_html_template.
+# ABOUTME: Exercises discovery, layout specs, get_html_template, mail_merge, contact sheets, iter_render, archives and metrics.
 
 import sys
 import os
 import json
+import re
+import contextlib
+import io
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,7 +20,25 @@ from PrintLayoutDesigner import (
     list_layouts,
     list_themes,
     get_layout_spec,
+    get_layout_specs,
     get_html_template,
+    mail_merge,
+    contact_sheet,
+    run_batch,
+    entry_shard,
+    merge_manifests,
+    iter_render,
+    build_web_images,
+    MemoryMonitor,
+    load_cover_image,
+    encode_print_pages,
+    load_layout,
+    load_theme,
+    MemoryBudgetExceeded,
+    get_metrics,
+    reset_metrics,
+    format_prometheus,
+    METRICS,
 )
 
 
@@ -58,6 +84,38 @@ def test_layout_spec(base_dir, layout_name, front_theme, back_theme):
     return spec
 
 
+def test_layout_specs(base_dir, layouts, themes):
+    """Benchmark get_layout_specs against the equivalent loop of get_layout_spec calls."""
+    print("\n" + "=" * 60)
+    print("Testing get_layout_specs()")
+    print("=" * 60)
+
+    layout_names = [layout['name'] for layout in layouts]
+    theme_names = [theme['name'] for theme in themes]
+    start = time.perf_counter()
+    single = {(layout, front, back): get_layout_spec(layout, front, back, base_dir)
+              for layout in layout_names for front in theme_names for back in theme_names}
+    single_s = time.perf_counter() - start
+    start = time.perf_counter()
+    bulk = get_layout_specs(base_dir)
+    bulk_s = time.perf_counter() - start
+    print(f"  {len(bulk)} specs: single calls {single_s * 1000:.0f}ms, bulk {bulk_s * 1000:.0f}ms "
+          f"({single_s / bulk_s:.1f}x)")
+
+    subset = get_layout_specs(base_dir, layout_names[:2], theme_names[:1], 'all')
+    checks = [
+        ("every combination returned", len(bulk) == len(layout_names) * len(theme_names) ** 2),
+        ("bulk specs match single calls", bulk == single),
+        ("lists select a subset", list(subset) == [(layout, theme_names[0], back)
+                                                   for layout in layout_names[:2] for back in theme_names]),
+        ("bulk at least 3x faster", bulk_s * 3 < single_s),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return bulk
+
+
 def test_html_template(base_dir, layout_name, front_theme, back_theme, output_dir):
     """Test get_html_template function."""
     print("\n" + "=" * 60)
@@ -89,6 +147,523 @@ def test_html_template(base_dir, layout_name, front_theme, back_theme, output_di
     return template
 
 
+def test_mail_merge(base_dir, layout_name, front_theme, back_theme, output_dir):
+    """Test mail_merge: per-order files, combined document, shared template and texts."""
+    print("\n" + "=" * 60)
+    print("Testing mail_merge()")
+    print("=" * 60)
+
+    records = [{'id': f'order-{i}', 'layout': layout_name, 'front_theme': front_theme,
+                'back_theme': back_theme, 'image': f'photo {i}.jpg',
+                'caption': f'Caption **{i % 2}**', 'note': 'Same note'} for i in range(4)]
+    bad = {'id': 'bad', 'layout': 'no-such-layout', 'front_theme': front_theme, 'back_theme': back_theme}
+
+    merge_dir = os.path.join(output_dir, 'mailmerge')
+    result = mail_merge(records, base_dir, merge_dir)
+    injected = 'x"><script>alert(1)</script>'
+    hostile = dict(records[0], id='hostile-font', font=injected)
+    bad_result = mail_merge(records[:1] + [bad, hostile], base_dir, merge_dir)
+    combined = mail_merge(records + [hostile], base_dir, merge_dir, combined=True)
+    with open(os.path.join(merge_dir, 'order-1.html')) as f:
+        order_html = f.read()
+    with open(os.path.join(merge_dir, 'hostile-font.html')) as f:
+        hostile_html = f.read()
+
+    # Editing a theme between calls must reach the next call's output
+    edit_dir = os.path.dirname(write_test_batch(os.path.join(output_dir, 'mailmerge_edit')))
+    theme_path = os.path.join(edit_dir, 'themes', 'simple_light.json')
+    edit_record = {'id': 'edit', 'layout': 'T01_Align_Left_Top', 'front_theme': 'simple_light',
+                   'back_theme': 'simple_light', 'caption': 'Caption', 'note': 'Note'}
+    mail_merge([edit_record], edit_dir, os.path.join(edit_dir, 'orders'))
+    with open(theme_path) as f:
+        theme = json.load(f)
+    theme['colors']['background'] = '#123456'
+    with open(theme_path, 'w') as f:
+        json.dump(theme, f)
+    stat = os.stat(theme_path)
+    os.utime(theme_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    edited = mail_merge([edit_record], edit_dir, os.path.join(edit_dir, 'orders'))
+    with open(edited['written'][0]) as f:
+        edited_html = f.read()
+    with open(combined['written'][0]) as f:
+        combined_html = f.read()
+
+    checks = [
+        ("one file per good order", len(result['written']) == 4),
+        ("bad record reported, not raised", [order_id for order_id, _ in bad_result['failed']] == ['bad']),
+        ("template compiled once", result['templates'] == 1),
+        ("each unique text rendered once", result['texts'] == 3),
+        ("edited theme recompiled", edited['templates'] == 1 and '#123456' in edited_html),
+        ("caches reused by later calls", combined['templates'] == 0 and combined['texts'] == 0),
+        ("placeholders filled", '{{' not in order_html and '<strong>1</strong>' in order_html),
+        ("combined document has every order", combined_html.count('<section class="order') == 5),
+        ("record font escaped everywhere", injected not in hostile_html and injected not in combined_html
+         and '<script>' not in hostile_html + combined_html),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return result
+
+
+def test_contact_sheet(base_dir, layouts, themes, output_dir):
+    """Test contact_sheet: one sheet cell per layout x theme, mirrored in the HTML grid."""
+    print("\n" + "=" * 60)
+    print("Testing contact_sheet()")
+    print("=" * 60)
+
+    from PIL import Image
+    layout_names = [layout['name'] for layout in layouts[:3]]
+    theme_names = [theme['name'] for theme in themes[:4]]
+    result = contact_sheet(base_dir, os.path.join(output_dir, 'contact_sheet'), layout_names, theme_names,
+                           workers=1, rows_per_sheet=2)
+    with open(result['html'], encoding='utf-8') as f:
+        html = f.read()
+    with Image.open(result['sheets'][0]) as sheet:
+        sheet_w = sheet.width
+    print(f"  {result['cells']} cells in {result['seconds']:.2f}s")
+
+    empty_rejected = []
+    for names in (([], theme_names), (layout_names, [])):
+        try:
+            contact_sheet(base_dir, os.path.join(output_dir, 'contact_sheet_empty'), *names, workers=1)
+        except ValueError as e:
+            empty_rejected.append('No ' in str(e))
+
+    checks = [
+        ("one cell per combination", result['cells'] == 12 and html.count('class="cell"') == 12),
+        ("rows split across sheets", len(result['sheets']) == 2 and 'url(contact_002.png)' in html),
+        ("empty layout or theme list rejected", empty_rejected == [True, True]),
+        ("one column per theme", sheet_w > 4 * 2 * max(layout['paper_size']['width'] for layout in layouts[:3]) * 20),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return result
+
+
+def write_test_batch(work_dir):
+    """Write a two-entry preview batch using the test layouts and themes; returns its path."""
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    for sub in ('layouts', 'themes'):
+        shutil.copytree(os.path.join(test_dir, sub), os.path.join(work_dir, sub))
+    batch_path = os.path.join(work_dir, 'batch.json')
+    with open(batch_path, 'w') as f:
+        json.dump({'preview': True, 'text_path': os.path.join(test_dir, 'assets', 'caption.md'), 'batch': [
+            {'layout': 'T01_Align_Left_Top.json', 'front_theme': 'simple_light.json', 'back_theme': 'simple_light.json'},
+            {'layout': 'T02_Align_Center_Middle.json', 'front_theme': 'Christmas_light.json',
+             'back_theme': 'simple_light.json'}]}, f)
+    return batch_path
+
+
+def test_iter_render(output_dir):
+    """Test iter_render: results as entries finish, early stop, and the summary return value."""
+    print("\n" + "=" * 60)
+    print("Testing iter_render()")
+    print("=" * 60)
+
+    batch_path = write_test_batch(os.path.join(output_dir, 'iter_render'))
+    batch_output = os.path.join(os.path.dirname(batch_path), 'output')
+    for first in iter_render(batch_path):
+        break  # Stop after one entry
+    stopped_early = not os.path.exists(os.path.join(batch_output, 'manifest.json'))
+
+    renders, results = iter_render(batch_path, resume=True), []
+    try:
+        while True:
+            results.append(next(renders))
+    except StopIteration as stop:
+        summary = stop.value
+
+    checks = [
+        ("result describes the finished entry", first['status'] == 'ok' and first['index'] == 0
+         and os.path.exists(first['html']) and 'blueprint' in first['stages']),
+        ("stopping early skips manifest and all.html", stopped_early),
+        ("resumed run yields every entry", [r['status'] for r in results] == ['skipped', 'ok']),
+        ("return value is the run_batch summary", summary['skipped'] == 1 and os.path.exists(summary['all_html'])),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return results
+
+
+def read_pdf_pages(pdf_path):
+    """Check a PDF's xref offsets and return (Count from the page tree, MediaBox of each page in order).
+
+    Returns None if any xref entry doesn't point at its object.
+    """
+    with open(pdf_path, 'rb') as f:
+        data = f.read()
+    xref_offset = int(re.search(rb'startxref\n(\d+)\n%%EOF', data).group(1))
+    size = int(re.match(rb'xref\n0 (\d+)\n', data[xref_offset:]).group(1))
+    table = data[xref_offset:].split(b'\n', 2)[2]
+    for obj_id in range(1, size):
+        offset = int(table[obj_id * 20:obj_id * 20 + 10])
+        if not data[offset:].startswith(f'{obj_id} 0 obj'.encode('ascii')):
+            return None
+
+    def obj(obj_id):
+        return re.search(rf'\n{obj_id} 0 obj\n(.*?)\nendobj'.encode('ascii'), data, re.S).group(1)
+
+    pages = obj(2)
+    kids = [int(kid) for kid in re.findall(rb'(\d+) 0 R', re.search(rb'/Kids \[(.*?)\]', pages).group(1))]
+    boxes = [tuple(float(v) for v in re.search(rb'/MediaBox \[([^\]]*)\]', obj(kid)).group(1).split())
+             for kid in kids]
+    return int(re.search(rb'/Count (\d+)', pages).group(1)), boxes
+
+
+def test_pdf_output(output_dir):
+    """Test pdf_output: valid xref offsets, front+back per entry, MediaBox per paper size, resume reuse."""
+    print("\n" + "=" * 60)
+    print("Testing run_batch(pdf_output=True)")
+    print("=" * 60)
+
+    batch_path = write_test_batch(os.path.join(output_dir, 'pdf'))
+    with open(batch_path) as f:
+        batch = json.load(f)
+    batch['batch'][1]['layout'] = '15_ClassicMuseum_Land_11x14.json'
+    with open(batch_path, 'w') as f:
+        json.dump(batch, f)
+
+    result = run_batch(batch_path, pdf_output=True, show_blueprints=False)
+    pages = read_pdf_pages(result['pdf'])
+    with open(result['pdf'], 'rb') as f:
+        first_pdf = f.read()
+
+    # Resuming reuses each skipped entry's saved pages instead of rendering them again
+    resumed = list(iter_render(batch_path, pdf_output=True, show_blueprints=False, resume=True))
+    with open(result['pdf'], 'rb') as f:
+        resumed_pdf = f.read()
+
+    checks = [
+        ("xref offsets point at their objects", pages is not None),
+        ("front and back page per entry", pages is not None and pages[0] == len(pages[1]) == 4),
+        ("MediaBox matches each layout's paper size", pages is not None and pages[1] ==
+         [(0, 0, 612, 792)] * 2 + [(0, 0, 792, 1008)] * 2),
+        ("resume reuses saved pages", [r['status'] for r in resumed] == ['skipped'] * 2
+         and not any('pdf' in r['stages'] for r in resumed)),
+        ("resumed all.pdf matches the original", resumed_pdf == first_pdf),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return result
+
+
+def test_sharding(output_dir):
+    """Test --shard and merge: stable assignment, shards partition the batch, mixed-N manifests rejected."""
+    print("\n" + "=" * 60)
+    print("Testing run_batch(shard=...) and merge_manifests()")
+    print("=" * 60)
+
+    batch_path = write_test_batch(os.path.join(output_dir, 'shard'))
+    batch_output = os.path.join(os.path.dirname(batch_path), 'output')
+    with open(batch_path) as f:
+        batch = json.load(f)
+    batch['batch'] += [{'layout': layout, 'front_theme': 'simple_light.json', 'back_theme': 'simple_light.json'}
+                       for layout in ('T03_Align_Right_Bottom.json', 'T04_Align_Justify_Top.json', 'T05_Font_Small.json')]
+    with open(batch_path, 'w') as f:
+        json.dump(batch, f)
+    entries = batch['batch']
+
+    # Assignment depends on the entry alone, not its position, the batch or the run
+    stable = all(entry_shard(entry, 3) == entry_shard(dict(reversed(list(entry.items()))), 3)
+                 for entry in entries)
+    stable = stable and [entry_shard(e, 3) for e in entries] == [entry_shard(e, 3) for e in entries[::-1]][::-1]
+
+    indices = []
+    for i in (1, 2, 3):
+        run_batch(batch_path, shard=f'{i}/3', show_blueprints=False)
+        with open(os.path.join(batch_output, f'manifest-{i}-of-3.json')) as f:
+            indices.append([entry['index'] for entry in json.load(f)['entries']])
+    flat = sorted(index for shard in indices for index in shard)
+    merged = merge_manifests(batch_output)
+
+    # A manifest from a 2-way split of the same batch can't be merged with the 3-way one
+    run_batch(batch_path, shard='1/2', show_blueprints=False)
+    try:
+        merge_manifests(batch_output)
+        mixed_rejected = False
+    except ValueError as e:
+        mixed_rejected = 'different sharding runs' in str(e)
+
+    checks = [
+        ("entry_shard is stable regardless of key or batch order", stable),
+        ("shards partition the batch", flat == list(range(len(entries)))
+         and indices == [[n for n, e in enumerate(entries) if entry_shard(e, 3) == i] for i in (1, 2, 3)]),
+        ("merge combines every entry with no missing shards",
+         merged['entries'] == len(entries) and merged['missing_shards'] == []),
+        ("merge rejects manifests with different shard counts", mixed_rejected),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return merged
+
+
+def test_null_gutter(output_dir):
+    """Test a double_col layout with "gutter": null renders with the default gutter everywhere."""
+    print("\n" + "=" * 60)
+    print("Testing a null double_col gutter")
+    print("=" * 60)
+
+    batch_path = write_test_batch(os.path.join(output_dir, 'gutter'))
+    batch_dir = os.path.dirname(batch_path)
+    layout_path = os.path.join(batch_dir, 'layouts', 'T08_DoubleCol_Center.json')
+    with open(layout_path) as f:
+        layout = json.load(f)
+    layout['front']['gutter'] = None
+    with open(layout_path, 'w') as f:
+        json.dump(layout, f)
+    with open(batch_path) as f:
+        batch = json.load(f)
+    batch['batch'] = [{'layout': 'T08_DoubleCol_Center.json', 'front_theme': 'simple_light.json',
+                       'back_theme': 'simple_light.json'}]
+    with open(batch_path, 'w') as f:
+        json.dump(batch, f)
+
+    template = get_html_template('T08_DoubleCol_Center', 'simple_light', 'simple_light', batch_dir)
+    result = run_batch(batch_path, show_blueprints=True)
+    rendered = len(result['html_files']) == 1 and not result['failed']
+    html = ''
+    if rendered:
+        with open(result['html_files'][0]) as f:
+            html = f.read()
+
+    checks = [
+        ("template uses the default column gap", 'column-gap: 0.25in' in template and 'Nonein' not in template),
+        ("entry renders blueprint and HTML", rendered),
+        ("HTML uses the default column gap", 'column-gap: 0.25in' in html),
+        ("spec reports the gutter in use",
+         get_layout_spec('T08_DoubleCol_Center', 'simple_light', 'simple_light', batch_dir)['front']['gutter'] == 0.25),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return template
+
+
+def test_print_pages(output_dir):
+    """Test press pages: cover crop geometry, paper size and DPI tag, and failing on a bad image."""
+    print("\n" + "=" * 60)
+    print("Testing encode_print_pages()")
+    print("=" * 60)
+
+    import numpy as np
+    from PIL import Image
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    work_dir = os.path.join(output_dir, 'print_pages')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # 400x200 source: red | green | blue bands; a square cover crop keeps only the green middle
+    bands = np.zeros((200, 400, 3), dtype=np.uint8)
+    bands[:, :100, 0] = bands[:, 100:300, 1] = bands[:, 300:, 2] = 255
+    source_path = os.path.join(work_dir, 'bands.png')
+    Image.fromarray(bands).save(source_path)
+    crop = load_cover_image(source_path, 100, 100)
+
+    layout = load_layout(os.path.join(test_dir, 'layouts', 'T01_Align_Left_Top.json'))
+    theme = load_theme(os.path.join(test_dir, 'themes', 'simple_light.json'))
+    dpi = 30
+    pages = encode_print_pages(layout, theme, theme, source_path, 'Caption', 'Note', 'entry', dpi=dpi)
+    page_info = []
+    for filename, data in pages:
+        with Image.open(io.BytesIO(data)) as im:
+            page_info.append((filename, im.format, im.size, im.info.get('dpi')))
+    paper_px = (round(layout['paper_size']['width'] * dpi), round(layout['paper_size']['height'] * dpi))
+
+    corrupt_path = os.path.join(work_dir, 'corrupt.tif')
+    with open(corrupt_path, 'wb') as f:
+        f.write(b'II*\x00' + b'\x00' * 64)
+    try:
+        encode_print_pages(layout, theme, theme, corrupt_path, 'Caption', 'Note', 'entry', dpi=dpi)
+        corrupt_raised = False
+    except Exception:
+        corrupt_raised = True
+
+    checks = [
+        ("cover crop keeps the centre of the source", crop.shape == (100, 100, 3)
+         and (crop[:, :, 1] >= 240).all() and (crop[:, :, [0, 2]] <= 15).all()),  # Lanczos edge bleed
+        ("front and back TIFFs at paper size", [(name, fmt, size) for name, fmt, size, _ in page_info]
+         == [('entry_front.tif', 'TIFF', paper_px), ('entry_back.tif', 'TIFF', paper_px)]),
+        ("DPI tag written", all(info_dpi == (dpi, dpi) for *_, info_dpi in page_info)),
+        ("undecodable image fails the page", corrupt_raised),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return pages
+
+
+def test_memory_budget():
+    """Test MemoryMonitor: a stage is refused by estimate, but an overrun after it ran is only flagged."""
+    print("\n" + "=" * 60)
+    print("Testing MemoryMonitor budget")
+    print("=" * 60)
+
+    monitor = MemoryMonitor(limit_mb=1)
+    monitor.begin_entry(0, 'entry')
+    ran = False
+    with monitor.stage('html'):  # No estimate, so it runs and then peaks over 1 MB
+        ran = True
+    try:
+        with monitor.stage('blueprint', estimate_bytes=2**20):
+            refused = False
+    except MemoryBudgetExceeded:
+        refused = True
+    monitor.end_entry('ok')
+    stages = monitor.entries[0]['stages']
+
+    checks = [
+        ("overrun after a stage ran is flagged, not raised", ran and stages['html'].get('over_budget')),
+        ("stage refused when its estimate won't fit", refused and stages['blueprint'].get('skipped')),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return stages
+
+
+def test_web_images(output_dir):
+    """Test build_web_images: EXIF-rotated sources come out upright, decode failures fall back."""
+    print("\n" + "=" * 60)
+    print("Testing build_web_images()")
+    print("=" * 60)
+
+    from PIL import Image
+    work_dir = os.path.join(output_dir, 'web_images')
+    os.makedirs(work_dir, exist_ok=True)
+    rotated_path = os.path.join(work_dir, 'rotated.jpg')
+    sideways = Image.new('RGB', (3000, 1000), (200, 40, 40))
+    exif = sideways.getexif()
+    exif[0x0112] = 6  # Stored landscape, displayed portrait
+    sideways.save(rotated_path, exif=exif)
+    bomb_path = os.path.join(work_dir, 'bomb.png')
+    Image.new('RGB', (2000, 2000)).save(bomb_path)
+
+    web_images = build_web_images({rotated_path: (2, 6)}, work_dir)
+    with Image.open(os.path.join(work_dir, web_images[rotated_path])) as im:
+        upright_size = im.size
+    max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, 1000
+    try:
+        bomb_images = build_web_images({bomb_path: (2, 2)}, work_dir)
+    finally:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+
+    # A streamed batch makes copies per entry; one made for an earlier entry is reused
+    batch_dir = os.path.dirname(write_test_batch(os.path.join(work_dir, 'stream')))
+    sources = []
+    for n, color in enumerate(((40, 120, 200), (40, 200, 120))):
+        sources.append(os.path.join(batch_dir, f'source{n}.jpg'))
+        Image.new('RGB', (1200, 800), color).save(sources[-1])
+    batch_path = os.path.join(batch_dir, 'batch.jsonl')
+    with open(batch_path, 'w') as f:
+        for layout, source in (('T01_Align_Left_Top.json', sources[0]), ('T02_Align_Center_Middle.json', sources[1]),
+                               ('T03_Align_Right_Bottom.json', sources[0])):
+            f.write(json.dumps({'layout': layout, 'front_theme': 'simple_light.json', 'back_theme': 'simple_light.json',
+                                'image_path_landscape': source}) + '\n')
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = run_batch(batch_path, archive='zip', show_blueprints=False)
+    with zipfile.ZipFile(result['archive']) as z:
+        names = z.namelist()
+
+    checks = [
+        ("EXIF orientation applied before resizing", upright_size == (384, 1152)),
+        ("decompression bomb falls back to the original", bomb_images == {}),
+        ("streamed batch makes each copy once", log.getvalue().count('Web image:') == 2),
+        ("streamed batch archives each copy once",
+         len(names) == len(set(names)) and sum(name.startswith('web_images/') for name in names) == 2),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return web_images
+
+
+def test_archive_output(output_dir):
+    """Test run_batch(archive='zip'): deliverables land in one zip, not in output/."""
+    print("\n" + "=" * 60)
+    print("Testing run_batch(archive='zip')")
+    print("=" * 60)
+
+    batch_path = write_test_batch(os.path.join(output_dir, 'archive'))
+    result = run_batch(batch_path, archive='zip')
+    with zipfile.ZipFile(result['archive']) as z:
+        members = {info.filename: info for info in z.infolist()}
+        all_html = z.read('all.html').decode('utf-8')
+    pngs = [info for name, info in members.items() if name.endswith('.png')]
+
+    # A caller's handled exception must not look like a failed run to the archive cleanup
+    try:
+        raise KeyError('caller')
+    except KeyError:
+        in_except = run_batch(batch_path, archive='tar')
+    with tarfile.open(in_except['archive']) as t:
+        tar_names = t.getnames()
+
+    checks = [
+        ("archive has both entries' HTML and blueprints", len(pngs) == 2 and
+         sum(name.endswith('.html') for name in members) == 3),
+        ("PNGs stored, HTML deflated", all(info.compress_type == zipfile.ZIP_STORED for info in pngs) and
+         members['all.html'].compress_type == zipfile.ZIP_DEFLATED),
+        ("all.html built from archived entries", all_html.count('class="layout-section"') == 2),
+        ("archive kept when run inside an except block", 'all.html' in tar_names),
+        ("no loose outputs in output/", not any(name.endswith(('.html', '.png'))
+                                               for name in os.listdir(os.path.dirname(result['archive'])))),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return result
+
+
+def test_metrics():
+    """Test get_metrics after the renders above, plus concurrent updates and Prometheus export."""
+    print("\n" + "=" * 60)
+    print("Testing get_metrics()")
+    print("=" * 60)
+
+    metrics = get_metrics()
+    histograms, caches = metrics['histograms'], metrics['caches']
+    for name in ('layout_load', 'template', 'markdown', 'blueprint_draw', 'blueprint_encode', 'html_write'):
+        if name in histograms:
+            hist = histograms[name]
+            print(f"  {name}: {hist['count']} calls, mean {hist['sum'] / hist['count'] * 1000:.2f}ms")
+    print(f"  validation cache hit ratio: {caches['validation']['hit_ratio']}")
+
+    def record():
+        for _ in range(10000):
+            METRICS.inc('test_calls')
+            METRICS.observe('test_op', 0.002)
+
+    reset_metrics()
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    after = get_metrics()
+    text = format_prometheus(after)
+
+    checks = [
+        ("render stages recorded", all(histograms[name]['count'] > 0 for name in
+                                       ('layout_load', 'theme_load', 'template', 'blueprint_draw', 'html_write'))),
+        ("entry counters recorded", metrics['counters'].get('entries_ok', 0) > 0),
+        ("cache hits and misses reported", caches['validation']['hits'] > 0 and caches['validation']['misses'] > 0),
+        ("no updates lost across threads", after['counters'] == {'test_calls': 40000}
+         and after['histograms']['test_op']['buckets']['0.0025'] == 40000),
+        ("Prometheus export", 'pld_test_calls_total 40000' in text
+         and 'pld_test_op_seconds_bucket{le="+Inf"} 40000' in text and 'pld_cache_hits_total{cache="validation"}' in text),
+    ]
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+
+    return metrics
+
+
 def main():
     """Run all API tests."""
     # Use production directory for testing
@@ -116,7 +691,19 @@ def main():
         back_theme = themes[0]['name']
 
         test_layout_spec(production_dir, layout_name, front_theme, back_theme)
+        test_layout_specs(production_dir, layouts, themes)
         test_html_template(production_dir, layout_name, front_theme, back_theme, output_dir)
+        test_mail_merge(production_dir, layout_name, front_theme, back_theme, output_dir)
+        test_contact_sheet(production_dir, layouts, themes, output_dir)
+    test_iter_render(output_dir)
+    test_web_images(output_dir)
+    test_memory_budget()
+    test_print_pages(output_dir)
+    test_pdf_output(output_dir)
+    test_sharding(output_dir)
+    test_null_gutter(output_dir)
+    test_archive_output(output_dir)
+    test_metrics()
 
     print("\n" + "=" * 60)
     print("API Tests Complete")
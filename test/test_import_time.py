@@ -0,0 +1,87 @@
+# ABOUTME: Import-time benchmark guarding the lightweight API core.
+# ABOUTME: Checks the discovery/spec/template API never imports matplotlib or markdown.
+
+import sys
+import os
+import json
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = os.path.join(ROOT_DIR, 'test')
+
+IMPORT_BUDGET_MS = 150  # Fresh-interpreter import of the API core (full backends take ~400ms)
+RUNS = 5                # Best-of-N to smooth out process startup noise
+
+API_ONLY_SCRIPT = f"""
+import json, time
+start = time.perf_counter()
+import PrintLayoutDesigner as pld
+import_ms = (time.perf_counter() - start) * 1000
+layouts = pld.list_layouts({TEST_DIR!r})
+pld.list_themes({TEST_DIR!r})
+pld.get_layout_spec(layouts[0]['name'], 'simple_light', 'simple_light', {TEST_DIR!r})
+pld.get_html_template(layouts[0]['name'], 'simple_light', 'simple_light', {TEST_DIR!r})
+print(json.dumps({{'import_ms': import_ms, 'backends': pld.backends_loaded()}}))
+"""
+
+BACKENDS_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot, matplotlib.patches, matplotlib.image, numpy, PIL.Image, fontTools.ttLib, markdown
+print(json.dumps({'import_ms': (time.perf_counter() - start) * 1000}))
+"""
+
+
+def run_fresh(script):
+    """Run script in a fresh interpreter and return its JSON result."""
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def best_import_ms(script):
+    """Return (best import time in ms, last result) over RUNS fresh interpreters."""
+    results = [run_fresh(script) for _ in range(RUNS)]
+    return min(r['import_ms'] for r in results), results[-1]
+
+
+def test_api_does_not_load_backends():
+    """Discovery, spec and template calls leave rendering backends unloaded."""
+    result = run_fresh(API_ONLY_SCRIPT)
+    assert result['backends'] == [], f"API calls loaded backends: {result['backends']}"
+
+
+def test_api_import_time():
+    """API core imports within budget."""
+    best, _ = best_import_ms(API_ONLY_SCRIPT)
+    assert best < IMPORT_BUDGET_MS, f"import took {best:.0f}ms (budget {IMPORT_BUDGET_MS}ms)"
+
+
+def main():
+    """Print import-time benchmark and run checks."""
+    api_ms, result = best_import_ms(API_ONLY_SCRIPT)
+    backends_ms, _ = best_import_ms(BACKENDS_SCRIPT)
+
+    print("=" * 60)
+    print("Import-time benchmark (best of {} fresh interpreters)".format(RUNS))
+    print("=" * 60)
+    print(f"  API core (import PrintLayoutDesigner): {api_ms:7.1f} ms")
+    print(f"  Rendering backends (loaded lazily):    {backends_ms:7.1f} ms")
+    print(f"  Backends loaded by API calls:          {result['backends'] or 'none'}")
+    print()
+
+    failures = 0
+    for test in (test_api_does_not_load_backends, test_api_import_time):
+        try:
+            test()
+            print(f"  ✓ {test.__doc__}")
+        except AssertionError as e:
+            print(f"  ✗ {test.__doc__} {e}")
+            failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
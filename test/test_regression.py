@@ -0,0 +1,284 @@
+# ABOUTME: Golden-image and HTML snapshot regression suite for blueprint and HTML output.
+# ABOUTME: Also checks banded (tiled) blueprint rendering against a single-pass render. --update regenerates goldens.
+
+import contextlib
+import io
+import sys
+import os
+import re
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PrintLayoutDesigner as pld
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+LAYOUTS_DIR = os.path.join(TEST_DIR, 'layouts')
+THEMES_DIR = os.path.join(TEST_DIR, 'themes')
+ASSETS_DIR = os.path.join(TEST_DIR, 'assets')
+GOLDEN_DIR = os.path.join(TEST_DIR, 'golden')
+OUTPUT_DIR = os.path.join(TEST_DIR, 'output', 'regression')
+
+GOLDEN_DPI = 36          # Low enough to keep goldens small, high enough to catch geometry shifts
+PIXEL_TOLERANCE = 24     # Max per-channel difference before a pixel counts as changed
+MAX_CHANGED_FRACTION = 0.002  # Fraction of changed pixels allowed (font rasterizer drift)
+
+# Fixed (front, back) theme pairs, rotated across layouts so every theme style is covered
+THEME_PAIRS = [
+    ('Christmas_light', 'simple_light'),
+    ('Blue Denim Jeans_dark', 'Christmas_dark'),
+    ('fresh-mint-leaves_light', 'simple-bordered_light'),
+    ('Turbulent-Blue-Water-Splash_dark', 'sandy-beach-with-foamy-waves-and bright sky_light'),
+    ('Antique Christmas_light', 'Modern-concrete-house_dark'),
+]
+
+
+def regression_cases():
+    """Return list of (layout_name, front_theme, back_theme) for every test layout."""
+    names = sorted(os.path.splitext(f)[0] for f in os.listdir(LAYOUTS_DIR) if f.endswith('.json'))
+    return [(name, *THEME_PAIRS[i % len(THEME_PAIRS)]) for i, name in enumerate(names)]
+
+
+def sample_image_paths(work_dir):
+    """Write deterministic landscape/portrait sample images (no photos ship with the repo)."""
+    paths = {}
+    for orientation, (w, h) in (('landscape', (300, 200)), ('portrait', (200, 300))):
+        path = os.path.join(work_dir, f'sample_{orientation}.png')
+        if not os.path.exists(path):
+            y, x = np.mgrid[0:h, 0:w]
+            rgb = np.stack([x * 255 // w, y * 255 // h, (x + y) * 255 // (w + h)], axis=-1)
+            # Write then rename so concurrent cases never read a partial file
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            Image.fromarray(rgb.astype(np.uint8)).save(tmp_path, format='PNG')
+            os.replace(tmp_path, path)
+        paths[orientation] = path
+    return paths
+
+
+def normalize_html(html, work_dir):
+    """Strip machine-specific paths and insignificant whitespace from HTML."""
+    html = html.replace(work_dir + os.sep, '{WORK}/').replace(work_dir, '{WORK}')
+    html = re.sub(r'[ \t]+', ' ', html)
+    return '\n'.join(line.strip() for line in html.splitlines() if line.strip()) + '\n'
+
+
+def compare_images(actual_path, golden_path, diff_path):
+    """Compare two PNGs with a per-pixel tolerance; write a diff image on failure.
+
+    Returns (ok, message).
+    """
+    actual = np.asarray(Image.open(actual_path).convert('RGB'), dtype=np.int16)
+    golden = np.asarray(Image.open(golden_path).convert('RGB'), dtype=np.int16)
+    if actual.shape != golden.shape:
+        return False, f"size {actual.shape[1]}x{actual.shape[0]} != golden {golden.shape[1]}x{golden.shape[0]}"
+
+    changed = (np.abs(actual - golden) > PIXEL_TOLERANCE).any(axis=-1)
+    fraction = changed.mean()
+    if fraction <= MAX_CHANGED_FRACTION:
+        return True, f"{fraction:.4%} pixels changed"
+
+    # Changed pixels in red over a faded grayscale of the golden
+    faded = (golden.mean(axis=-1) * 0.3 + 178).astype(np.uint8)
+    diff = np.stack([faded] * 3, axis=-1)
+    diff[changed] = (255, 0, 0)
+    Image.fromarray(diff).save(diff_path)
+    return False, f"{fraction:.4%} pixels changed (limit {MAX_CHANGED_FRACTION:.4%}), diff: {diff_path}"
+
+
+def run_case(case, update=False):
+    """Render one layout/theme case and compare it against its goldens.
+
+    Returns list of failure messages (empty if everything matched).
+    """
+    warnings.filterwarnings('ignore', message='Glyph .* missing')
+    layout_name, front_name, back_name = case
+    case_name = f"{layout_name}__{front_name}__{back_name}".replace(' ', '_')
+    work_dir = os.path.join(OUTPUT_DIR, 'work')
+    os.makedirs(work_dir, exist_ok=True)
+    images = sample_image_paths(work_dir)
+
+    layout = pld.load_layout(os.path.join(LAYOUTS_DIR, f'{layout_name}.json'))
+    front_theme = pld.load_theme(os.path.join(THEMES_DIR, f'{front_name}.json'))
+    back_theme = pld.load_theme(os.path.join(THEMES_DIR, f'{back_name}.json'))
+    caption_path = os.path.join(ASSETS_DIR, 'caption.md')
+    note_path = os.path.join(ASSETS_DIR, 'personal note.md')
+    with open(caption_path) as f:
+        caption = f.read().strip()
+    with open(note_path) as f:
+        note = f.read().strip()
+
+    # Render outputs
+    blueprint_name = f'{case_name}.png'
+    pld.draw_combined_blueprint(
+        filename=blueprint_name, layout=layout, front_theme=front_theme, back_theme=back_theme,
+        image_path_landscape=images['landscape'], image_path_portrait=images['portrait'],
+        text_path=caption_path, personal_note_path=note_path, output_dir=work_dir, dpi=GOLDEN_DPI)
+    front = layout['front']
+    image_path = images['landscape'] if front['img_dims']['width'] > front['img_dims']['height'] else images['portrait']
+    html_path = pld.generate_html_output(
+        batch_entry=None, layout=layout, front_theme=front_theme, back_theme=back_theme,
+        image_path=image_path, text_content=caption, note_content=note,
+        layout_name=case_name, output_dir=work_dir, blueprint_png=blueprint_name)
+    template = pld.get_html_template(layout_name, front_name, back_name, TEST_DIR)
+
+    with open(html_path, encoding='utf-8') as f:
+        snapshots = {
+            f'{case_name}.html': normalize_html(f.read(), work_dir),
+            f'{case_name}.template.html': normalize_html(template, work_dir),
+        }
+
+    golden_png = os.path.join(GOLDEN_DIR, 'blueprints', blueprint_name)
+    if update:
+        os.makedirs(os.path.dirname(golden_png), exist_ok=True)
+        os.replace(os.path.join(work_dir, blueprint_name), golden_png)
+        for name, text in snapshots.items():
+            os.makedirs(os.path.join(GOLDEN_DIR, 'html'), exist_ok=True)
+            with open(os.path.join(GOLDEN_DIR, 'html', name), 'w', encoding='utf-8') as f:
+                f.write(text)
+        return []
+
+    failures = []
+    if not os.path.exists(golden_png):
+        failures.append(f"{blueprint_name}: no golden (run with --update)")
+    else:
+        ok, message = compare_images(os.path.join(work_dir, blueprint_name), golden_png,
+                                     os.path.join(OUTPUT_DIR, f'{case_name}.diff.png'))
+        if not ok:
+            failures.append(f"{blueprint_name}: {message}")
+
+    for name, text in snapshots.items():
+        golden_html = os.path.join(GOLDEN_DIR, 'html', name)
+        if not os.path.exists(golden_html):
+            failures.append(f"{name}: no snapshot (run with --update)")
+            continue
+        with open(golden_html, encoding='utf-8') as f:
+            expected = f.read()
+        if text != expected:
+            actual_path = os.path.join(OUTPUT_DIR, name)
+            with open(actual_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            failures.append(f"{name}: differs from snapshot, actual: {actual_path}")
+    return failures
+
+
+def run_tiled_case(case, budget_mb=2):
+    """Render a case in bands under a memory budget and compare it with a single-pass render.
+
+    Returns list of failure messages.
+    """
+    layout_name, front_name, back_name = case
+    work_dir = os.path.join(OUTPUT_DIR, 'tiled')
+    os.makedirs(work_dir, exist_ok=True)
+    images = sample_image_paths(work_dir)
+    kwargs = dict(layout=pld.load_layout(os.path.join(LAYOUTS_DIR, f'{layout_name}.json')),
+                  front_theme=pld.load_theme(os.path.join(THEMES_DIR, f'{front_name}.json')),
+                  back_theme=pld.load_theme(os.path.join(THEMES_DIR, f'{back_name}.json')),
+                  image_path_landscape=images['landscape'], image_path_portrait=images['portrait'],
+                  text_path=os.path.join(ASSETS_DIR, 'caption.md'),
+                  personal_note_path=os.path.join(ASSETS_DIR, 'personal note.md'),
+                  output_dir=work_dir, dpi=GOLDEN_DPI, png_mode='rgb')
+    pld.draw_combined_blueprint(filename='full.png', **kwargs)
+    progress = io.StringIO()
+    with contextlib.redirect_stdout(progress):
+        pld.draw_combined_blueprint(filename='tiled.png', memory_budget_mb=budget_mb, **kwargs)
+
+    failures = []
+    ok, message = compare_images(os.path.join(work_dir, 'tiled.png'), os.path.join(work_dir, 'full.png'),
+                                 os.path.join(OUTPUT_DIR, 'tiled.diff.png'))
+    if not ok:
+        failures.append(f"tiled {layout_name}: {message}")
+    with Image.open(os.path.join(work_dir, 'tiled.png')) as im:
+        width, height = im.size
+    band_height = pld.band_height_for_budget(width, budget_mb)
+    bands = re.search(r'(\d+) bands', progress.getvalue())
+    if not bands or int(bands.group(1)) != -(-height // band_height) or int(bands.group(1)) < 2:
+        failures.append(f"tiled {layout_name}: expected {-(-height // band_height)} bands, got "
+                        f"{bands.group(1) if bands else 'an untiled render'}")
+    if band_height > pld.MIN_BAND_HEIGHT and band_height * width * pld.TILE_BYTES_PER_PIXEL > budget_mb * 2**20:
+        failures.append(f"tiled {layout_name}: {band_height}-row bands exceed the {budget_mb} MB budget")
+    return failures
+
+
+def run_streaming_png():
+    """Write random rows through StreamingPngWriter in uneven bands; returns failure messages."""
+    rows = np.random.default_rng(0).integers(0, 256, size=(97, 61, 3), dtype=np.uint8)
+    rows[40:60] = rows[39]  # Flat stretch, where the Up filter yields zeros
+    buffer = io.BytesIO()
+    with pld.StreamingPngWriter(buffer, 61, 97, compress_level=1) as png:
+        for start, stop in ((0, 1), (1, 40), (40, 41), (41, 97)):
+            png.write_rows(rows[start:stop])
+    buffer.seek(0)
+    with Image.open(buffer) as im:
+        decoded = np.asarray(im.convert('RGB'))
+    return [] if np.array_equal(decoded, rows) else ["StreamingPngWriter output doesn't decode to its input rows"]
+
+
+def run_suite(update=False, workers=None):
+    """Run every case in parallel; returns list of failure messages."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    cases = regression_cases()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = pool.map(run_case, cases, [update] * len(cases))
+        return [failure for failures in results for failure in failures]
+
+
+def run_threaded(cases, workers=4):
+    """Run cases concurrently on threads in this process; returns list of failure messages."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [failure for failures in pool.map(run_case, cases) for failure in failures]
+
+
+def test_tiled_rendering():
+    """A blueprint rendered in bands matches a single-pass render; the PNG stream decodes exactly."""
+    failures = run_streaming_png() + run_tiled_case(regression_cases()[0])
+    assert not failures, '\n'.join(failures)
+
+
+def test_regression_suite():
+    """Every layout's blueprint and HTML match the stored goldens."""
+    failures = run_suite()
+    assert not failures, '\n'.join(failures)
+
+
+def test_threaded_rendering():
+    """Blueprints rendered concurrently on threads match goldens, without pyplot."""
+    failures = run_threaded(regression_cases()[:8])
+    assert not failures, '\n'.join(failures)
+    assert 'matplotlib.pyplot' not in sys.modules, "rendering imported pyplot"
+
+
+def main():
+    """Run the regression suite, or regenerate goldens with --update."""
+    import time
+    update = '--update' in sys.argv
+    start = time.perf_counter()
+    failures = run_suite(update=update)
+    if not update:
+        failures += run_threaded(regression_cases()[:8])
+        failures += run_streaming_png() + run_tiled_case(regression_cases()[0])
+        if 'matplotlib.pyplot' in sys.modules:
+            failures.append("threaded rendering imported pyplot")
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 60)
+    if update:
+        print(f"Updated goldens for {len(regression_cases())} cases in {elapsed:.1f}s")
+    elif failures:
+        print(f"{len(failures)} regression failures in {elapsed:.1f}s:")
+        for failure in failures:
+            print(f"  ✗ {failure}")
+        sys.exit(1)
+    else:
+        print(f"All {len(regression_cases())} cases match goldens in {elapsed:.1f}s")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# ABOUTME: Tests schema validation of layout, theme and batch files.
+# ABOUTME: Checks the shipped catalogs are valid, errors are aggregated (with line numbers for .jsonl), and validation is fast.
+
+import sys
+import os
+import glob
+import json
+import shutil
+import tempfile
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PrintLayoutDesigner as pld
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATALOG_DIRS = [os.path.join(ROOT_DIR, 'production'), os.path.join(ROOT_DIR, 'test')]
+
+VALIDATE_BUDGET_MS = 50  # Cold validation of every shipped layout, theme and batch file
+
+
+def catalog_files():
+    """Return list of (kind, path) for every shipped layout, theme and batch file."""
+    files = []
+    for base in CATALOG_DIRS:
+        files += [('layout', p) for p in sorted(glob.glob(os.path.join(base, 'layouts', '*.json')))]
+        files += [('theme', p) for p in sorted(glob.glob(os.path.join(base, 'themes', '*.json')))]
+        files += [('batch', p) for p in glob.glob(os.path.join(base, 'batch.json'))]
+    return files
+
+
+def test_shipped_catalogs_are_valid():
+    """Every shipped layout, theme and batch file matches its schema."""
+    errors = [e for kind, path in catalog_files() for e in pld.validate_file(kind, path)]
+    assert not errors, '\n'.join(errors)
+
+
+def test_errors_are_aggregated():
+    """A broken layout and theme report every problem, with paths, in one ValidationError."""
+    tmp = tempfile.mkdtemp()
+    try:
+        for sub in ('layouts', 'themes'):
+            os.makedirs(os.path.join(tmp, sub))
+        with open(os.path.join(ROOT_DIR, 'test', 'layouts', 'T01_Align_Left_Top.json')) as f:
+            layout = json.load(f)
+        del layout['front']['img_dims']
+        layout['front']['text_style']['align_h'] = 'middle'
+        layout['back']['note_dims']['width'] = '6in'
+        with open(os.path.join(tmp, 'layouts', 'bad.json'), 'w') as f:
+            json.dump(layout, f)
+        with open(os.path.join(ROOT_DIR, 'test', 'themes', 'simple_light.json')) as f:
+            theme = json.load(f)
+        theme['colors']['text'] = 'grey'
+        with open(os.path.join(tmp, 'themes', 'bad.json'), 'w') as f:
+            json.dump(theme, f)
+        batch_path = os.path.join(tmp, 'batch.json')
+        with open(batch_path, 'w') as f:
+            json.dump({'batch': [{'layout': 'bad.json', 'front_theme': 'bad.json', 'back_theme': 'missing.json'}]}, f)
+
+        errors = pld.validate_catalog(batch_path)
+        expected = ['front.img_dims: required field is missing', "front.text_style.align_h: 'middle'",
+                    'back.note_dims.width: expected number', "colors.text: 'grey'", 'missing.json: file not found']
+        for fragment in expected:
+            assert any(fragment in e for e in errors), f"no error mentioning {fragment!r} in {errors}"
+
+        try:
+            pld.run_batch(batch_path)
+        except pld.ValidationError as e:
+            assert len(e.errors) == len(errors)
+        else:
+            raise AssertionError("run_batch rendered a batch with invalid files")
+        assert not os.path.exists(os.path.join(tmp, 'output')), "run_batch wrote output before validating"
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_jsonl_batch_errors_have_line_numbers():
+    """A streamed .jsonl batch reports bad settings and entries by line number."""
+    tmp = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(ROOT_DIR, 'test', 'layouts'), os.path.join(tmp, 'layouts'))
+        shutil.copytree(os.path.join(ROOT_DIR, 'test', 'themes'), os.path.join(tmp, 'themes'))
+        batch_path = os.path.join(tmp, 'batch.jsonl')
+        good = {'layout': 'T01_Align_Left_Top.json', 'front_theme': 'simple_light.json',
+                'back_theme': 'simple_light.json', 'text_path': 'caption.md'}
+        with open(batch_path, 'w') as f:
+            for line in ({'mode': 'draft'}, good, {'layout': 'T01_Align_Left_Top.json'}, dict(good, layout='nope.json')):
+                f.write(json.dumps(line) + '\n')
+
+        errors = pld.validate_catalog(batch_path)
+        expected = [':1: mode:', ':3: front_theme: required field is missing', 'nope.json: file not found']
+        for fragment in expected:
+            assert any(fragment in e for e in errors), f"no error mentioning {fragment!r} in {errors}"
+        assert len(errors) == 4, errors
+        entries = list(pld.iter_batch_entries(batch_path))
+        assert len(entries) == 3 and entries[0]['text_path'] == 'caption.md'
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_validation_is_fast():
+    """Cold validation of all shipped files is within budget; warm validation is cached."""
+    pld.VALIDATION_CACHE.cache_clear()
+    files = catalog_files()
+    start = time.perf_counter()
+    for kind, path in files:
+        pld.validate_file(kind, path)
+    cold_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for kind, path in files:
+        pld.validate_file(kind, path)
+    warm_ms = (time.perf_counter() - start) * 1000
+    print(f"  {len(files)} files: cold {cold_ms:.1f}ms, cached {warm_ms:.1f}ms")
+    assert cold_ms < VALIDATE_BUDGET_MS, f"validation took {cold_ms:.0f}ms (budget {VALIDATE_BUDGET_MS}ms)"
+    assert pld.VALIDATION_CACHE.cache_info().hits >= len(files)
+
+
+def test_validation_cache_is_bounded():
+    """The validation cache keeps at most maxsize results, dropping the least recently used."""
+    cache = pld.ValidationCache(2)
+    contents = [json.dumps({'name': f'theme {n}'}).encode() for n in range(3)]
+    cache.problems('theme', contents[0])
+    cache.problems('theme', contents[1])
+    cache.problems('theme', contents[0])  # contents[1] is now least recent
+    cache.problems('theme', contents[2])
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 2), info
+    cache.problems('theme', contents[0])
+    assert cache.cache_info().hits == 2
+    cache.problems('theme', contents[1])
+    assert cache.cache_info().misses == 4
+
+
+def main():
+    """Run validation tests."""
+    failures = 0
+    for test in (test_shipped_catalogs_are_valid, test_errors_are_aggregated,
+                 test_jsonl_batch_errors_have_line_numbers, test_validation_is_fast,
+                 test_validation_cache_is_bounded):
+        try:
+            test()
+            print(f"  ✓ {test.__doc__}")
+        except AssertionError as e:
+            print(f"  ✗ {test.__doc__}\n    {e}")
+            failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()